@@ -1,12 +1,12 @@
 # app.py - Updated Version
 
-from datetime import datetime
 import os
 import sys # Ensure sys is imported
 import asyncio # Ensure asyncio is imported
 import logging # Ensure logging is imported
 import re # Ensure re is imported
-import aiohttp # Ensure aiohttp is imported
+import json
+import hmac
 
 # --- Load environment variables ---
 # If using python-dotenv locally, uncomment the next two lines
@@ -18,25 +18,30 @@ load_dotenv()
 if sys.platform == 'win32':
     asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
 
-from flask import Flask, request, jsonify, render_template # <-- Ensure Flask components are imported
-import dmarc_lookup
-<<<<<<< HEAD
+from flask import Flask, request, jsonify, render_template, Response, stream_with_context # <-- Ensure Flask components are imported
 import domain_intel
-import reputation_check
-=======
 import reputation  # Use the consolidated reputation module
 import email_tester
->>>>>>> eea84a0a4ee4c21d4c5b96ced865194cf8fa11fc
-from concurrent.futures import ThreadPoolExecutor
+import pwned_checker
+import jobs
+import metrics
+from cache_snapshot import snapshotter
+from domain_snapshot import DomainSnapshot
+from coalescing import coalesced
+import http_caching
+import request_context
+from async_runtime import runtime, ASYNC_CALL_TIMEOUT
 from error_handling import (
     api_error_handler,
+    error_response_for,
     configure_enhanced_logging,
     handle_dmarc_error,
     handle_spf_error,
     handle_dkim_error,
-    DomainError
+    DomainError,
+    ApiError
 )
-from auth_verification import verify_spf_setup, verify_dkim_setup, verify_dmarc_setup, calculate_overall_auth_status
+from auth_verification import verify_spf_setup, verify_dkim_setup, verify_dmarc_setup, verify_all_setup
 
 logging.getLogger('werkzeug').setLevel(logging.INFO)
 
@@ -51,43 +56,95 @@ app = Flask(__name__,
 # Get HIBP API key from environment variable
 HIBP_API_KEY = os.getenv('HIBP_API_KEY') # <-- Loads the API Key
 
-# Create a new asyncio event loop for asynchronous operations
-loop = asyncio.new_event_loop()
-asyncio.set_event_loop(loop)
+# Bearer token for the admin/metrics routes; they are disabled (404) without it
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN')
 
-# Thread pool executor to handle async operations
-executor = ThreadPoolExecutor(4)
+# Warm the in-memory caches from the last snapshots (CACHE_SNAPSHOT_DIR); with
+# preload_app this runs once in the gunicorn master and the workers inherit the entries
+snapshotter.restore()
+
+# Extra seconds a request thread waits beyond a request's deadline, so the timeout is
+# normally raised (and its tasks cancelled) on the event loop
+DEADLINE_GRACE = 1.0
 
 # Utility Functions
-def run_async(func, *args):
+def run_async(func, *args, timeout=ASYNC_CALL_TIMEOUT, context=None):
     """
     Execute an asynchronous function from a synchronous context.
 
+    The coroutine runs on this worker's background event loop (see async_runtime.py),
+    so concurrent request threads can overlap their async work. It runs as a request
+    (see request_context.py): `timeout` is its deadline, and the tasks it leaves
+    running when it finishes, fails or times out are cancelled.
+
     Args:
         func (coroutine): The asynchronous function to execute.
         *args: Arguments to pass to the async function.
+        timeout (float, optional): Seconds to wait before cancelling the coroutine.
+        context (RequestContext, optional): Request context to run in (created with the
+            same timeout), e.g. to read the max_age it reported afterwards.
 
     Returns:
         The result of the asynchronous function.
     """
+    # The deadline is enforced on the loop; the thread-side wait is only a backstop
+    wait_timeout = None if timeout is None else timeout + DEADLINE_GRACE
     try:
-        # Ensure the current thread has an event loop
-        try:
-            current_loop = asyncio.get_running_loop()
-        except RuntimeError:
-            current_loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(current_loop)
-
-        coroutine = func(*args)
-        # Use the loop associated with the current context if available,
-        # otherwise fall back to the globally set loop
-        active_loop = current_loop if current_loop.is_running() else loop
-        return active_loop.run_until_complete(coroutine)
-
+        return runtime.run(request_context.run(func(*args), timeout, func.__name__, context), timeout=wait_timeout)
     except Exception as e:
-        logging.error(f"Error running async function {func.__name__}: {e}")
+        logging.error(f"Error running async function {func.__name__}: {e!r}")
         raise
 
+def cached_json_response(payload_func, *args, private=False):
+    """
+    Run a coalesced route coroutine and answer with HTTP validators and Cache-Control.
+
+    A conditional request matching the response this worker last sent for the same
+    call is answered 304 without running the coroutine (see http_caching.py).
+
+    Args:
+        payload_func (coroutine function): A @coalesced route coroutine returning (payload, status).
+        *args: Arguments to pass to it.
+        private (bool): Whether the response depends on the client.
+
+    Returns:
+        Response: The JSON response, or an empty 304 response.
+    """
+    key = payload_func.key(*args)
+    if_none_match = request.headers.get("If-None-Match")
+    if_modified_since = request.headers.get("If-Modified-Since")
+    headers = http_caching.not_modified(key, if_none_match, if_modified_since, private)
+    if headers is not None:
+        return Response(status=304, headers=headers)
+
+    context = request_context.RequestContext(ASYNC_CALL_TIMEOUT, payload_func.__name__)
+    data, status_code = run_async(payload_func, *args, context=context)
+    response = jsonify(data)
+    status_code, headers = http_caching.finish(
+        key, response.get_data(), status_code, context.max_age, if_none_match, if_modified_since, private
+    )
+    if status_code == 304:
+        return Response(status=304, headers=headers)
+    response.status_code = status_code
+    response.headers.update(headers)
+    return response
+
+def sse_event(event, data, event_id=None):
+    """
+    Format one Server-Sent Events message.
+
+    Args:
+        event (str): The event name.
+        data (dict): JSON-serializable payload.
+        event_id (str, optional): Event id, sent back by the client as Last-Event-ID
+            when it reconnects.
+
+    Returns:
+        str: The encoded SSE message.
+    """
+    id_line = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{id_line}event: {event}\ndata: {json.dumps(data)}\n\n"
+
 def format_record_data(record_type, data):
     """
     Format record data into a structured response format.
@@ -100,6 +157,15 @@ def format_record_data(record_type, data):
         dict: A formatted dictionary containing the record's title, value, parsed record details,
               and status.
     """
+    # Section that missed the overview deadline (see overview_payload)
+    if data.get("error_code") == "SECTION_TIMEOUT":
+        return {
+            "title": record_type.upper(),
+            "value": data,
+            "status": "timeout",
+            "parsed_record": {}
+        }
+
     if "error" in data:
         return {
             "title": record_type.upper(),
@@ -184,20 +250,19 @@ def is_valid_ip(ip):
     return bool(re.match(ipv4_pattern, ip)) or bool(re.match(ipv6_pattern, ip))
 
 
-# --- API Routes ---
-@app.route("/api/overview", methods=["GET"])
-@api_error_handler
-def overview():
+def validate_domain(domain):
     """
-    Fetch and format an overview of DNS records for a given domain.
+    Check that a domain parameter is present and well formed.
 
-    Query Parameters:
-        domain (str): The domain name to fetch records for.
+    Args:
+        domain (str): The domain from the request.
 
     Returns:
-        JSON: A collection of formatted DNS records (dmarc, spf, dkim, dns, reputation).
+        str: The domain, unchanged.
+
+    Raises:
+        DomainError: If the domain is missing or invalid.
     """
-    domain = request.args.get("domain")
     if not domain:
         raise DomainError(
             "Domain parameter is required",
@@ -205,7 +270,6 @@ def overview():
             ["Please provide a domain name to check."]
         )
 
-    # Validate domain format
     if not is_valid_domain(domain):
         raise DomainError(
             f"Invalid domain format: {domain}",
@@ -215,94 +279,252 @@ def overview():
                 "Domain should not include protocols or paths (no http://, www., etc.)."
             ]
         )
+    return domain
 
-    # Fetch all types of DNS records asynchronously
-    # Using run_async to ensure they run within the Flask context correctly
-    dmarc_data = run_async(dmarc_lookup.get_dmarc_record, domain)
-    spf_data = run_async(dmarc_lookup.get_spf_record, domain)
-    dkim_data = run_async(dmarc_lookup.get_all_dkim_records, domain) # Use default selectors
-    dns_data = run_async(dmarc_lookup.get_all_dns_records, domain)
-    reputation_data = run_async(reputation.check_domain_reputation, domain)
-
-    # Aggregate all records into a response
-    overview_data = {
-        "records": [
-            format_record_data("dmarc", dmarc_data),
-            format_record_data("spf", spf_data),
-            format_record_data("dkim", dkim_data),
-            format_record_data("dns", dns_data),
-            format_record_data("reputation", reputation_data),
-        ]
-    }
-
-    return jsonify(overview_data)
-
-@app.route("/api/<record_type>", methods=["GET"])
-@api_error_handler
-def get_record(record_type):
+def resolve_client_ip(ip_param, forwarded_for, remote_addr):
     """
-    Retrieve data for a specific DNS record type.
-
-    URL Parameters:
-        record_type (str): The type of DNS record to fetch (e.g., dmarc, spf, dkim, dns, reputation).
+    Pick the IP address an /api/ip-info request is about and validate it.
 
-    Query Parameters:
-        domain (str): The domain name to fetch records for.
-        selectors (str, optional): A comma-separated list of selectors for DKIM.
+    Args:
+        ip_param (str): The `ip` query parameter, if any.
+        forwarded_for (str): The X-Forwarded-For header, if any.
+        remote_addr (str): The peer address of the connection.
 
     Returns:
-        JSON: The record data for the specified record type.
+        str or None: The IP address to look up, or None if it could not be determined.
+
+    Raises:
+        DomainError: If the IP address is malformed.
     """
-    # Retrieve and validate parameters
-    domain = request.args.get("domain")
-    raw_selectors = request.args.get("selectors", "")
+    ip_address = ip_param
 
-    if not domain:
-        raise DomainError(
-            "Domain parameter is required",
-            "MISSING_DOMAIN",
-            ["Please provide a domain name to check."]
-        )
+    # Get the client's IP address if no IP was provided
+    if not ip_address:
+        # Try to get real IP even when behind a proxy
+        ip_address = forwarded_for or remote_addr
+        # If we have multiple IPs in X-Forwarded-For, take the first one
+        if ip_address and ',' in ip_address:
+            ip_address = ip_address.split(',')[0].strip()
 
-    # Validate domain format
-    if not is_valid_domain(domain):
+        # Fallback to remote_addr if still empty
+        if not ip_address:
+            ip_address = remote_addr
+
+    # Validate IP format if an address was found or obtained
+    if ip_address and not is_valid_ip(ip_address):
         raise DomainError(
-            f"Invalid domain format: {domain}",
-            "INVALID_DOMAIN_FORMAT",
+            f"Invalid IP address format: {ip_address}",
+            "INVALID_IP_FORMAT",
             [
-                "Domain should be in a valid format (e.g., example.com).",
-                "Domain should not include protocols or paths (no http://, www., etc.)."
+                "IP address should be in a valid IPv4 or IPv6 format.",
+                "IPv4 example: 192.168.1.1",
+                "IPv6 example: 2001:0db8:85a3:0000:0000:8a2e:0370:7334"
             ]
         )
+    return ip_address or None
+
+
+# --- Route logic shared with the async server (asgi.py) ---
+# Each coroutine returns (payload, status_code). The Flask routes below run them on the
+# worker's background loop via run_async; asgi.py awaits them directly.
+# The endpoint-level ones are @coalesced (see coalescing.py): identical concurrent
+# requests in a worker share one computation and its result for a few seconds.
+
+VALID_RECORD_TYPES = ["dmarc", "spf", "dkim", "dns", "reputation"]
+
+# Overall deadline for /api/overview. Reputation checks give up on their own after 45 s,
+# so by default a slow reputation check still returns its partial result.
+OVERVIEW_DEADLINE = float(os.getenv("OVERVIEW_DEADLINE", "50"))
+
+def overview_checks(snapshot):
+    """
+    The independent checks that make up a domain overview, in display order.
+
+    Args:
+        snapshot (DomainSnapshot): The request's record snapshot for the domain.
+
+    Returns:
+        dict: Section name -> coroutine producing that section's data.
+    """
+    return {
+        "dmarc": snapshot.dmarc(),
+        "spf": snapshot.spf(),
+        "dkim": snapshot.dkim(), # Use default selectors
+        "dns": snapshot.dns(),
+        "reputation": snapshot.reputation(),
+    }
+
+def section_result(record_type, task, deadline):
+    """
+    Turn a finished (or abandoned) overview task into record data for format_record_data.
+
+    Args:
+        record_type (str): The overview section.
+        task (asyncio.Task): The section's task.
+        deadline (float): The overview deadline in seconds, for the timeout message.
+
+    Returns:
+        dict: The section data, or an error/timeout record.
+    """
+    if not task.done() or task.cancelled():
+        logging.warning(f"Overview section '{record_type}' missed the {deadline:g}s deadline")
+        return {
+            "error": f"The {record_type.upper()} check did not finish within {deadline:g} seconds.",
+            "error_code": "SECTION_TIMEOUT",
+            "suggestions": [
+                "Check this record on its own, or try again in a few moments.",
+                "The domain's DNS servers or external services may be responding slowly."
+            ]
+        }
+    if task.exception() is not None:
+        e = task.exception()
+        logging.error(f"Overview section '{record_type}' failed: {e!r}")
+        return {"error": f"An error occurred fetching {record_type} record: {str(e)}"}
+    return task.result()
+
+async def overview_events(domain, deadline=None, snapshot=None):
+    """
+    Run the overview checks concurrently and yield each section as soon as it finishes.
+
+    All sections share one overall deadline; sections still running at the deadline are
+    cancelled and reported as `timeout` records.
+
+    Args:
+        domain (str): A validated domain name.
+        deadline (float, optional): Seconds to wait for all sections. Defaults to OVERVIEW_DEADLINE.
+        snapshot (DomainSnapshot, optional): Record snapshot to read from. A new one is used
+            (and its unfinished lookups cancelled at the end) if not given.
+
+    Yields:
+        tuple: ("record", {"index", "record"}) for every section in completion order, then
+               ("summary", {"records": [...]}) with all records in display order.
+    """
+    deadline = OVERVIEW_DEADLINE if deadline is None else deadline
+    owns_snapshot = snapshot is None
+    snapshot = DomainSnapshot(domain) if owns_snapshot else snapshot
+    tasks = {
+        record_type: request_context.create_task(check)
+        for record_type, check in overview_checks(snapshot).items()
+    }
+    order = list(tasks)
+    records = {}
+    loop = asyncio.get_running_loop()
+    ends_at = loop.time() + deadline
+
+    try:
+        pending = set(tasks.values())
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, timeout=max(0, ends_at - loop.time()), return_when=asyncio.FIRST_COMPLETED
+            )
+            if not done:
+                break  # Deadline reached
+            for record_type in order:
+                if tasks[record_type] in done:
+                    records[record_type] = format_record_data(
+                        record_type, section_result(record_type, tasks[record_type], deadline)
+                    )
+                    yield "record", {"index": order.index(record_type), "record": records[record_type]}
+    finally:
+        # Also reached when the request itself is cancelled or the client disconnects
+        for task in tasks.values():
+            if not task.done():
+                task.cancel()
+        if owns_snapshot:
+            snapshot.close()
+
+    for record_type in order:
+        if record_type not in records:
+            records[record_type] = format_record_data(
+                record_type, section_result(record_type, tasks[record_type], deadline)
+            )
+            yield "record", {"index": order.index(record_type), "record": records[record_type]}
+
+    yield "summary", {"records": [records[record_type] for record_type in order]}
+
+@coalesced("/api/overview", lambda domain, deadline=None, snapshot=None: None if deadline or snapshot else domain.lower())
+async def overview_payload(domain, deadline=None, snapshot=None):
+    """
+    Fetch and format an overview of DNS records for a domain.
+
+    The sections run concurrently under one overall deadline; sections that miss it
+    are returned as `timeout` records instead of failing the whole response.
+
+    Args:
+        domain (str): A validated domain name.
+        deadline (float, optional): Seconds to wait for all sections. Defaults to OVERVIEW_DEADLINE.
+        snapshot (DomainSnapshot, optional): Record snapshot to read from.
+
+    Returns:
+        tuple: ({"records": [...]}, 200)
+    """
+    events = overview_events(domain, deadline, snapshot)
+    try:
+        async for event, data in events:
+            if event == "summary":
+                return data, 200
+    finally:
+        await events.aclose()
 
-    # Validate record type
-    valid_record_types = ["dmarc", "spf", "dkim", "dns", "reputation"]
-    if record_type not in valid_record_types:
+def parse_record_request(record_type, domain, raw_selectors):
+    """
+    Validate the parameters of a record-specific request.
+
+    Args:
+        record_type (str): The record type from the URL.
+        domain (str): The domain query parameter.
+        raw_selectors (str): Comma-separated DKIM selectors (may be empty).
+
+    Returns:
+        list or None: The DKIM selectors, or None to use the defaults.
+
+    Raises:
+        DomainError: If the domain or record type is invalid.
+    """
+    validate_domain(domain)
+
+    if record_type not in VALID_RECORD_TYPES:
         raise DomainError(
             f"Unsupported record type: {record_type}",
             "INVALID_RECORD_TYPE",
-            [f"Supported record types are: {', '.join(valid_record_types)}"]
+            [f"Supported record types are: {', '.join(VALID_RECORD_TYPES)}"]
         )
 
     # Parse selectors into a list if provided
-    selectors = [sel.strip() for sel in raw_selectors.split(",") if sel.strip()] or None
+    return [sel.strip() for sel in (raw_selectors or "").split(",") if sel.strip()] or None
+
+@coalesced("/api/<record_type>", lambda record_type, domain, selectors, snapshot=None:
+           None if snapshot else (record_type, domain.lower(), tuple(selectors or ())))
+async def record_payload(record_type, domain, selectors, snapshot=None):
+    """
+    Fetch data for a single record type.
 
+    Args:
+        record_type (str): One of VALID_RECORD_TYPES.
+        domain (str): A validated domain name.
+        selectors (list, optional): DKIM selectors to check.
+        snapshot (DomainSnapshot, optional): Record snapshot to read from.
+
+    Returns:
+        tuple: (record data or error response, HTTP status code)
+    """
     # Log the received parameters for debugging
     logging.debug(f"Processing request - Domain: {domain}, Record Type: {record_type}, Selectors: {selectors}")
 
+    snapshot = snapshot or DomainSnapshot(domain)
     data = {}
     try:
         # Fetch the appropriate record type with enhanced error handling
         if record_type == "dmarc":
-            data = run_async(dmarc_lookup.get_dmarc_record, domain)
+            data = await snapshot.dmarc()
             if "error" in data:
-                 return jsonify(handle_dmarc_error(domain, Exception(data["error"]))), 404 # Adjust based on error handling
+                 return handle_dmarc_error(domain, Exception(data["error"])), 404 # Adjust based on error handling
         elif record_type == "spf":
-             data = run_async(dmarc_lookup.get_spf_record, domain)
+             data = await snapshot.spf()
              if "error" in data:
-                 return jsonify(handle_spf_error(domain, Exception(data["error"]))), 404
+                 return handle_spf_error(domain, Exception(data["error"])), 404
         elif record_type == "dkim":
-            data = run_async(dmarc_lookup.get_all_dkim_records, domain, selectors)
+            data = await snapshot.dkim(selectors)
             # Check if all selectors failed if selectors were provided
             if selectors:
                 all_failed = True                # Check if data is a dict before iterating
@@ -329,20 +551,14 @@ def get_record(record_type):
                             ]}
 
         elif record_type == "dns":
-            data = run_async(dmarc_lookup.get_all_dns_records, domain)
+            data = await snapshot.dns()
         elif record_type == "reputation":
-            data = run_async(reputation.check_domain_reputation, domain)
-            # Ensure the data is properly structured for parsing if no error
-            if isinstance(data, dict) and "error" not in data:
-                # Avoid in-place mutation to keep typing/tools happy
-                data = {**data, "parsed_record": dict(data)}
-
+            data, _ = await reputation_payload(domain, snapshot)
 
-        # Return the fetched data as a JSON response
-        return jsonify(data)
+        return data, 200
 
     except Exception as e:
-        # Handle potential errors during async execution or other issues
+        # Handle potential errors during the lookups or other issues
         logging.exception(f"Error processing request for {record_type} on {domain}: {e}")
         # Try to use specific error handlers if possible, otherwise generic
         error_response = {}
@@ -359,92 +575,176 @@ def get_record(record_type):
                  "error_code": "INTERNAL_SERVER_ERROR",
                  "suggestions": ["Please try again later."]
              }
-        return jsonify(error_response), 500
-
+        return error_response, 500
 
-@app.route("/api/reputation", methods=["GET"])
-@api_error_handler
-def check_reputation():
+@coalesced("/api/reputation", lambda domain, snapshot=None: None if snapshot else domain.lower())
+async def reputation_payload(domain, snapshot=None):
     """
     Check the reputation of a domain.
 
-    Query Parameters:
-        domain (str): The domain name to check.
+    Args:
+        domain (str): A validated domain name.
+        snapshot (DomainSnapshot, optional): Record snapshot to read from.
 
     Returns:
-        JSON: Domain reputation information.
+        tuple: (reputation data, 200)
     """
-    domain = request.args.get("domain")
-    if not domain:
-        raise DomainError(
-            "Domain parameter is required",
-            "MISSING_DOMAIN",
-            ["Please provide a domain name to check."]
-        )
-
-    # Validate domain format
-    if not is_valid_domain(domain):
-        raise DomainError(
-            f"Invalid domain format: {domain}",
-            "INVALID_DOMAIN_FORMAT",
-            [
-                "Domain should be in a valid format (e.g., example.com).",
-                "Domain should not include protocols or paths (no http://, www., etc.)."
-            ]
-        )    # Fetch reputation data
-    reputation_data = run_async(reputation.check_domain_reputation, domain)
+    snapshot = snapshot or DomainSnapshot(domain)
+    reputation_data = await snapshot.reputation()
 
     # Add parsed_record to ensure consistency with overview endpoint if no error
     if isinstance(reputation_data, dict) and "error" not in reputation_data:
         # Avoid in-place mutation to keep typing/tools happy
         reputation_data = {**reputation_data, "parsed_record": dict(reputation_data)}
+    return reputation_data, 200
 
-    return jsonify(reputation_data)
+@coalesced("/api/ip-info", lambda ip_address, detail: (ip_address, detail == "full"))
+async def ip_info_payload(ip_address, detail):
+    """
+    Get information about an IP address.
 
-@app.route("/api/ip-info", methods=["GET"])
+    Args:
+        ip_address (str, optional): A validated IP address, or None.
+        detail (str): "full" to include complete VirusTotal/AbuseIPDB payloads.
+
+    Returns:
+        tuple: (IP information, 200)
+    """
+    # Provider payloads are trimmed to the fields we use unless explicitly requested
+    detail = "full" if detail == "full" else "summary"
+    return await reputation.get_complete_ip_info(ip_address, detail), 200
+
+@coalesced("/api/domain-intel", lambda domain: domain.lower())
+async def domain_intel_payload(domain):
+    """
+    Aggregate domain intelligence from the configured providers.
+
+    Args:
+        domain (str): A validated domain name.
+
+    Returns:
+        tuple: (provider results and summary or error response, HTTP status code)
+    """
+    try:
+        return await domain_intel.search_domain_intel(domain), 200
+    except Exception as e:
+        logging.exception(f"Error fetching domain intel for {domain}: {e}")
+        return {
+            "error": f"An error occurred fetching domain intelligence: {str(e)}",
+            "error_code": "DOMAIN_INTEL_ERROR",
+            "suggestions": [
+                "Please try again later",
+                "Ensure any required provider API keys are configured on the server",
+            ],
+        }, 500
+
+
+# --- API Routes ---
+@app.route("/api/overview", methods=["GET"])
 @api_error_handler
-def get_ip_info():
+def overview():
     """
-    Get information about an IP address.
+    Fetch and format an overview of DNS records for a given domain.
 
     Query Parameters:
-        ip (str, optional): The IP address to check. If not provided, returns information about the client's IP.
+        domain (str): The domain name to fetch records for.
 
     Returns:
-        JSON: Information about the IP address.
+        JSON: A collection of formatted DNS records (dmarc, spf, dkim, dns, reputation).
     """
-    # Get the IP address from query parameters
-    ip_address = request.args.get("ip")
+    domain = validate_domain(request.args.get("domain"))
+    return cached_json_response(overview_payload, domain)
 
-    # Get the client's IP address if no IP was provided
-    if not ip_address:
-        # Try to get real IP even when behind a proxy
-        ip_address = request.headers.get('X-Forwarded-For', request.remote_addr)
+@app.route("/api/overview/stream", methods=["GET"])
+@api_error_handler
+def overview_stream():
+    """
+    Stream the overview of a domain as Server-Sent Events.
 
-        # If we have multiple IPs in X-Forwarded-For, take the first one
-        if ip_address and ',' in ip_address:
-            ip_address = ip_address.split(',')[0].strip()
+    Query Parameters:
+        domain (str): The domain name to fetch records for.
 
-        # Fallback to remote_addr if still empty
-        if not ip_address:
-            ip_address = request.remote_addr
+    Returns:
+        An event stream with a `record` event per section as soon as it completes
+        ({"index", "record"}), then a `summary` event with all records
+        (same shape as /api/overview). Errors after the stream has started are
+        sent as a `failure` event with the usual error payload.
+    """
+    domain = validate_domain(request.args.get("domain"))
 
-    # Validate IP format if an address was found or obtained
-    if ip_address and not is_valid_ip(ip_address):
-        raise DomainError(
-            f"Invalid IP address format: {ip_address}",
-            "INVALID_IP_FORMAT",
-            [
-                "IP address should be in a valid IPv4 or IPv6 format.",
-                "IPv4 example: 192.168.1.1",
-                "IPv6 example: 2001:0db8:85a3:0000:0000:8a2e:0370:7334"
-            ]
-        )
+    def generate():
+        try:
+            events = request_context.iterate(overview_events(domain), ASYNC_CALL_TIMEOUT, "overview_stream")
+            for event, data in runtime.iterate(events):
+                yield sse_event(event, data)
+        except Exception as e:
+            error_response, _ = error_response_for(e)
+            yield sse_event("failure", error_response)
 
-    # Get IP information (pass None if we couldn't determine IP)
-    ip_info = run_async(reputation.get_complete_ip_info, ip_address if ip_address else None)
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
-    return jsonify(ip_info)
+@app.route("/api/<record_type>", methods=["GET"])
+@api_error_handler
+def get_record(record_type):
+    """
+    Retrieve data for a specific DNS record type.
+
+    URL Parameters:
+        record_type (str): The type of DNS record to fetch (e.g., dmarc, spf, dkim, dns, reputation).
+
+    Query Parameters:
+        domain (str): The domain name to fetch records for.
+        selectors (str, optional): A comma-separated list of selectors for DKIM.
+
+    Returns:
+        JSON: The record data for the specified record type.
+    """
+    domain = request.args.get("domain")
+    selectors = parse_record_request(record_type, domain, request.args.get("selectors", ""))
+    return cached_json_response(record_payload, record_type, domain, selectors)
+
+
+@app.route("/api/reputation", methods=["GET"])
+@api_error_handler
+def check_reputation():
+    """
+    Check the reputation of a domain.
+
+    Query Parameters:
+        domain (str): The domain name to check.
+
+    Returns:
+        JSON: Domain reputation information.
+    """
+    domain = validate_domain(request.args.get("domain"))
+    return cached_json_response(reputation_payload, domain)
+
+@app.route("/api/ip-info", methods=["GET"])
+@api_error_handler
+def get_ip_info():
+    """
+    Get information about an IP address.
+
+    Query Parameters:
+        ip (str, optional): The IP address to check. If not provided, returns information about the client's IP.
+        detail (str, optional): "full" to include complete VirusTotal/AbuseIPDB payloads.
+
+    Returns:
+        JSON: Information about the IP address.
+    """
+    ip_address = resolve_client_ip(
+        request.args.get("ip"),
+        request.headers.get('X-Forwarded-For'),
+        request.remote_addr
+    )
+    # Without ?ip= the answer is about the caller: shared caches must not keep it
+    return cached_json_response(
+        ip_info_payload, ip_address, request.args.get("detail"), private=not request.args.get("ip")
+    )
 
 
 @app.route("/api/domain-intel", methods=["GET"])
@@ -459,45 +759,9 @@ def get_domain_intel():
     Returns:
         JSON: Provider-by-provider results and a summary of findings.
     """
-    domain = request.args.get("domain")
-    if not domain:
-        raise DomainError(
-            "Domain parameter is required",
-            "MISSING_DOMAIN",
-            ["Please provide a domain name to check."],
-        )
-
-    # Validate domain format
-    if not is_valid_domain(domain):
-        raise DomainError(
-            f"Invalid domain format: {domain}",
-            "INVALID_DOMAIN_FORMAT",
-            [
-                "Domain should be in a valid format (e.g., example.com)",
-                "Domain should not include protocols or paths (no http://, www., etc.)",
-            ],
-        )
-
-    # Run provider queries asynchronously
-    try:
-        intel_data = run_async(domain_intel.search_domain_intel, domain)
-        return jsonify(intel_data)
-    except Exception as e:
-        logging.exception(f"Error fetching domain intel for {domain}: {e}")
-        return (
-            jsonify(
-                {
-                    "error": f"An error occurred fetching domain intelligence: {str(e)}",
-                    "error_code": "DOMAIN_INTEL_ERROR",
-                    "suggestions": [
-                        "Please try again later",
-                        "Ensure any required provider API keys are configured on the server",
-                    ],
-                }
-            ),
-            500,
-        )
-
+    domain = validate_domain(request.args.get("domain"))
+    data, status_code = run_async(domain_intel_payload, domain)
+    return jsonify(data), status_code
 
 @app.route("/api/email-test", methods=["POST"])
 @api_error_handler
@@ -634,16 +898,6 @@ def verify_auth_setup_route(): # Renamed function to avoid conflict
         return jsonify(result)
 
     elif record_type == "all":
-        # Verify all authentication methods
-        result = {
-            "domain": domain,
-            "verification_date": datetime.datetime.now().isoformat(),
-            "records": {}
-        }
-
-        # Run all verification checks
-        result["records"]["spf"] = run_async(verify_spf_setup, domain)
-
         # For DKIM, try common selectors if none explicitly provided
         dkim_selectors = verify_data.get("dkim_selector") or verify_data.get("selectors")
         if not dkim_selectors:
@@ -651,15 +905,8 @@ def verify_auth_setup_route(): # Renamed function to avoid conflict
         elif isinstance(dkim_selectors, str):
              dkim_selectors = [s.strip() for s in dkim_selectors.split(',') if s.strip()]
 
-
-        dkim_results = run_async(verify_dkim_setup, domain, dkim_selectors)
-        result["records"]["dkim"] = dkim_results
-
-        result["records"]["dmarc"] = run_async(verify_dmarc_setup, domain)
-
-        # Calculate overall status based on the verified records
-        result["overall_status"] = calculate_overall_auth_status(result["records"])
-
+        # SPF, DKIM and DMARC are fetched together and verified from the same record set
+        result = run_async(verify_all_setup, domain, dkim_selectors)
         return jsonify(result)
 
     else:
@@ -695,77 +942,289 @@ def check_pwned(): # <-- REMOVE async from here
         logging.error("HIBP API Key is not configured in environment variables.")
         return jsonify({"error": "Service configuration error - API key missing", "error_code": "HIBP_KEY_MISSING"}), 500
 
-    # --- Inner async helper function ---
-    async def _async_check_pwned_helper(email):
-        hibp_api_url = f"https://haveibeenpwned.com/api/v3/breachedaccount/{email}"
-        headers = {
-            "hibp-api-key": HIBP_API_KEY,
-            "User-Agent": "Neozeit-DMARC-Checker/1.0" # HIBP requires a User-Agent, be specific
-        }
-        try:
-            # Use a timeout for the request
-            timeout = aiohttp.ClientTimeout(total=15) # 15 seconds total timeout
-            async with aiohttp.ClientSession(timeout=timeout) as session:
-                async with session.get(hibp_api_url, headers=headers, params={"truncateResponse": "false"}) as response:
-                    if response.status == 200:
-                        breaches = await response.json()
-                        logging.info(f"Breaches found for {email}: {len(breaches)}")
-                        # Return the actual data for jsonify
-                        return {"status": "pwned", "breaches": breaches}
-                    elif response.status == 404:
-                        logging.info(f"No breaches found for {email}")
-                        # Return the actual data for jsonify
-                        return {"status": "not_pwned"}
-                    elif response.status == 401:
-                         logging.error(f"HIBP API Key Unauthorized (401)")
-                         # Return error data and status code separately
-                         return {"error": "API key is invalid or unauthorized.", "error_code": "HIBP_UNAUTHORIZED"}, 401
-                    elif response.status == 403:
-                         logging.error(f"HIBP API Key Forbidden (403) - Check User-Agent: {headers.get('User-Agent')}")
-                         # Return error data and status code separately
-                         return {"error": "Access forbidden - check User-Agent or API key permissions.", "error_code": "HIBP_FORBIDDEN"}, 403
-                    elif response.status == 429:
-                        logging.warning(f"HIBP Rate limit exceeded for {email}")
-                        retry_after = response.headers.get("Retry-After")
-                        wait_time = f" for {retry_after} seconds" if retry_after else ""
-                        # Return error data and status code separately
-                        return {"error": f"Rate limit exceeded. Please try again later{wait_time}.", "error_code": "HIBP_RATE_LIMITED"}, 429
-                    else:
-                        # Attempt to get error message from HIBP response body
-                        try:
-                            error_detail = await response.json()
-                            error_message = error_detail.get("message", "Unknown HIBP API Error")
-                        except Exception:
-                            error_message = await response.text() # Fallback to raw text
-
-                        logging.error(f"HIBP API error ({response.status}): {error_message}")
-                        # Return error data and status code separately
-                        return {"error": f"HIBP API error ({response.status}): {error_message}", "error_code": f"HIBP_API_ERROR_{response.status}"}, response.status
-
-        except asyncio.TimeoutError:
-             logging.error(f"Timeout connecting to HIBP API for {email}")
-             # Return error data and status code separately
-             return {"error": "Request to breach checking service timed out.", "error_code": "HIBP_TIMEOUT"}, 504 # Gateway Timeout
-        except aiohttp.ClientError as e:
-            logging.error(f"Network error connecting to HIBP API: {e}")
-            # Return error data and status code separately
-            return {"error": "Could not connect to the breach checking service.", "error_code": "HIBP_CONNECTION_ERROR"}, 503 # Service Unavailable
-        except Exception as e:
-            logging.exception(f"Unexpected error during HIBP check: {e}")
-            # Return error data and status code separately
-            return {"error": "An unexpected error occurred while checking for breaches.", "error_code": "HIBP_UNEXPECTED_ERROR"}, 500
-    # --- End of inner async helper function ---
-
-    # Call the helper using run_async and handle potential tuple return for errors
-    result_data = run_async(_async_check_pwned_helper, email_to_check)
-
-    # Check if the result is a tuple (data, status_code) indicating an error
-    if isinstance(result_data, tuple) and len(result_data) == 2 and isinstance(result_data[1], int):
-        data, status_code = result_data
-        return jsonify(data), status_code
-    else:
-        # Otherwise, it's a successful result (dict)
-        return jsonify(result_data)
+    # Breach names come from HIBP (truncated response) and are joined with the
+    # locally cached breach catalog; results are cached per salted email hash
+    data, status_code = run_async(pwned_checker.check_email, email_to_check)
+    return jsonify(data), status_code
+
+@app.route("/api/check-pwned/bulk", methods=["POST"])
+@api_error_handler
+def check_pwned_bulk():
+    """
+    Start a bulk breach check for a list of email addresses.
+
+    Request JSON body:
+        emails (list): Email addresses to check. Duplicates are removed.
+
+    Returns:
+        JSON: The job ID and URLs for polling and streaming results (202 Accepted).
+    """
+    if not request.is_json:
+        raise DomainError(
+            "Request must be JSON",
+            "INVALID_REQUEST_FORMAT",
+            ["Please send a properly formatted JSON request."]
+        )
+
+    if not HIBP_API_KEY:
+        logging.error("HIBP API Key is not configured in environment variables.")
+        return jsonify({"error": "Service configuration error - API key missing", "error_code": "HIBP_KEY_MISSING"}), 500
+
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        raise DomainError(
+            "Request body must be a JSON object",
+            "INVALID_REQUEST_FORMAT",
+            ["Send the addresses as {\"emails\": [...]}."]
+        )
+    emails = body.get("emails")
+    if not isinstance(emails, list) or not emails:
+        return jsonify({"error": "A non-empty 'emails' list is required", "error_code": "MISSING_EMAILS"}), 400
+
+    valid, invalid = pwned_checker.normalize_email_list(emails)
+    if len(valid) + len(invalid) > pwned_checker.BULK_MAX_EMAILS:
+        return jsonify({
+            "error": f"Too many email addresses (maximum is {pwned_checker.BULK_MAX_EMAILS})",
+            "error_code": "TOO_MANY_EMAILS"
+        }), 400
+
+    job = pwned_checker.bulk_manager.create_job(valid, invalid)
+    return jsonify({
+        "job_id": job["job_id"],
+        "status": job["status"],
+        "total": job["total"],
+        # Results only carry the index of their address in this list
+        "emails": valid + invalid,
+        "status_url": f"/api/check-pwned/bulk/{job['job_id']}",
+        "stream_url": f"/api/check-pwned/bulk/{job['job_id']}/stream"
+    }), 202
+
+@app.route("/api/check-pwned/bulk/<job_id>", methods=["GET"])
+@api_error_handler
+def check_pwned_bulk_status(job_id):
+    """
+    Get progress and results of a bulk breach check.
+
+    URL Parameters:
+        job_id (str): The job ID returned when the job was created.
+
+    Returns:
+        JSON: Job status, progress counters and the results finished so far.
+    """
+    status = pwned_checker.bulk_manager.job_status(job_id)
+    if status is None:
+        return jsonify({"error": "Bulk job not found", "error_code": "BULK_JOB_NOT_FOUND"}), 404
+    return jsonify(status)
+
+@app.route("/api/check-pwned/bulk/<job_id>/stream", methods=["GET"])
+def check_pwned_bulk_stream(job_id):
+    """
+    Stream the results of a bulk breach check as Server-Sent Events.
+
+    Emits a `result` event per finished address (including ones finished before the
+    stream was opened) and a final `done` event. Each connection stays open for at
+    most HIBP_BULK_STREAM_WINDOW seconds; the client's reconnect (with Last-Event-ID)
+    continues after the last result it received.
+    """
+    if pwned_checker.bulk_manager.load_meta(job_id) is None:
+        return jsonify({"error": "Bulk job not found", "error_code": "BULK_JOB_NOT_FOUND"}), 404
+    offset = pwned_checker.parse_stream_cursor(request.headers.get("Last-Event-ID"))
+
+    def generate():
+        for event, data, event_id in pwned_checker.bulk_manager.iter_events(job_id, offset):
+            yield sse_event(event, data, event_id)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# --- BACKGROUND JOB API ROUTES ---
+# Long-running checks as jobs (see jobs.py): POST returns a job ID at once, the check
+# runs on the worker's background loop and the client polls for the result.
+
+async def reputation_job(params):
+    data, _ = await reputation_payload(params["domain"])
+    return data
+
+async def ip_info_job(params):
+    data, _ = await ip_info_payload(params["ip"], params["detail"])
+    return data
+
+async def email_test_job(params):
+    try:
+        return await email_tester.run_email_test(params)
+    except email_tester.SmtpError as e:
+        raise ApiError(e.message, e.error_code, e.suggestions) from e
+
+jobs.job_queue.register("reputation", reputation_job)
+jobs.job_queue.register("ip-info", ip_info_job)
+jobs.job_queue.register("email-test", email_test_job)
+
+def parse_job_request(job_type, params):
+    """
+    Validate and normalize the parameters of a new job.
+
+    The normalized parameters identify the job: identical pending jobs are deduplicated.
+
+    Args:
+        job_type (str): One of the registered job types.
+        params (dict): The job parameters from the request body.
+
+    Returns:
+        dict: The parameters the job runs with.
+
+    Raises:
+        DomainError: If the job type or a parameter is invalid.
+    """
+    if job_type not in jobs.job_queue.job_types:
+        raise DomainError(
+            f"Invalid job type: {job_type}",
+            "INVALID_JOB_TYPE",
+            [f"Valid job types are: {', '.join(jobs.job_queue.job_types)}"]
+        )
+    if not isinstance(params, dict):
+        raise DomainError(
+            "Job parameters must be a JSON object",
+            "INVALID_JOB_PARAMS",
+            ["Send the check's parameters as an object in 'params'."]
+        )
+
+    if job_type == "reputation":
+        return {"domain": validate_domain(params.get("domain")).lower()}
+
+    if job_type == "ip-info":
+        ip_address = resolve_client_ip(
+            params.get("ip"),
+            request.headers.get('X-Forwarded-For'),
+            request.remote_addr
+        )
+        return {"ip": ip_address, "detail": "full" if params.get("detail") == "full" else "summary"}
+
+    # email-test
+    try:
+        email_tester.validate_test_data(params)
+    except email_tester.ValidationError as e:
+        raise DomainError(e.message, e.error_code, e.suggestions) from e
+    return params
+
+@app.route("/api/jobs", methods=["POST"])
+@api_error_handler
+def create_job():
+    """
+    Start a reputation check, IP lookup or email test as a background job.
+
+    Request JSON body:
+        type (str): "reputation", "ip-info" or "email-test".
+        params (dict): The parameters of the matching endpoint (domain; ip and detail;
+            or the email test body).
+
+    Returns:
+        JSON: The job ID and status URL (202 Accepted). An identical job that is still
+        queued or running is returned instead of starting a new one. 503 if this
+        worker's job queue is full.
+    """
+    if not request.is_json:
+        raise DomainError(
+            "Request must be JSON",
+            "INVALID_REQUEST_FORMAT",
+            ["Please send a properly formatted JSON request."]
+        )
+
+    body = request.get_json()
+    job_type = body.get("type")
+    params = parse_job_request(job_type, body.get("params") or {})
+
+    try:
+        job, created = jobs.job_queue.submit(job_type, params)
+    except jobs.JobQueueFull as e:
+        logging.warning(f"Refusing {job_type} job: {e}")
+        response = jsonify({
+            "error": "The server is busy with other checks",
+            "error_code": "JOB_QUEUE_FULL",
+            "suggestions": ["Please retry in a few seconds."]
+        })
+        response.headers["Retry-After"] = "5"
+        return response, 503
+
+    return jsonify({
+        "job_id": job["job_id"],
+        "type": job["type"],
+        "status": job["status"],
+        "deduplicated": not created,
+        "status_url": f"/api/jobs/{job['job_id']}"
+    }), 202
+
+@app.route("/api/jobs/<job_id>", methods=["GET"])
+@api_error_handler
+def get_job(job_id):
+    """
+    Get the status of a background job and, once it finished, its result.
+
+    URL Parameters:
+        job_id (str): The job ID returned when the job was created.
+
+    Returns:
+        JSON: Job type, status (queued, running, completed or failed), timestamps, and
+        `result` or `error`. 404 once the job's retention period has passed.
+    """
+    job = jobs.job_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found", "error_code": "JOB_NOT_FOUND"}), 404
+    return jsonify(job)
+
+# --- Admin Routes ---
+def _admin_authorized():
+    """
+    Check the request's `Authorization: Bearer <ADMIN_TOKEN>` header.
+
+    Returns:
+        None if authorized, else the error response (404 when ADMIN_TOKEN is not set,
+        so the admin routes don't exist; 401 for a missing or wrong token).
+    """
+    if not ADMIN_TOKEN:
+        return jsonify({"error": "Not found", "error_code": "NOT_FOUND"}), 404
+    supplied = request.headers.get("Authorization", "")
+    if not hmac.compare_digest(supplied.encode(), f"Bearer {ADMIN_TOKEN}".encode()):
+        return jsonify({"error": "Admin token required", "error_code": "UNAUTHORIZED"}), 401
+    return None
+
+@app.route("/api/admin/cache-stats", methods=["GET"])
+@api_error_handler
+def cache_stats():
+    """
+    Cache, coalescing, cancellation and job metrics of the worker serving the request.
+
+    Requires `Authorization: Bearer <ADMIN_TOKEN>`.
+
+    Returns:
+        JSON: See metrics.snapshot(). Per cache: hits, misses, sets, evictions, size
+        and average lookup time, and the same per key prefix with hit rate and
+        average value size.
+    """
+    denied = _admin_authorized()
+    if denied is not None:
+        return denied
+    response = jsonify(metrics.snapshot())
+    response.headers["Cache-Control"] = "no-store"
+    return response
+
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    """The metrics of /api/admin/cache-stats in the Prometheus text format (same token)."""
+    denied = _admin_authorized()
+    if denied is not None:
+        return denied
+    return Response(metrics.prometheus_text(metrics.snapshot()),
+                    mimetype="text/plain; version=0.0.4", headers={"Cache-Control": "no-store"})
+
+@app.before_request
+def resume_bulk_checks():
+    """Make sure this worker runs (or competes to run) the bulk breach-check worker."""
+    if HIBP_API_KEY:
+        pwned_checker.bulk_manager.ensure_started()
+    snapshotter.ensure_started()
 
 # --- HTML Routes ---
 @app.route('/')
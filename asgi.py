@@ -0,0 +1,293 @@
+"""
+ASGI entry point (async serving mode)
+
+The DNS- and API-bound routes (/api/overview, /api/overview/stream, /api/<record_type>,
+/api/reputation, /api/ip-info, /api/domain-intel, /api/check-pwned/bulk/<id>/stream)
+are served by coroutine handlers running directly on the server's event loop, so a slow
+reputation check holds a coroutine rather than a worker thread and a single process can
+keep hundreds of checks in flight. Every other request (HTML pages, static files, POST
+endpoints) falls through to the Flask app via asgiref's WSGI adapter.
+
+Run with:
+    gunicorn asgi:app -c gunicorn_config.py -k uvicorn.workers.UvicornWorker
+or, for local development:
+    uvicorn asgi:app --port 10000
+"""
+import asyncio
+import logging
+import re
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional, Tuple
+from urllib.parse import parse_qs
+
+from asgiref.wsgi import WsgiToAsgi
+
+import app as flask_module
+from async_runtime import ASYNC_CALL_TIMEOUT
+from error_handling import error_response_for
+import http_caching
+import pwned_checker
+import request_context
+from cache_snapshot import snapshotter
+
+flask_app = flask_module.app
+
+
+def _query_params(scope) -> Dict[str, str]:
+    """First value of each query string parameter (like Flask's request.args.get)."""
+    query = parse_qs(scope.get("query_string", b"").decode("latin-1"), keep_blank_values=True)
+    return {name: values[0] for name, values in query.items()}
+
+
+def _header(scope, name: str) -> Optional[str]:
+    wanted = name.lower().encode("latin-1")
+    for key, value in scope.get("headers", []):
+        if key.lower() == wanted:
+            return value.decode("latin-1")
+    return None
+
+
+# --- Native handlers ---
+# Each returns a RouteCall: the route coroutine function producing (payload,
+# status_code), its arguments, and how the response may be cached; or for STREAM_ROUTES
+# an async iterator of (event, data) pairs. Parameter validation runs synchronously
+# first so DomainError is raised before any lookups start.
+
+class RouteCall:
+    """A route coroutine call and its HTTP caching (see http_caching.py)."""
+
+    def __init__(self, func, args: tuple, http_cached: bool = True, private: bool = False):
+        self.func = func
+        self.args = args
+        self.http_cached = http_cached
+        self.private = private
+
+
+def _overview(scope, params, path_arg):
+    return RouteCall(flask_module.overview_payload, (flask_module.validate_domain(params.get("domain")),))
+
+
+def _record(scope, params, record_type):
+    domain = params.get("domain")
+    selectors = flask_module.parse_record_request(record_type, domain, params.get("selectors", ""))
+    return RouteCall(flask_module.record_payload, (record_type, domain, selectors))
+
+
+def _reputation(scope, params, path_arg):
+    return RouteCall(flask_module.reputation_payload, (flask_module.validate_domain(params.get("domain")),))
+
+
+def _ip_info(scope, params, path_arg):
+    client = scope.get("client")
+    ip_address = flask_module.resolve_client_ip(
+        params.get("ip"),
+        _header(scope, "X-Forwarded-For"),
+        client[0] if client else None,
+    )
+    # Without ?ip= the answer is about the caller: shared caches must not keep it
+    return RouteCall(flask_module.ip_info_payload, (ip_address, params.get("detail")), private=not params.get("ip"))
+
+
+def _domain_intel(scope, params, path_arg):
+    return RouteCall(
+        flask_module.domain_intel_payload, (flask_module.validate_domain(params.get("domain")),), http_cached=False
+    )
+
+
+def _overview_stream(scope, params, path_arg):
+    return flask_module.overview_events(flask_module.validate_domain(params.get("domain")))
+
+
+def _bulk_stream(scope, params, job_id):
+    offset = pwned_checker.parse_stream_cursor(_header(scope, "Last-Event-ID"))
+    return pwned_checker.bulk_manager.aiter_events(job_id, offset)
+
+
+Handler = Callable[[dict, Dict[str, str], Optional[str]], RouteCall]
+StreamHandler = Callable[[dict, Dict[str, str], Optional[str]], AsyncIterator[Tuple[str, Any]]]
+
+NATIVE_ROUTES: Dict[str, Handler] = {
+    "/api/overview": _overview,
+    "/api/reputation": _reputation,
+    "/api/ip-info": _ip_info,
+    "/api/domain-intel": _domain_intel,
+}
+
+# Sent as Server-Sent Events
+STREAM_ROUTES: Dict[str, StreamHandler] = {
+    "/api/overview/stream": _overview_stream,
+}
+
+# Bulk breach-check results stream on the event loop instead of a WSGI thread; unknown
+# jobs go to Flask for its 404
+BULK_STREAM_PATH = re.compile(r"/api/check-pwned/bulk/([^/]+)/stream")
+
+# /api/<record_type> is only handled natively for the DNS record types; anything else
+# (check-pwned, unknown types, ...) goes to Flask so its routing and errors apply
+NATIVE_RECORD_TYPES = {"dmarc", "spf", "dkim", "dns"}
+
+
+class AsyncApiApp:
+    """ASGI application: native coroutine handlers with Flask as the fallback."""
+
+    def __init__(self, wsgi_app):
+        self.fallback = WsgiToAsgi(wsgi_app)
+        self.json = wsgi_app.json
+
+    def _route(self, scope) -> Tuple[Optional[Callable], Optional[str], bool]:
+        """Return (handler, path argument, is_stream) for a request, or a None handler."""
+        if scope["method"] != "GET":
+            return None, None, False
+        path = scope["path"]
+        if path in NATIVE_ROUTES:
+            return NATIVE_ROUTES[path], None, False
+        if path in STREAM_ROUTES:
+            return STREAM_ROUTES[path], None, True
+        match = BULK_STREAM_PATH.fullmatch(path)
+        if match and pwned_checker.bulk_manager.load_meta(match.group(1)) is not None:
+            return _bulk_stream, match.group(1), True
+        prefix, _, record_type = path.rpartition("/")
+        if prefix == "/api" and record_type in NATIVE_RECORD_TYPES:
+            return _record, record_type, False
+        return None, None, False
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+
+        handler, path_arg, is_stream = self._route(scope) if scope["type"] == "http" else (None, None, False)
+        if handler is None:
+            await self.fallback(scope, receive, send)
+            return
+
+        await self._until_disconnect(receive, self._respond(scope, send, handler, path_arg, is_stream))
+
+    async def _respond(self, scope, send, handler, path_arg, is_stream: bool) -> None:
+        # One request scope: the handler's timeouts are bounded by ASYNC_CALL_TIMEOUT and
+        # whatever it leaves running is cancelled when the response ends or is abandoned
+        async with request_context.scope(ASYNC_CALL_TIMEOUT, scope["path"]) as context:
+            call, key = None, None
+            try:
+                if is_stream:
+                    events = handler(scope, _query_params(scope), path_arg)
+                else:
+                    call = handler(scope, _query_params(scope), path_arg)
+                    if call.http_cached:
+                        key = call.func.key(*call.args)
+                        headers = http_caching.not_modified(
+                            key, _header(scope, "If-None-Match"), _header(scope, "If-Modified-Since"), call.private
+                        )
+                        if headers is not None:
+                            await self._send_not_modified(send, headers)
+                            return
+                    payload, status_code = await context.wait(call.func(*call.args))
+            except Exception as e:
+                payload, status_code = error_response_for(e)
+                is_stream = False
+                call = None
+
+            if is_stream:
+                await self._send_event_stream(send, events)
+            elif call is not None and call.http_cached:
+                body = self._json_body(payload)
+                status_code, headers = http_caching.finish(
+                    key, body, status_code, context.max_age,
+                    _header(scope, "If-None-Match"), _header(scope, "If-Modified-Since"), call.private,
+                )
+                if status_code == 304:
+                    await self._send_not_modified(send, headers)
+                else:
+                    await self._send_json(send, payload, status_code, body, headers)
+            else:
+                await self._send_json(send, payload, status_code)
+
+    async def _until_disconnect(self, receive, response: Awaitable[None]) -> None:
+        """Run a response coroutine, cancelling it if the client disconnects first."""
+        response_task = asyncio.ensure_future(response)
+
+        async def disconnected():
+            while (await receive())["type"] != "http.disconnect":
+                pass
+
+        watcher = asyncio.ensure_future(disconnected())
+        try:
+            await asyncio.wait({response_task, watcher}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            watcher.cancel()
+            if not response_task.done():
+                # Client went away (or the server is shutting down)
+                logging.info("Client disconnected, cancelling in-flight checks")
+                response_task.cancel()
+                try:
+                    await response_task
+                except asyncio.CancelledError:
+                    pass
+        if not response_task.cancelled():
+            response_task.result()  # Re-raise unexpected errors to the server
+
+    def _json_body(self, payload) -> bytes:
+        return f"{self.json.dumps(payload)}\n".encode("utf-8")
+
+    async def _send_json(self, send, payload, status_code: int, body: Optional[bytes] = None,
+                         headers: Optional[Dict[str, str]] = None) -> None:
+        if body is None:
+            body = self._json_body(payload)
+        await send({
+            "type": "http.response.start",
+            "status": status_code,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode("latin-1")),
+                *((name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in (headers or {}).items()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    async def _send_not_modified(self, send, headers: Dict[str, str]) -> None:
+        await send({
+            "type": "http.response.start",
+            "status": 304,
+            "headers": [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers.items()],
+        })
+        await send({"type": "http.response.body", "body": b""})
+
+    async def _send_event_stream(self, send, events: AsyncIterator[Tuple[str, Any]]) -> None:
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                (b"content-type", b"text/event-stream; charset=utf-8"),
+                (b"cache-control", b"no-cache"),
+                (b"x-accel-buffering", b"no"),
+            ],
+        })
+        try:
+            # (event, data) or, for resumable streams, (event, data, event_id)
+            async for item in events:
+                chunk = flask_module.sse_event(*item).encode("utf-8")
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        except Exception as e:
+            error_response, _ = error_response_for(e)
+            chunk = flask_module.sse_event("failure", error_response).encode("utf-8")
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        finally:
+            await events.aclose()
+        await send({"type": "http.response.body", "body": b""})
+
+    async def _lifespan(self, receive, send) -> None:
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                # Same as the Flask before_request hook: compete to run the bulk worker
+                if flask_module.HIBP_API_KEY:
+                    pwned_checker.bulk_manager.ensure_started()
+                snapshotter.ensure_started()
+                logging.info("Async API server started")
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                snapshotter.shutdown()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+
+app = AsyncApiApp(flask_app)
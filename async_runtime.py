@@ -0,0 +1,163 @@
+"""
+Background event loop for the Flask (WSGI) workers
+
+Each worker process runs one long-lived asyncio event loop in a daemon thread.
+Request threads hand coroutines to it with `run_coroutine_threadsafe` and wait for the
+result with a timeout, so many requests can have async work in flight at once and
+loop-bound objects (HTTP sessions, caches of futures, ...) survive between requests.
+
+The loop is started lazily and re-created after a fork, so importing this module in
+the gunicorn master (or at import time of app.py) is safe.
+"""
+from __future__ import annotations
+
+import asyncio
+import concurrent.futures
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Any, AsyncIterator, Awaitable, Iterator, Optional
+
+import aiohttp
+
+# Upper bound for a single run() call; stays below gunicorn's 180 s worker timeout
+ASYNC_CALL_TIMEOUT = float(os.getenv("ASYNC_CALL_TIMEOUT", "170"))
+
+
+class BackgroundLoop:
+    """An asyncio event loop running forever in a daemon thread of the current process."""
+
+    def __init__(self, name: str = "async-runtime"):
+        self.name = name
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+        self._http_session: Optional[aiohttp.ClientSession] = None
+
+    def _is_running_here(self) -> bool:
+        return (
+            self._loop is not None
+            and self._pid == os.getpid()
+            and self._thread is not None
+            and self._thread.is_alive()
+        )
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        """The loop for this process, started on first use."""
+        if self._is_running_here():
+            return self._loop
+        with self._lock:
+            if self._is_running_here():
+                return self._loop
+
+            # First use in this process (a loop inherited through fork has no thread
+            # behind it, so children always start their own)
+            loop = asyncio.new_event_loop()
+            ready = threading.Event()
+
+            def run_loop():
+                asyncio.set_event_loop(loop)
+                loop.call_soon(ready.set)
+                loop.run_forever()
+
+            thread = threading.Thread(target=run_loop, name=self.name, daemon=True)
+            thread.start()
+            ready.wait()
+
+            self._loop = loop
+            self._thread = thread
+            self._pid = os.getpid()
+            self._http_session = None
+            logging.debug(f"Started background event loop '{self.name}' in process {self._pid}")
+            return loop
+
+    def in_loop_thread(self) -> bool:
+        return self._is_running_here() and threading.current_thread() is self._thread
+
+    def submit(self, coro: Awaitable[Any]) -> concurrent.futures.Future:
+        """Schedule a coroutine on the loop and return a concurrent Future for it."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro: Awaitable[Any], timeout: Optional[float] = ASYNC_CALL_TIMEOUT) -> Any:
+        """
+        Run a coroutine on the loop and block until it finishes.
+
+        Args:
+            coro: The coroutine to run.
+            timeout (float, optional): Seconds to wait. On timeout the coroutine is
+                cancelled and TimeoutError is raised. None waits forever.
+
+        Returns:
+            The coroutine's result (its exception is re-raised).
+        """
+        if self.in_loop_thread():
+            coro.close()
+            raise RuntimeError("BackgroundLoop.run() called from the loop thread; await the coroutine instead")
+        future = self.submit(coro)
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            # Cancels the task on the loop so it stops consuming resources
+            future.cancel()
+            raise
+
+    def iterate(self, agen: AsyncIterator[Any], timeout: Optional[float] = ASYNC_CALL_TIMEOUT) -> Iterator[Any]:
+        """
+        Consume an async generator on the loop and yield its items in the calling thread.
+
+        Used for streaming responses. If the caller stops iterating early (e.g. the client
+        disconnected and the response generator was closed), the async generator is
+        cancelled on the loop.
+
+        Args:
+            agen: The async generator to consume.
+            timeout (float, optional): Overall seconds to wait for the generator to finish.
+                On timeout it is cancelled and TimeoutError is raised. None waits forever.
+
+        Yields:
+            The generator's items (its exception is re-raised).
+        """
+        items: queue.Queue = queue.Queue()
+        finished = object()
+
+        async def pump():
+            try:
+                async for item in agen:
+                    items.put((item, None))
+            except Exception as e:
+                items.put((finished, e))
+            else:
+                items.put((finished, None))
+
+        future = self.submit(pump())
+        ends_at = None if timeout is None else time.monotonic() + timeout
+        try:
+            while True:
+                remaining = None if ends_at is None else max(0, ends_at - time.monotonic())
+                try:
+                    item, error = items.get(timeout=remaining)
+                except queue.Empty:
+                    raise TimeoutError(f"Async generator did not finish within {timeout}s")
+                if item is finished:
+                    if error is not None:
+                        raise error
+                    return
+                yield item
+        finally:
+            future.cancel()
+
+    async def http_session(self) -> aiohttp.ClientSession:
+        """
+        Shared aiohttp session bound to this loop (connection pooling across requests).
+        Must be awaited from coroutines running on the background loop.
+        """
+        if self._http_session is None or self._http_session.closed:
+            self._http_session = aiohttp.ClientSession()
+        return self._http_session
+
+
+runtime = BackgroundLoop()
@@ -2,26 +2,28 @@
 
 import asyncio
 import logging
+from datetime import datetime
 import dns.asyncresolver
 from error_handling import DomainError, DnsLookupError, RecordParsingError
-import dmarc_lookup  # Import the existing DMARC lookup module
+from domain_snapshot import DomainSnapshot
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
 
-async def verify_spf_setup(domain):
+async def verify_spf_setup(domain, snapshot=None):
     """
     Verify SPF record setup for a domain.
     
     Args:
         domain (str): The domain to verify
+        snapshot (DomainSnapshot, optional): Record snapshot shared with other checks
         
     Returns:
         dict: Verification results including status, recommendations, etc.
     """
     try:
-        # Use the existing SPF lookup function
-        spf_data = await dmarc_lookup.get_spf_record(domain)
+        snapshot = snapshot or DomainSnapshot(domain)
+        spf_data = await snapshot.spf()
         
         # If there's an error, return it
         if "error" in spf_data:
@@ -108,13 +110,14 @@ async def verify_spf_setup(domain):
             "suggestions": ["Please try again later."]
         }
 
-async def verify_dkim_setup(domain, selectors):
+async def verify_dkim_setup(domain, selectors, snapshot=None):
     """
     Verify DKIM setup for a domain.
     
     Args:
         domain (str): The domain to verify
         selectors (str or list): DKIM selector(s) to check
+        snapshot (DomainSnapshot, optional): Record snapshot shared with other checks
         
     Returns:
         dict: Verification results including status, recommendations, etc.
@@ -126,8 +129,8 @@ async def verify_dkim_setup(domain, selectors):
         else:
             selector_list = selectors
         
-        # Use the existing DKIM lookup function
-        dkim_data = await dmarc_lookup.get_all_dkim_records(domain, selector_list)
+        snapshot = snapshot or DomainSnapshot(domain)
+        dkim_data = await snapshot.dkim(selector_list)
         
         # Initialize result
         result = {
@@ -182,19 +185,20 @@ async def verify_dkim_setup(domain, selectors):
             "suggestions": ["Please try again later."]
         }
 
-async def verify_dmarc_setup(domain):
+async def verify_dmarc_setup(domain, snapshot=None):
     """
     Verify DMARC setup for a domain.
     
     Args:
         domain (str): The domain to verify
+        snapshot (DomainSnapshot, optional): Record snapshot shared with other checks
         
     Returns:
         dict: Verification results including status, recommendations, etc.
     """
     try:
-        # Use the existing DMARC lookup function
-        dmarc_data = await dmarc_lookup.get_dmarc_record(domain)
+        snapshot = snapshot or DomainSnapshot(domain)
+        dmarc_data = await snapshot.dmarc()
         
         # If there's an error, return it
         if "error" in dmarc_data:
@@ -263,6 +267,41 @@ async def verify_dmarc_setup(domain):
             "suggestions": ["Please try again later."]
         }
 
+async def verify_all_setup(domain, dkim_selectors, snapshot=None):
+    """
+    Verify SPF, DKIM and DMARC setup for a domain in one pass.
+
+    The three verifications run concurrently and read from one record snapshot, so
+    every record (including each DKIM selector) is fetched once.
+
+    Args:
+        domain (str): The domain to verify
+        dkim_selectors (list): DKIM selectors to check
+        snapshot (DomainSnapshot, optional): Record snapshot shared with other checks
+        
+    Returns:
+        dict: Per-record verification results and the overall status
+    """
+    snapshot = snapshot or DomainSnapshot(domain)
+    spf_result, dkim_result, dmarc_result = await asyncio.gather(
+        verify_spf_setup(domain, snapshot),
+        verify_dkim_setup(domain, dkim_selectors, snapshot),
+        verify_dmarc_setup(domain, snapshot)
+    )
+
+    records = {
+        "spf": spf_result,
+        "dkim": dkim_result,
+        "dmarc": dmarc_result
+    }
+
+    return {
+        "domain": domain,
+        "verification_date": datetime.now().isoformat(),
+        "records": records,
+        "overall_status": calculate_overall_auth_status(records)
+    }
+
 def calculate_overall_auth_status(records):
     """
     Calculate the overall email authentication status based on individual record statuses.
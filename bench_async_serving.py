@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Load benchmark: sync (WSGI) serving vs async (ASGI) serving
+
+Starts the app under gunicorn twice - once as `app:app` with the configured sync
+workers and once as `asgi:app` with uvicorn workers - fires a batch of concurrent
+requests at each, and prints throughput and latency percentiles.
+
+Every request checks a different domain, so the runs measure concurrent checks in flight
+rather than answers from the result caches or the request coalescer. The path template
+takes `{n}` (the request number, unique across both runs) and `{domain}` (the n-th line
+of --domains):
+
+Usage:
+    python bench_async_serving.py --path "/api/reputation?domain={domain}" \
+        --domains domains.txt --concurrency 100 --requests 500
+
+Use --sync-threads 1 to compare against plain single-threaded sync workers, or
+--sync-url/--async-url to benchmark servers that are already running.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+from collections import Counter
+
+import aiohttp
+
+
+def start_server(app_spec, port, extra_args):
+    cmd = [
+        sys.executable, "-m", "gunicorn", app_spec,
+        "-c", "gunicorn_config.py",
+        "--bind", f"127.0.0.1:{port}",
+        *extra_args,
+    ]
+    return subprocess.Popen(
+        cmd,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+async def wait_ready(base_url, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while time.monotonic() < deadline:
+            try:
+                async with session.get(f"{base_url}/") as response:
+                    if response.status < 500:
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.25)
+    raise RuntimeError(f"Server at {base_url} did not become ready")
+
+
+def request_urls(base_url, path, domains, start, count):
+    """URLs for requests number `start` to `start + count - 1` of the path template."""
+    urls = []
+    for n in range(start, start + count):
+        domain = domains[n % len(domains)] if domains else ""
+        urls.append(base_url + path.replace("{n}", str(n)).replace("{domain}", domain))
+    return urls
+
+
+def read_domains(path):
+    with open(path, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith("#")]
+
+
+async def run_load(urls, concurrency, request_timeout):
+    """Send a GET request to each URL with at most `concurrency` in flight."""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    statuses = Counter()
+    timeout = aiohttp.ClientTimeout(total=request_timeout)
+    connector = aiohttp.TCPConnector(limit=concurrency)
+
+    async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+        async def one(url):
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    async with session.get(url) as response:
+                        await response.read()
+                        statuses[response.status] += 1
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    statuses[type(e).__name__] += 1
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(url) for url in urls))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+
+    def percentile(p):
+        return latencies[min(len(latencies) - 1, int(p / 100 * len(latencies)))]
+
+    return {
+        "elapsed": elapsed,
+        "throughput": len(urls) / elapsed,
+        "p50": statistics.median(latencies),
+        "p95": percentile(95),
+        "p99": percentile(99),
+        "statuses": dict(statuses),
+    }
+
+
+def print_report(results):
+    print(f"{'mode':<8}{'req/s':>10}{'p50 (s)':>10}{'p95 (s)':>10}{'p99 (s)':>10}{'total (s)':>11}  statuses")
+    for mode, r in results.items():
+        print(
+            f"{mode:<8}{r['throughput']:>10.1f}{r['p50']:>10.2f}{r['p95']:>10.2f}"
+            f"{r['p99']:>10.2f}{r['elapsed']:>11.1f}  {r['statuses']}"
+        )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--path", default="/api/reputation?domain=bench-{n}.example.com",
+                        help="Request path and query; {n} and {domain} are filled in per request")
+    parser.add_argument("--domains", help="File with one domain per line, for {domain} in --path")
+    parser.add_argument("--concurrency", type=int, default=100, help="Requests in flight at once")
+    parser.add_argument("--requests", type=int, default=500, help="Total requests per mode")
+    parser.add_argument("--timeout", type=float, default=190.0, help="Per-request client timeout (s)")
+    parser.add_argument("--sync-threads", type=int, help="Override gunicorn threads for the sync run")
+    parser.add_argument("--sync-url", help="Benchmark an already running sync server instead")
+    parser.add_argument("--async-url", help="Benchmark an already running async server instead")
+    parser.add_argument("--port", type=int, default=10100, help="First port for servers started here")
+    args = parser.parse_args()
+
+    domains = read_domains(args.domains) if args.domains else []
+    if "{domain}" in args.path and not domains:
+        parser.error("--path uses {domain} but no --domains file was given")
+    if "{n}" not in args.path and "{domain}" not in args.path:
+        print("Warning: every request uses the same path and is answered from the caches after the first")
+    elif "{n}" not in args.path and len(domains) < 2 * args.requests:
+        print(f"Warning: {len(domains)} domains for {2 * args.requests} requests, some will be repeated (and cached)")
+
+    sync_args = ["--threads", str(args.sync_threads)] if args.sync_threads else []
+    modes = [
+        ("sync", args.sync_url, "app:app", sync_args),
+        ("async", args.async_url, "asgi:app", ["-k", "uvicorn.workers.UvicornWorker"]),
+    ]
+
+    results = {}
+    for offset, (mode, base_url, app_spec, extra_args) in enumerate(modes):
+        process = None
+        if base_url is None:
+            port = args.port + offset
+            base_url = f"http://127.0.0.1:{port}"
+            process = start_server(app_spec, port, extra_args)
+        try:
+            # Loads the app; no warm-up check, it would leave its answer in the caches
+            await wait_ready(base_url)
+            # Each mode gets its own requests, caches may be shared (SQLite, Redis)
+            urls = request_urls(base_url, args.path, domains, offset * args.requests, args.requests)
+            print(f"Running {args.requests} requests against {mode} server ({base_url})...")
+            results[mode] = await run_load(urls, args.concurrency, args.timeout)
+        finally:
+            if process is not None:
+                process.terminate()
+                process.wait(timeout=30)
+
+    print()
+    print_report(results)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Cache backend benchmark: get/set latency of SimpleCache per storage backend
+
+Compares the in-process dict store with the cross-worker backends (memory-mapped
+table and SQLite) and the cross-node Redis backend using payloads shaped like the
+cached provider results, and prints per-operation latency percentiles in
+microseconds. Redis runs against the local stand-in server (redis_standin.py) unless
+--redis-url points at a real one.
+
+A second table simulates traffic spread across several nodes: each request goes to a
+random node, keys follow a skewed popularity distribution, and the hit rate of
+per-node in-memory caches is compared with that of a cache shared through Redis.
+
+Usage:
+    python bench_cache_backends.py --operations 20000 --payload-bytes 1500
+    python bench_cache_backends.py --redis-url redis://localhost:6379/15 --nodes 4
+"""
+import argparse
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+
+from cache import SimpleCache
+from cache_backends import MmapBackend, RedisBackend, SqliteBackend
+from redis_standin import RedisStandin
+
+
+def make_payload(size):
+    """A provider-like result of roughly `size` bytes of JSON."""
+    return {
+        "source": "VirusTotal",
+        "data": {
+            "reputation": 0,
+            "last_analysis_stats": {"harmless": 70, "malicious": 0, "suspicious": 0, "undetected": 18},
+            "as_owner": "x" * max(0, size - 150),
+        },
+    }
+
+
+def timed(operation, keys):
+    latencies = []
+    for key in keys:
+        started = time.perf_counter()
+        operation(key)
+        latencies.append((time.perf_counter() - started) * 1e6)
+    latencies.sort()
+    return {
+        "mean": statistics.mean(latencies),
+        "p50": latencies[len(latencies) // 2],
+        "p99": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))],
+    }
+
+
+def run(name, cache, operations, payload):
+    keys = [f"virustotal:{i}" for i in range(operations)]
+    results = {"set": timed(lambda key: cache.set(key, payload), keys)}
+    results["get"] = timed(cache.get, keys)
+    results["miss"] = timed(cache.get, [f"missing:{i}" for i in range(operations)])
+    if hasattr(cache.backend, "get_entries"):
+        batches = [keys[i:i + 20] for i in range(0, operations, 20)]
+        batched = timed(cache.get_many, batches)
+        # Per key, to compare with single gets
+        results["mget"] = {stat: value / 20 for stat, value in batched.items()}
+    hits = sum(1 for key in keys if cache.get(key) is not None)
+    return name, results, hits / operations
+
+
+def simulate_nodes(make_cache, nodes, requests, keyspace, seed=1):
+    """Hit rate of `requests` lookups spread randomly over `nodes` caches."""
+    rng = random.Random(seed)
+    caches = [make_cache(node) for node in range(nodes)]
+    hits = 0
+    for _ in range(requests):
+        # Zipf-like popularity: a few domains/IPs get most of the traffic
+        key = f"complete_ip:{int(keyspace ** rng.random()) - 1}"
+        cache = rng.choice(caches)
+        if cache.get(key) is not None:
+            hits += 1
+        else:
+            cache.set(key, {"ip": key})
+    return hits / requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--operations", type=int, default=20000, help="Keys set and read per backend")
+    parser.add_argument("--payload-bytes", type=int, default=1500, help="Approximate JSON size of each value")
+    parser.add_argument("--slot-size", type=int, default=8192, help="Slot size of the mmap backend")
+    parser.add_argument("--redis-url", help="Benchmark this Redis server instead of the local stand-in")
+    parser.add_argument("--nodes", type=int, default=4, help="Nodes in the hit-rate simulation")
+    parser.add_argument("--keyspace", type=int, default=5000, help="Distinct keys in the hit-rate simulation")
+    args = parser.parse_args()
+
+    standin = None
+    redis_url = args.redis_url
+    if not redis_url:
+        standin = RedisStandin(port=0).start()
+        redis_url = standin.url
+
+    directory = tempfile.mkdtemp(dir="/dev/shm" if os.path.isdir("/dev/shm") else None)
+    payload = make_payload(args.payload_bytes)
+    # Sized so every key fits; the benchmark measures latency, not eviction
+    slots = args.operations * 2
+    backends = [
+        ("dict", SimpleCache(default_ttl=600, max_entries=None, max_bytes=None)),
+        ("mmap", SimpleCache(default_ttl=600, backend=MmapBackend(
+            os.path.join(directory, "bench.mmap"), slots=slots, slot_size=args.slot_size))),
+        ("sqlite", SimpleCache(default_ttl=600, backend=SqliteBackend(
+            os.path.join(directory, "bench.sqlite3"), "bench"))),
+        # Without the near-cache, so every operation is a round trip
+        ("redis", SimpleCache(default_ttl=600, backend=RedisBackend(redis_url, "bench", near_ttl=0, timeout=5))),
+    ]
+
+    print(f"{args.operations} operations per backend, ~{args.payload_bytes} byte values (latency in µs)")
+    print(f"{'backend':<8}{'op':<6}{'mean':>10}{'p50':>10}{'p99':>10}")
+    try:
+        for name, cache in backends:
+            name, results, hit_rate = run(name, cache, args.operations, payload)
+            for op, r in results.items():
+                print(f"{name:<8}{op:<6}{r['mean']:>10.1f}{r['p50']:>10.1f}{r['p99']:>10.1f}")
+            if hit_rate < 1:
+                print(f"{name:<8}hit rate after set: {hit_rate:.1%}")
+        backends[-1][1].clear_all()
+
+        print(f"\nHit rate, {args.operations} requests over {args.nodes} nodes, {args.keyspace} keys")
+        local = simulate_nodes(lambda node: SimpleCache(default_ttl=600), args.nodes, args.operations, args.keyspace)
+        shared_backends = []
+
+        def shared(node):
+            shared_backends.append(RedisBackend(redis_url, "bench-nodes", timeout=5))
+            return SimpleCache(default_ttl=600, backend=shared_backends[-1])
+
+        shared_rate = simulate_nodes(shared, args.nodes, args.operations, args.keyspace)
+        print(f"{'per-node memory':<18}{local:>8.1%}")
+        print(f"{'shared via redis':<18}{shared_rate:>8.1%}")
+        shared_backends[0].clear_all()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+        if standin is not None:
+            standin.stop()
+
+
+if __name__ == "__main__":
+    main()
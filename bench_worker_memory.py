@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Worker memory benchmark: preloaded (copy-on-write) vs per-worker app import
+
+Starts the app under gunicorn twice - with GUNICORN_PRELOAD=1 (the default: the app is
+imported and warmed up in the master, see warmup.py) and with GUNICORN_PRELOAD=0 (every
+worker imports it on its own) - sends a few requests so the workers have served
+traffic, and prints RSS, PSS, shared and private memory per worker (Linux only).
+
+PSS splits shared pages between the processes using them, so the PSS total is the
+memory the workers actually cost the host.
+
+Usage:
+    python bench_worker_memory.py --path "/api/dmarc?domain=example.com" --requests 20
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+from warmup import memory_usage
+
+
+def start_server(port, preload):
+    env = {**os.environ, "GUNICORN_PRELOAD": "1" if preload else "0"}
+    cmd = [
+        sys.executable, "-m", "gunicorn", "app:app",
+        "-c", "gunicorn_config.py",
+        "--bind", f"127.0.0.1:{port}",
+    ]
+    return subprocess.Popen(
+        cmd,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+def get(url, timeout=60.0):
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            response.read()
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def wait_ready(base_url, timeout=60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if get(f"{base_url}/", timeout=5) < 500:
+                return
+        except OSError:
+            pass
+        time.sleep(0.25)
+    raise RuntimeError(f"Server at {base_url} did not become ready")
+
+
+def child_pids(parent_pid):
+    """PIDs of the direct children of a process (the gunicorn workers)."""
+    children = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", encoding="ascii") as f:
+                # The command name may contain spaces; fields resume after its ')'
+                fields = f.read().rsplit(")", 1)[1].split()
+        except (OSError, IndexError):
+            continue
+        if int(fields[1]) == parent_pid:
+            children.append(int(entry))
+    return sorted(children)
+
+
+def measure(mode, preload, port, path, requests):
+    process = start_server(port, preload)
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        wait_ready(base_url)
+        print(f"Sending {requests} requests to the {mode} server ({base_url})...")
+        for _ in range(requests):
+            get(f"{base_url}{path}")
+        # Let late-booting workers finish their initialization
+        time.sleep(1.0)
+        return {pid: memory_usage(pid) for pid in child_pids(process.pid)}
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+
+def print_report(results):
+    columns = ["rss", "pss", "shared", "private"]
+    print(f"{'mode':<12}{'worker':>8}" + "".join(f"{c.upper() + ' (MB)':>14}" for c in columns))
+    for mode, workers in results.items():
+        totals = dict.fromkeys(columns, 0)
+        for pid, usage in workers.items():
+            print(f"{mode:<12}{pid:>8}" + "".join(f"{usage.get(c, 0) / 1024:>14.1f}" for c in columns))
+            for c in columns:
+                totals[c] += usage.get(c, 0)
+        print(f"{mode:<12}{'total':>8}" + "".join(f"{totals[c] / 1024:>14.1f}" for c in columns))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--path", default="/api/dmarc?domain=example.com", help="Request path and query")
+    parser.add_argument("--requests", type=int, default=20, help="Requests sent before measuring")
+    parser.add_argument("--port", type=int, default=10200, help="First port for the servers started here")
+    args = parser.parse_args()
+
+    results = {}
+    for offset, (mode, preload) in enumerate([("preload", True), ("no-preload", False)]):
+        results[mode] = measure(mode, preload, args.port + offset, args.path, args.requests)
+
+    print()
+    print_report(results)
+
+
+if __name__ == "__main__":
+    main()
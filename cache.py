@@ -3,77 +3,682 @@
 Simple cache implementation for API results
 """
 import time
+import asyncio
 import json
+import functools
 import hashlib
+import logging
 import os
-from typing import Optional, Dict, Any
+import threading
+import weakref
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Awaitable, Callable, Iterable, List, Set, Tuple
+
+from async_runtime import ASYNC_CALL_TIMEOUT
+import cache_codec
+from cache_backends import MmapBackend, RedisBackend, SqliteBackend
+from coalescing import SingleFlight
+import request_context
+
+# Default bounds for each in-memory cache instance (entries kept in a backend are
+# bounded by the backend instead)
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "10000"))
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+# Width of a timing-wheel slot and interval of the background expiry sweep, in seconds
+EXPIRY_RESOLUTION = float(os.getenv("CACHE_EXPIRY_RESOLUTION", "1"))
+# Distinct key prefixes tracked per cache; further prefixes are counted as "other"
+CACHE_MAX_PREFIXES = int(os.getenv("CACHE_MAX_PREFIXES", "50"))
+# Seconds the IP info and external API caches keep an entry past its TTL, to be served
+# stale by get_or_compute() while it is refreshed in the background (0 disables)
+CACHE_STALE_TTL = float(os.getenv("CACHE_STALE_TTL", "1800"))
+# Set to 1 to keep in-memory values of the module caches below as compact (and, from
+# CACHE_COMPRESS_THRESHOLD bytes, compressed) encodings instead of Python objects
+CACHE_COMPACT_VALUES = os.getenv("CACHE_COMPACT_VALUES", "0") == "1"
+CACHE_COMPRESS_THRESHOLD = int(os.getenv("CACHE_COMPRESS_THRESHOLD", "1024"))
+CACHE_COMPRESSION = os.getenv("CACHE_COMPRESSION", "zlib")
+if CACHE_COMPRESSION not in cache_codec.available_compressions():
+    logging.warning(f"CACHE_COMPRESSION={CACHE_COMPRESSION!r} is not available, using zlib")
+    CACHE_COMPRESSION = "zlib"
+
+def estimate_size(data: Any) -> int:
+    """Approximate size of a cached value in bytes (its compact JSON encoding)"""
+    try:
+        return len(json.dumps(data, separators=(",", ":"), default=str))
+    except (TypeError, ValueError):
+        return len(str(data))
+
+class TtlPolicy:
+    """TTLs by outcome of a computation cached with SimpleCache.get_or_compute()
+
+    `classify(result)` names the outcome: "success", "not_found", "rate_limited" or
+    "error" (by default every result is a success). Each outcome has its own TTL in
+    seconds; None means the cache's default TTL and 0 means the result is not cached.
+    """
+
+    OUTCOMES = ("success", "not_found", "rate_limited", "error")
+
+    def __init__(self, success: Optional[float] = None, not_found: Optional[float] = 300,
+                 rate_limited: Optional[float] = 0, error: Optional[float] = 60,
+                 classify: Optional[Callable[[Any], str]] = None):
+        self.ttls = {"success": success, "not_found": not_found, "rate_limited": rate_limited, "error": error}
+        self.classify = classify or (lambda result: "success")
+
+    def outcome(self, result: Any) -> str:
+        """Outcome of `result`"""
+        outcome = self.classify(result)
+        if outcome not in self.ttls:
+            raise ValueError(f"Unknown cache outcome: {outcome}")
+        return outcome
+
+    def ttl_for(self, outcome: str, default_ttl: float) -> float:
+        """TTL for results with `outcome` (0: do not cache)"""
+        ttl = self.ttls[outcome]
+        return default_ttl if ttl is None else ttl
+
+PREFIX_COUNTERS = ("hits", "misses", "stale_served", "sets", "set_bytes", "evictions", "expirations", "get_seconds")
+# Prefix counters also kept cache-wide (attributes of SimpleCache)
+CACHE_WIDE_COUNTERS = ("hits", "misses", "stale_served", "sets", "evictions", "expirations")
+
+def key_prefix(key: str) -> str:
+    """The part of a cache key before the first ':' (as built by SimpleCache._generate_key)"""
+    prefix, separator, _ = key.partition(":")
+    return prefix if separator else "(none)"
+
+class ExpirySweeper:
+    """Background thread that removes expired items from every in-memory SimpleCache
+
+    Started on first use in each process. Threads do not survive a fork, so a child
+    restarts it right away if caches were filled before the fork (e.g. restored from a
+    snapshot in the gunicorn master), even if the child never writes to them.
+    """
+
+    def __init__(self, interval: float = EXPIRY_RESOLUTION):
+        self.interval = interval
+        self._caches: "weakref.WeakSet[SimpleCache]" = weakref.WeakSet()
+        self._lock = threading.Lock()
+        self._pid: Optional[int] = None
+        if hasattr(os, "register_at_fork"):  # POSIX
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def register(self, cache: "SimpleCache") -> None:
+        with self._lock:
+            self._caches.add(cache)
+            self._ensure_running()
+
+    def _ensure_running(self) -> None:
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            threading.Thread(target=self._run, name="cache-expiry-sweeper", daemon=True).start()
+
+    def _after_fork(self) -> None:
+        # The lock may have been held by a thread of the parent that no longer exists
+        self._lock = threading.Lock()
+        if len(self._caches):
+            self._ensure_running()
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                caches = list(self._caches)
+            for cache in caches:
+                try:
+                    cache.clear_expired()
+                except Exception as e:
+                    logging.warning(f"Cache expiry sweep failed: {e}")
+
+_sweeper = ExpirySweeper()
 
 class SimpleCache:
-    """Simple in-memory cache with TTL (Time To Live) support"""
-    
-    def __init__(self, default_ttl: int = 300):  # 5 minutes default
-        self.cache: Dict[str, Dict[str, Any]] = {}
+    """Simple in-memory cache with TTL (Time To Live) support
+
+    The in-memory store is bounded: once it holds more than `max_entries` items or
+    `max_bytes` of (estimated) data, the least recently used items are evicted. Items
+    are sized once, when they are inserted.
+
+    Expiry uses a timing wheel: each item is filed in the slot of EXPIRY_RESOLUTION
+    seconds in which it expires, and a background sweeper drops the slots that have
+    passed, so expired items are removed without scanning the cache. Item, byte, hit,
+    miss, eviction and expiration counters are maintained as the cache changes, which
+    keeps get_stats() constant-time.
+
+    get_or_compute() (or the @cached decorator) wraps the check / compute / store
+    sequence: concurrent misses on one key in a worker share a single computation
+    instead of each calling the upstream API, and the result is stored with a TTL
+    chosen by its outcome (see TtlPolicy).
+
+    Items have a soft and a hard expiry. After `ttl` seconds an item is stale: get()
+    no longer returns it, but for another `stale_ttl` seconds get_or_compute() serves
+    it immediately and starts one background refresh, so a hot key never makes a user
+    wait for the full recomputation. Only successful results are kept stale.
+
+    Pass a `backend` (see cache_backends.py) to store entries outside the process,
+    e.g. in a SQLite file shared by all workers on the host, or in Redis shared by
+    every node. get_many()/set_many() fetch or store several items in one round trip
+    on backends that support it.
+
+    With `compact=True` in-memory values are stored packed by cache_codec (compressed
+    from CACHE_COMPRESS_THRESHOLD bytes) and decoded on each get, which takes a fraction
+    of the memory of nested dicts; sizes are then the exact stored byte counts. Every
+    get returns a fresh copy, with tuples turned into lists as JSON would. Values the
+    codec cannot encode are stored as they are.
+
+    Hits, misses, sets, evictions, expirations, stored bytes and lookup time are also
+    counted per key prefix ("abuseipdb", "complete_ip", ...; see prefix_stats()). Caches
+    created with a `name` are listed by registered_caches() for the metrics endpoints.
+    """
+
+    def __init__(self, default_ttl: int = 300, backend: Optional[Any] = None,  # 5 minutes default
+                 max_entries: Optional[int] = CACHE_MAX_ENTRIES, max_bytes: Optional[int] = CACHE_MAX_BYTES,
+                 resolution: float = EXPIRY_RESOLUTION, stale_ttl: float = 0, name: Optional[str] = None,
+                 compact: bool = False):
+        # Ordered from least to most recently used
+        self.cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
         self.default_ttl = default_ttl
-    
+        self.stale_ttl = stale_ttl
+        self.backend = backend
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.resolution = resolution
+        self.compact = compact
+        # Timing wheel: slot number -> keys expiring in it
+        self._slots: Dict[int, Set[str]] = {}
+        self._swept_until = self._slot(time.time())
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.evicted_bytes = 0
+        self.expirations = 0
+        self.oversized = 0  # items larger than max_bytes, never stored
+        self.computations = 0  # get_or_compute() misses that computed the value
+        self.coalesced = 0  # get_or_compute() misses that joined a computation in flight
+        self.stale_served = 0  # stale items served by get_or_compute() while refreshed
+        self.refreshes = 0  # background refreshes started
+        self.sets = 0
+        self.get_seconds = 0.0  # total time spent in lookups
+        self._prefixes: Dict[str, Dict[str, float]] = {}
+        self._flights = SingleFlight()
+        self._refreshing: Dict[str, asyncio.Future] = {}
+        # Caches are shared by request threads and the background event loop
+        self._lock = threading.Lock()
+        self._add_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._registered_pid: Optional[int] = None
+        self.name = name
+        if name is not None:
+            _registry[name] = self
+
     def _generate_key(self, prefix: str, data: str) -> str:
         """Generate a cache key from prefix and data"""
         return f"{prefix}:{hashlib.md5(data.encode()).hexdigest()}"
-    
+
+    def _count(self, key: str, counter: str, amount: float = 1, get_seconds: float = 0.0) -> None:
+        """Add to a counter of the key's prefix and its cache-wide total (and the lookup time)
+
+        Every counter changes under _stats_lock: they are updated from request threads
+        and the background loop at once, and `+=` on an attribute is not atomic.
+        """
+        prefix = key_prefix(key)
+        with self._stats_lock:
+            counters = self._prefixes.get(prefix)
+            if counters is None:
+                if len(self._prefixes) >= CACHE_MAX_PREFIXES:
+                    prefix = "other"
+                counters = self._prefixes.setdefault(prefix, dict.fromkeys(PREFIX_COUNTERS, 0))
+            counters[counter] += amount
+            if counter in CACHE_WIDE_COUNTERS:
+                setattr(self, counter, getattr(self, counter) + amount)
+            if get_seconds:
+                counters["get_seconds"] += get_seconds
+                self.get_seconds += get_seconds
+
+    def _slot(self, timestamp: float) -> int:
+        return int(timestamp // self.resolution)
+
+    def _remove(self, key: str) -> Optional[Dict[str, Any]]:
+        """Remove an in-memory item and release its bytes (caller holds the lock)"""
+        item = self.cache.pop(key, None)
+        if item is not None:
+            self.total_bytes -= item['size']
+            slot = self._slots.get(item['slot'])
+            if slot is not None:
+                slot.discard(key)
+                if not slot:
+                    del self._slots[item['slot']]
+        return item
+
+    def _evict(self) -> None:
+        """Evict least recently used items until within bounds (caller holds the lock)"""
+        while self.cache and (
+            (self.max_entries is not None and len(self.cache) > self.max_entries)
+            or (self.max_bytes is not None and self.total_bytes > self.max_bytes)
+        ):
+            key = next(iter(self.cache))
+            item = self._remove(key)
+            self.evicted_bytes += item['size']
+            self._count(key, "evictions")
+
+    def _lookup(self, key: str) -> Tuple[Optional[Any], float]:
+        """(data, seconds until stale) of an item, or (None, 0) if it is missing or past its hard expiry"""
+        now = time.time()
+        if self.backend is not None:
+            item = self.backend.get_entry(key)
+            if item is not None and now < item['expires']:
+                return item['data'], item.get('fresh_until', item['expires']) - now
+            return None, 0
+
+        with self._lock:
+            item = self.cache.get(key)
+            if item is not None:
+                if now < item['expires']:
+                    self.cache.move_to_end(key)
+                else:
+                    # Remove expired item
+                    self._remove(key)
+                    self._count(key, "expirations")
+                    item = None
+        if item is None:
+            return None, 0
+        # Packed values are decoded outside the lock
+        data = cache_codec.unpack(item['data']) if item.get('packed') else item['data']
+        return data, item['fresh_until'] - now
+
     def get(self, key: str) -> Optional[Any]:
-        """Get item from cache if not expired"""
-        if key in self.cache:
-            item = self.cache[key]
-            if time.time() < item['expires']:
-                return item['data']
-            else:
-                # Remove expired item
-                del self.cache[key]
+        """Get item from cache if not expired (stale items are not returned)
+
+        The item's remaining TTL is reported to the current request (see
+        request_context.limit_max_age).
+        """
+        started = time.perf_counter()
+        data, fresh_for = self._lookup(key)
+        elapsed = time.perf_counter() - started
+        if data is not None and fresh_for > 0:
+            self._count(key, "hits", get_seconds=elapsed)
+            request_context.limit_max_age(fresh_for)
+            return data
+        self._count(key, "misses", get_seconds=elapsed)
         return None
-    
-    def set(self, key: str, data: Any, ttl: Optional[int] = None) -> None:
-        """Set item in cache with TTL"""
+
+    def set(self, key: str, data: Any, ttl: Optional[int] = None, stale_ttl: Optional[float] = None) -> bool:
+        """Set item in cache with TTL (and the cache's stale window unless `stale_ttl` is given)
+
+        Returns whether the item was stored: backends refuse values they cannot
+        serialize, and items larger than max_bytes are never stored.
+        """
         if ttl is None:
             ttl = self.default_ttl
-        
-        self.cache[key] = {
+        if stale_ttl is None:
+            stale_ttl = self.stale_ttl
+
+        now = time.time()
+        item = {
             'data': data,
-            'expires': time.time() + ttl,
-            'created': time.time()
+            'fresh_until': now + ttl,
+            'expires': now + ttl + stale_ttl,
+            'created': now
         }
-    
+        if self.backend is not None:
+            self._count(key, "sets")
+            self._count(key, "set_bytes", estimate_size(data))
+            return self.backend.set_entry(key, item)
+
+        stored = self._store(key, item)
+        self._count(key, "sets")
+        self._count(key, "set_bytes", item['size'])
+        return stored
+
+    def add(self, key: str, data: Any, ttl: Optional[int] = None) -> bool:
+        """Store an item only if the key holds no unexpired item; returns whether it was stored
+
+        Atomic across processes on backends with add_entry() (SQLite) and between add()
+        calls of this process otherwise.
+        """
+        if ttl is None:
+            ttl = self.default_ttl
+        now = time.time()
+        item = {'data': data, 'fresh_until': now + ttl, 'expires': now + ttl, 'created': now}
+        with self._add_lock:
+            if self.backend is not None and hasattr(self.backend, 'add_entry'):
+                stored = self.backend.add_entry(key, item)
+            elif self._lookup(key)[0] is not None:
+                stored = False
+            elif self.backend is not None:
+                stored = self.backend.set_entry(key, item)
+            else:
+                stored = self._store(key, item)
+        if stored:
+            self._count(key, "sets")
+        return stored
+
+    def _store(self, key: str, item: Dict[str, Any]) -> bool:
+        """File an item ({'data', 'fresh_until', 'expires', 'created'}, maybe 'packed') in memory"""
+        if self._registered_pid != os.getpid():
+            self._registered_pid = os.getpid()
+            _sweeper.register(self)
+
+        if item.get('packed') and not self.compact:
+            item['data'] = cache_codec.unpack(item['data'])
+            del item['packed']
+        if self.compact and not item.get('packed'):
+            try:
+                item['data'] = cache_codec.pack(item['data'], CACHE_COMPRESS_THRESHOLD, CACHE_COMPRESSION)
+                item['packed'] = True
+            except TypeError:
+                pass
+        item['size'] = len(item['data']) if item.get('packed') else estimate_size(item['data'])
+        with self._lock:
+            # Never file an item in a slot the sweeper has already passed
+            item['slot'] = max(self._slot(item['expires']), self._swept_until)
+            self._remove(key)
+            if self.max_bytes is not None and item['size'] > self.max_bytes:
+                self.oversized += 1
+                return False
+            self.cache[key] = item
+            self._slots.setdefault(item['slot'], set()).add(key)
+            self.total_bytes += item['size']
+            self._evict()
+        return True
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        """Get several items; returns the ones found (and not expired) by key"""
+        keys = list(keys)
+        if self.backend is not None and hasattr(self.backend, 'get_entries'):
+            started = time.perf_counter()
+            entries = self.backend.get_entries(keys)
+            # One round trip for all keys; its time is shared between them
+            elapsed = (time.perf_counter() - started) / max(1, len(keys))
+            now = time.time()
+            found = {
+                key: entry['data'] for key, entry in entries.items()
+                if entry is not None and now < entry.get('fresh_until', entry['expires'])
+            }
+            for key in keys:
+                self._count(key, "hits" if key in found else "misses", get_seconds=elapsed)
+            return found
+
+        found = {}
+        for key in keys:
+            data = self.get(key)
+            if data is not None:
+                found[key] = data
+        return found
+
+    def set_many(self, items: Dict[str, Any], ttl: Optional[int] = None) -> None:
+        """Set several items with the same TTL"""
+        if self.backend is not None and hasattr(self.backend, 'set_entries'):
+            if ttl is None:
+                ttl = self.default_ttl
+            now = time.time()
+            for key, data in items.items():
+                self._count(key, "sets")
+                self._count(key, "set_bytes", estimate_size(data))
+            self.backend.set_entries({
+                key: {'data': data, 'fresh_until': now + ttl, 'expires': now + ttl + self.stale_ttl, 'created': now}
+                for key, data in items.items()
+            })
+            return
+
+        for key, data in items.items():
+            self.set(key, data, ttl)
+
+    def _record_flight(self, outcome: str) -> None:
+        with self._stats_lock:
+            if outcome == "computed":
+                self.computations += 1
+            else:
+                self.coalesced += 1
+
+    async def get_or_compute(self, key: str, coro_factory: Callable[[], Awaitable[Any]],
+                             ttl_policy: Optional[TtlPolicy] = None) -> Any:
+        """
+        Get an item, computing and storing it on a miss.
+
+        Args:
+            key (str): Cache key.
+            coro_factory: Creates the coroutine computing the value. Called at most once
+                per key at a time in this worker; concurrent misses await its result.
+            ttl_policy (TtlPolicy, optional): TTL by outcome of the result. Defaults to
+                the cache's default TTL for every result.
+
+        Returns:
+            The cached or computed value; a stale value while it is being refreshed.
+            Exceptions raised by the computation are re-raised to every waiting caller
+            and nothing is cached.
+        """
+        started = time.perf_counter()
+        data, fresh_for = self._lookup(key)
+        elapsed = time.perf_counter() - started
+        if data is not None and fresh_for > 0:
+            self._count(key, "hits", get_seconds=elapsed)
+            request_context.limit_max_age(fresh_for)
+            return data
+
+        async def compute(refresh: bool = False):
+            result = await coro_factory()
+            outcome = "success" if ttl_policy is None else ttl_policy.outcome(result)
+            if refresh and outcome != "success":
+                # Keep serving the stale value rather than replacing it with an error
+                return result
+            ttl = self.default_ttl if ttl_policy is None else ttl_policy.ttl_for(outcome, self.default_ttl)
+            if result is not None and ttl > 0:
+                self.set(key, result, ttl, stale_ttl=None if outcome == "success" else 0)
+            request_context.limit_max_age(ttl)
+            return result
+
+        if data is not None:
+            self._count(key, "stale_served", get_seconds=elapsed)
+            # Being refreshed: clients should not keep the stale value
+            request_context.limit_max_age(0)
+            self._refresh(key, functools.partial(compute, refresh=True))
+            return data
+
+        self._count(key, "misses", get_seconds=elapsed)
+        return await self._flights.run(key, compute, f"cache fill {key}", self._record_flight)
+
+    def _refresh(self, key: str, compute: Callable[[], Awaitable[Any]]) -> None:
+        """Recompute a stale item in the background, unless a refresh is already running"""
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self.refreshes += 1
+            # Not part of the caller's request: it has the full deadline and is not
+            # cancelled when the request ends
+            task = asyncio.ensure_future(self._flights.run(
+                key, compute, f"cache refresh {key}", self._record_flight, timeout=ASYNC_CALL_TIMEOUT
+            ))
+            self._refreshing[key] = task
+        task.add_done_callback(functools.partial(self._refresh_done, key))
+
+    def _refresh_done(self, key: str, task: asyncio.Future) -> None:
+        with self._lock:
+            if self._refreshing.get(key) is task:
+                del self._refreshing[key]
+        if not task.cancelled() and task.exception() is not None:
+            logging.warning(f"Background refresh of cache key {key} failed: {task.exception()!r}")
+
+    def delete_if(self, key: str, data: Any) -> bool:
+        """Remove an item only if it holds `data` (e.g. a claim this process made); returns whether it did
+
+        Atomic across processes on backends with delete_entry_if() (SQLite) and between
+        add()/delete_if() calls of this process otherwise.
+        """
+        with self._add_lock:
+            if self.backend is not None and hasattr(self.backend, 'delete_entry_if'):
+                return self.backend.delete_entry_if(key, data)
+            if self._lookup(key)[0] != data:
+                return False
+            self.delete(key)
+            return True
+
+    def delete(self, key: str) -> None:
+        """Remove an item from cache (if present)"""
+        if self.backend is not None:
+            self.backend.delete(key)
+        else:
+            with self._lock:
+                self._remove(key)
+
     def clear_expired(self) -> None:
-        """Clear expired items from cache"""
+        """Clear expired items from cache (the slots of the timing wheel that have passed)"""
         current_time = time.time()
-        expired_keys = [
-            key for key, item in self.cache.items() 
-            if current_time >= item['expires']
-        ]
-        for key in expired_keys:
-            del self.cache[key]
-    
+        if self.backend is not None:
+            self.backend.clear_expired(current_time)
+            return
+
+        current_slot = self._slot(current_time)
+        with self._lock:
+            for slot_number in range(self._swept_until, current_slot):
+                for key in self._slots.pop(slot_number, ()):
+                    item = self.cache.pop(key)
+                    self.total_bytes -= item['size']
+                    self._count(key, "expirations")
+            self._swept_until = max(self._swept_until, current_slot)
+
     def clear_all(self) -> None:
         """Clear all items from cache"""
-        self.cache.clear()
-    
+        if self.backend is not None:
+            self.backend.clear_all()
+        with self._lock:
+            self.cache.clear()
+            self._slots.clear()
+            self.total_bytes = 0
+
+    def items(self) -> List[Tuple[str, Dict[str, Any]]]:
+        """
+        Unexpired in-memory items as (key, item), least recently used first (for snapshots)
+
+        Items are {'data', 'fresh_until', 'expires', 'created'}, with 'packed' set if
+        'data' is a cache_codec.pack() encoding. They must not be modified.
+        """
+        now = time.time()
+        with self._lock:
+            return [(key, item) for key, item in self.cache.items() if now < item['expires']]
+
+    def restore(self, key: str, data: Any, fresh_until: float, expires: float, created: float,
+                packed: bool = False) -> bool:
+        """Insert an item with the absolute expiry times it was saved with; False if it has expired"""
+        if self.backend is not None or time.time() >= expires:
+            return False
+        item = {'data': data, 'fresh_until': fresh_until, 'expires': expires, 'created': created}
+        if packed:
+            item['packed'] = True
+        return self._store(key, item)
+
     def get_stats(self) -> Dict[str, Any]:
-        """Get cache statistics"""
-        current_time = time.time()
-        active_items = sum(
-            1 for item in self.cache.values() 
-            if current_time < item['expires']
-        )
-        expired_items = len(self.cache) - active_items
-        
-        return {
-            'total_items': len(self.cache),
-            'active_items': active_items,
-            'expired_items': expired_items,
-            'memory_usage_estimate': sum(
-                len(str(item['data'])) for item in self.cache.values()
+        """Get cache statistics (constant-time for the in-memory store)"""
+        with self._stats_lock:
+            counters = {
+                'hits': self.hits,
+                'misses': self.misses,
+                'computations': self.computations,
+                'coalesced': self.coalesced,
+                'stale_served': self.stale_served,
+                'refreshes': self.refreshes,
+                'sets': self.sets,
+                'avg_get_ms': self._average_ms(self.get_seconds, self.hits + self.misses + self.stale_served),
+            }
+        if self.backend is not None:
+            return {**self.backend.stats(time.time()), **counters}
+
+        with self._lock:
+            # Items in slots the sweeper has not reached yet (at most a slot or two)
+            expired_items = sum(
+                len(self._slots.get(slot_number, ()))
+                for slot_number in range(self._swept_until, self._slot(time.time()))
             )
-        }
+            return {
+                'total_items': len(self.cache),
+                'active_items': len(self.cache) - expired_items,
+                'expired_items': expired_items,
+                'memory_usage_estimate': self.total_bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                **counters,
+                'evictions': self.evictions,
+                'evicted_bytes': self.evicted_bytes,
+                'expirations': self.expirations,
+                'oversized_items': self.oversized,
+            }
+
+    @staticmethod
+    def _average_ms(seconds: float, count: float) -> Optional[float]:
+        return round(seconds * 1000 / count, 4) if count else None
+
+    def prefix_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Counters per key prefix, with hit rate, average stored value size and lookup time"""
+        with self._stats_lock:
+            prefixes = {prefix: dict(counters) for prefix, counters in self._prefixes.items()}
+        for counters in prefixes.values():
+            lookups = counters["hits"] + counters["misses"] + counters["stale_served"]
+            counters["hit_rate"] = round((counters["hits"] + counters["stale_served"]) / lookups, 4) if lookups else None
+            counters["avg_value_bytes"] = round(counters["set_bytes"] / counters["sets"]) if counters["sets"] else None
+            counters["avg_get_ms"] = self._average_ms(counters["get_seconds"], lookups)
+        return prefixes
+
+_registry: "weakref.WeakValueDictionary[str, SimpleCache]" = weakref.WeakValueDictionary()
+
+def registered_caches() -> Dict[str, SimpleCache]:
+    """Caches created with a name, by name"""
+    return dict(sorted(_registry.items()))
+
+def cached(cache: SimpleCache, key: Callable[..., Optional[str]], ttl_policy: Optional[TtlPolicy] = None):
+    """
+    Decorate a coroutine function so its results are cached with get_or_compute().
+
+    Args:
+        cache (SimpleCache): The cache to use.
+        key: Called with the function's arguments; returns the cache key, or None to
+            call the function without caching.
+        ttl_policy (TtlPolicy, optional): TTL by outcome of the result.
+
+        @cached(ip_info_cache, lambda ip: ip_info_cache._generate_key("geo", ip))
+        async def lookup(ip):
+            ...
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            cache_key = key(*args, **kwargs)
+            if cache_key is None:
+                return await func(*args, **kwargs)
+            return await cache.get_or_compute(cache_key, lambda: func(*args, **kwargs), ttl_policy)
+        return wrapper
+    return decorator
+
+# Optional persistent storage for the external-API caches. When CACHE_SQLITE_PATH is
+# set, entries survive restarts and are shared by all workers on the host; paid
+# VirusTotal/AbuseIPDB lookups are then not repeated after a deploy or worker recycle.
+CACHE_SQLITE_PATH = os.getenv("CACHE_SQLITE_PATH")
+
+# Optional shared memory for the lookup caches. When CACHE_SHM_DIR is set (ideally on
+# tmpfs, e.g. /dev/shm/dmarc-checker), caches without SQLite storage keep their entries
+# in memory-mapped tables shared by all workers on the host, so an entry fetched by one
+# worker is a hit for the others.
+CACHE_SHM_DIR = os.getenv("CACHE_SHM_DIR")
+CACHE_SHM_SLOTS = int(os.getenv("CACHE_SHM_SLOTS", "4096"))
+CACHE_SHM_SLOT_SIZE = int(os.getenv("CACHE_SHM_SLOT_SIZE", "8192"))
+
+# Optional cache shared by every node. When CACHE_REDIS_URL is set (redis://[:password@]
+# host:port/db), the lookup caches live in Redis, so hit rates hold up when traffic is
+# spread across several hosts; each worker keeps a near-cache of recent entries for
+# CACHE_REDIS_NEAR_TTL seconds in front of it.
+CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL")
+CACHE_REDIS_NEAR_TTL = float(os.getenv("CACHE_REDIS_NEAR_TTL", "2"))
+CACHE_REDIS_TIMEOUT = float(os.getenv("CACHE_REDIS_TIMEOUT", "0.5"))
+
+def _shared_backend(namespace: str, persistent: bool = True) -> Optional[Any]:
+    if CACHE_REDIS_URL:
+        return RedisBackend(CACHE_REDIS_URL, namespace, near_ttl=CACHE_REDIS_NEAR_TTL, timeout=CACHE_REDIS_TIMEOUT)
+    if persistent and CACHE_SQLITE_PATH:
+        return SqliteBackend(CACHE_SQLITE_PATH, namespace)
+    if CACHE_SHM_DIR:
+        return MmapBackend(os.path.join(CACHE_SHM_DIR, f"{namespace}.mmap"), CACHE_SHM_SLOTS, CACHE_SHM_SLOT_SIZE)
+    return None
 
 # Global cache instances
-ip_info_cache = SimpleCache(default_ttl=600)  # 10 minutes for IP info
-reputation_cache = SimpleCache(default_ttl=300)  # 5 minutes for reputation data
-external_api_cache = SimpleCache(default_ttl=900)  # 15 minutes for external APIs (they're slower to change)
+ip_info_cache = SimpleCache(default_ttl=600, backend=_shared_backend("ip_info"), stale_ttl=CACHE_STALE_TTL, name="ip_info", compact=CACHE_COMPACT_VALUES)  # 10 minutes for IP info
+reputation_cache = SimpleCache(default_ttl=300, backend=_shared_backend("reputation", persistent=False), name="reputation", compact=CACHE_COMPACT_VALUES)  # 5 minutes for reputation data
+external_api_cache = SimpleCache(default_ttl=900, backend=_shared_backend("external_api"), stale_ttl=CACHE_STALE_TTL, name="external_api", compact=CACHE_COMPACT_VALUES)  # 15 minutes for external APIs (they're slower to change)
+breach_cache = SimpleCache(default_ttl=3600, name="breach", compact=CACHE_COMPACT_VALUES)  # 1 hour for HIBP per-email breach names
+domain_intel_cache = SimpleCache(default_ttl=1800, name="domain_intel", compact=CACHE_COMPACT_VALUES)  # 30 minutes for merged OSINT provider results
@@ -0,0 +1,715 @@
+#!/usr/bin/env python3
+"""
+Storage backends for SimpleCache
+
+A backend stores cache entries (the same dicts SimpleCache keeps in memory:
+{'data', 'expires', 'created', ...}) somewhere other than the process heap, so that
+entries survive worker restarts and can be shared between worker processes.
+
+Backend interface:
+    get_entry(key) -> Optional[dict]    entry or None (expired entries may be returned;
+                                        SimpleCache checks 'expires' itself)
+    set_entry(key, entry) -> bool       False if the entry could not be stored
+    delete(key) -> None
+    clear_expired(now) -> int           number of entries removed
+    clear_all() -> None
+    stats(now) -> dict                  total/active/expired counts and stored bytes
+
+Networked backends also implement get_entries(keys) -> {key: Optional[dict]} and
+set_entries({key: entry}) -> int, which SimpleCache.get_many()/set_many() use to batch
+several keys into one round trip.
+
+SqliteBackend also implements add_entry(key, entry) -> bool and delete_entry_if(key, data)
+-> bool, which make SimpleCache.add()/delete_if() atomic across processes.
+"""
+import hashlib
+import json
+import logging
+import mmap
+import os
+import socket
+import sqlite3
+import struct
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional, Tuple
+from urllib.parse import unquote, urlparse
+
+import cache_codec
+
+
+class SqliteBackend:
+    """
+    SQLite (WAL mode) backend shared by every worker process on a host.
+
+    Connections are opened lazily on first access, one per thread and process, so the
+    backend is safe to create at import time and across gunicorn forks. Expired rows are
+    removed by a background compactor thread started alongside the first connection.
+    """
+
+    COMPACT_INTERVAL = 300  # seconds between compaction passes
+
+    def __init__(self, path: str, namespace: str, compact_interval: Optional[int] = None):
+        self.path = path
+        self.namespace = namespace
+        self.compact_interval = compact_interval or self.COMPACT_INTERVAL
+        self._local = threading.local()
+        self._pid: Optional[int] = None
+        self._init_lock = threading.Lock()
+        self._compactor: Optional[threading.Thread] = None
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and getattr(self._local, "pid", None) == os.getpid():
+            return conn
+
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=5000")
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        self._ensure_schema_and_compactor(conn)
+        return conn
+
+    def _ensure_schema_and_compactor(self, conn: sqlite3.Connection) -> None:
+        with self._init_lock:
+            if self._pid == os.getpid():
+                return
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache_entries ("
+                " namespace TEXT NOT NULL,"
+                " key TEXT NOT NULL,"
+                " entry TEXT NOT NULL,"
+                " expires REAL NOT NULL,"
+                " PRIMARY KEY (namespace, key))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS cache_entries_expires ON cache_entries (expires)")
+            # Threads do not survive fork, so each process starts its own compactor
+            self._pid = os.getpid()
+            self._compactor = threading.Thread(
+                target=self._compact_loop, name=f"cache-compactor-{self.namespace}", daemon=True
+            )
+            self._compactor.start()
+
+    def _compact_loop(self) -> None:
+        while True:
+            time.sleep(self.compact_interval)
+            removed = self.clear_expired(time.time())  # logs its own errors
+            if removed:
+                logging.debug(f"Cache compactor removed {removed} expired '{self.namespace}' rows")
+
+    def get_entry(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            row = self._connection().execute(
+                "SELECT entry FROM cache_entries WHERE namespace = ? AND key = ?",
+                (self.namespace, key),
+            ).fetchone()
+        except sqlite3.Error as e:
+            logging.warning(f"SQLite cache read failed for '{self.namespace}': {e}")
+            return None
+        return json.loads(row[0]) if row else None
+
+    def set_entry(self, key: str, entry: Dict[str, Any]) -> bool:
+        try:
+            payload = json.dumps(entry, separators=(",", ":"))
+        except (TypeError, ValueError) as e:
+            logging.debug(f"Value for {key} is not JSON-serializable, not cached: {e}")
+            return False
+        try:
+            self._connection().execute(
+                "INSERT OR REPLACE INTO cache_entries (namespace, key, entry, expires) VALUES (?, ?, ?, ?)",
+                (self.namespace, key, payload, entry["expires"]),
+            )
+        except sqlite3.Error as e:
+            logging.warning(f"SQLite cache write failed for '{self.namespace}': {e}")
+            return False
+        return True
+
+    def add_entry(self, key: str, entry: Dict[str, Any]) -> bool:
+        """Store an entry unless the key holds an unexpired one, atomically across processes."""
+        try:
+            payload = json.dumps(entry, separators=(",", ":"))
+        except (TypeError, ValueError) as e:
+            logging.debug(f"Value for {key} is not JSON-serializable, not cached: {e}")
+            return False
+        try:
+            cursor = self._connection().execute(
+                "INSERT INTO cache_entries (namespace, key, entry, expires) VALUES (?, ?, ?, ?)"
+                " ON CONFLICT (namespace, key) DO UPDATE SET entry = excluded.entry, expires = excluded.expires"
+                " WHERE cache_entries.expires <= ?",
+                (self.namespace, key, payload, entry["expires"], time.time()),
+            )
+        except sqlite3.Error as e:
+            logging.warning(f"SQLite cache write failed for '{self.namespace}': {e}")
+            return False
+        return cursor.rowcount == 1
+
+    def delete_entry_if(self, key: str, data: Any) -> bool:
+        """Delete the entry of a key only if its data equals `data`, atomically across processes."""
+        try:
+            conn = self._connection()
+            # IMMEDIATE takes the write lock up front, so no other process can change the row in between
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT entry FROM cache_entries WHERE namespace = ? AND key = ?", (self.namespace, key)
+                ).fetchone()
+                matches = row is not None and json.loads(row[0]).get("data") == data
+                if matches:
+                    conn.execute("DELETE FROM cache_entries WHERE namespace = ? AND key = ?", (self.namespace, key))
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        except sqlite3.Error as e:
+            logging.warning(f"SQLite cache delete failed for '{self.namespace}': {e}")
+            return False
+        return matches
+
+    def delete(self, key: str) -> None:
+        try:
+            self._connection().execute(
+                "DELETE FROM cache_entries WHERE namespace = ? AND key = ?", (self.namespace, key)
+            )
+        except sqlite3.Error as e:
+            logging.warning(f"SQLite cache delete failed for '{self.namespace}': {e}")
+
+    def clear_expired(self, now: float) -> int:
+        try:
+            cursor = self._connection().execute(
+                "DELETE FROM cache_entries WHERE namespace = ? AND expires <= ?", (self.namespace, now)
+            )
+        except sqlite3.Error as e:
+            logging.warning(f"SQLite cache cleanup failed for '{self.namespace}': {e}")
+            return 0
+        return cursor.rowcount
+
+    def clear_all(self) -> None:
+        try:
+            self._connection().execute("DELETE FROM cache_entries WHERE namespace = ?", (self.namespace,))
+        except sqlite3.Error as e:
+            logging.warning(f"SQLite cache clear failed for '{self.namespace}': {e}")
+
+    def stats(self, now: float) -> Dict[str, Any]:
+        try:
+            total, active, size = self._connection().execute(
+                "SELECT COUNT(*), COALESCE(SUM(expires > ?), 0), COALESCE(SUM(LENGTH(entry)), 0)"
+                " FROM cache_entries WHERE namespace = ?",
+                (now, self.namespace),
+            ).fetchone()
+        except sqlite3.Error as e:
+            logging.warning(f"SQLite cache stats failed for '{self.namespace}': {e}")
+            return {"backend": "sqlite", "error": str(e)}
+        return {
+            "total_items": total,
+            "active_items": active,
+            "expired_items": total - active,
+            "memory_usage_estimate": size,
+            "backend": "sqlite",
+        }
+
+
+try:
+    import fcntl  # POSIX only; without it only threads of one process are serialized
+except ImportError:  # Windows development setups
+    fcntl = None
+
+
+class MmapBackend:
+    """
+    Memory-mapped hash table shared by every worker process on a host.
+
+    The table lives in a file (put it on tmpfs, e.g. /dev/shm, to keep it in RAM) with a
+    fixed number of fixed-size slots. A key hashes to a slot and is stored in the first
+    free, deleted or expired slot of a short probe sequence; when all of them are in
+    use, the one expiring soonest is overwritten. Entries are stored as JSON, so values
+    larger than a slot are not cached.
+
+    Writers are serialized with a thread lock plus an flock on the file; readers take no
+    lock and use a per-slot version counter (seqlock) to detect torn reads. The file is
+    mapped lazily, once per process, so the backend is safe to create before a fork.
+    """
+
+    MAGIC = b"DMCC"
+    FILE_HEADER = struct.Struct("<4sIII")  # magic, format version, slot count, slot size
+    SLOT_HEADER = struct.Struct("<IB3xQdII")  # version, state, key hash, expires, key length, value length
+    FORMAT_VERSION = 1
+    EMPTY, USED, DELETED = 0, 1, 2
+    PROBE_LIMIT = 8
+    READ_RETRIES = 4
+
+    def __init__(self, path: str, slots: int = 4096, slot_size: int = 8192):
+        self.path = path
+        self.slots = slots
+        self.slot_size = slot_size
+        self.capacity = slot_size - self.SLOT_HEADER.size
+        self._map: Optional[mmap.mmap] = None
+        self._fd: Optional[int] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    # --- Mapping ---
+    def _mapping(self) -> mmap.mmap:
+        if self._map is not None and self._pid == os.getpid():
+            return self._map
+        with self._lock:
+            if self._map is not None and self._pid == os.getpid():
+                return self._map
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            size = self.FILE_HEADER.size + self.slots * self.slot_size
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            self._flock(fd, True)
+            try:
+                os.lseek(fd, 0, os.SEEK_SET)
+                header = os.read(fd, self.FILE_HEADER.size)
+                expected = self.FILE_HEADER.pack(self.MAGIC, self.FORMAT_VERSION, self.slots, self.slot_size)
+                if header != expected:
+                    # New file, or created with another layout: start over with an empty table
+                    os.ftruncate(fd, 0)
+                    os.ftruncate(fd, size)
+                    os.lseek(fd, 0, os.SEEK_SET)
+                    os.write(fd, expected)
+            finally:
+                self._flock(fd, False)
+            self._fd = fd
+            self._map = mmap.mmap(fd, size)
+            self._pid = os.getpid()
+            return self._map
+
+    @staticmethod
+    def _flock(fd: int, exclusive: bool) -> None:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_UN)
+
+    @contextmanager
+    def _write_locked(self) -> Iterator[mmap.mmap]:
+        """The mapping, with writes excluded for other threads and processes."""
+        mapping = self._mapping()
+        with self._lock:
+            self._flock(self._fd, True)
+            try:
+                yield mapping
+            finally:
+                self._flock(self._fd, False)
+
+    # --- Slots ---
+    def _offset(self, index: int) -> int:
+        return self.FILE_HEADER.size + index * self.slot_size
+
+    @staticmethod
+    def _hash(key: bytes) -> int:
+        return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), "little")
+
+    def _probe(self, key_hash: int):
+        start = key_hash % self.slots
+        return ((start + i) % self.slots for i in range(min(self.PROBE_LIMIT, self.slots)))
+
+    def _read_header(self, mapping: mmap.mmap, index: int):
+        return self.SLOT_HEADER.unpack_from(mapping, self._offset(index))
+
+    def _write_slot(self, mapping: mmap.mmap, index: int, state: int, key_hash: int,
+                    expires: float, key: bytes, value: bytes) -> None:
+        offset = self._offset(index)
+        version = self.SLOT_HEADER.unpack_from(mapping, offset)[0]
+        # Odd version while the slot is being rewritten; readers retry
+        struct.pack_into("<I", mapping, offset, (version + 1) & 0xFFFFFFFF)
+        body = offset + self.SLOT_HEADER.size
+        mapping[body:body + len(key) + len(value)] = key + value
+        self.SLOT_HEADER.pack_into(
+            mapping, offset, (version + 2) & 0xFFFFFFFF, state, key_hash, expires, len(key), len(value)
+        )
+
+    def _set_state(self, mapping: mmap.mmap, index: int, state: int) -> None:
+        offset = self._offset(index)
+        version, _, key_hash, expires, key_len, value_len = self.SLOT_HEADER.unpack_from(mapping, offset)
+        struct.pack_into("<I", mapping, offset, (version + 1) & 0xFFFFFFFF)
+        self.SLOT_HEADER.pack_into(
+            mapping, offset, (version + 2) & 0xFFFFFFFF, state, key_hash, expires, key_len, value_len
+        )
+
+    def _find(self, mapping: mmap.mmap, key: bytes, key_hash: int) -> Optional[int]:
+        """Index of the slot holding `key` (caller holds the write lock)."""
+        for index in self._probe(key_hash):
+            _, state, slot_hash, _, key_len, _ = self._read_header(mapping, index)
+            if state == self.EMPTY:
+                return None
+            if state == self.USED and slot_hash == key_hash:
+                body = self._offset(index) + self.SLOT_HEADER.size
+                if mapping[body:body + key_len] == key:
+                    return index
+        return None
+
+    # --- Backend interface ---
+    def get_entry(self, key: str) -> Optional[Dict[str, Any]]:
+        mapping = self._mapping()
+        key_bytes = key.encode("utf-8")
+        key_hash = self._hash(key_bytes)
+        for index in self._probe(key_hash):
+            offset = self._offset(index)
+            for _ in range(self.READ_RETRIES):
+                version, state, slot_hash, _, key_len, value_len = self.SLOT_HEADER.unpack_from(mapping, offset)
+                if version & 1:
+                    continue  # being written
+                if state != self.USED or slot_hash != key_hash:
+                    value = None
+                else:
+                    body = offset + self.SLOT_HEADER.size
+                    data = mapping[body:body + key_len + value_len]
+                    value = data[key_len:] if data[:key_len] == key_bytes else None
+                if struct.unpack_from("<I", mapping, offset)[0] == version:
+                    break
+            else:
+                return None  # slot kept changing under us; treat as a miss
+            if state == self.EMPTY:
+                return None
+            if value is not None:
+                try:
+                    return json.loads(value)
+                except ValueError:
+                    return None
+        return None
+
+    def set_entry(self, key: str, entry: Dict[str, Any]) -> bool:
+        try:
+            value = json.dumps(entry, separators=(",", ":")).encode("utf-8")
+        except (TypeError, ValueError) as e:
+            logging.debug(f"Value for {key} is not JSON-serializable, not cached: {e}")
+            return False
+        key_bytes = key.encode("utf-8")
+        if len(key_bytes) + len(value) > self.capacity:
+            logging.debug(f"Value for {key} ({len(value)} bytes) does not fit a shared cache slot, not cached")
+            return False
+
+        key_hash = self._hash(key_bytes)
+        now = time.time()
+        with self._write_locked() as mapping:
+            target = self._find(mapping, key_bytes, key_hash)
+            if target is None:
+                soonest = None
+                for index in self._probe(key_hash):
+                    _, state, _, expires, _, _ = self._read_header(mapping, index)
+                    if state != self.USED or expires <= now:
+                        target = index
+                        break
+                    if soonest is None or expires < soonest[1]:
+                        soonest = (index, expires)
+                if target is None:
+                    target = soonest[0]  # evict the entry expiring soonest
+            self._write_slot(mapping, target, self.USED, key_hash, entry["expires"], key_bytes, value)
+        return True
+
+    def delete(self, key: str) -> None:
+        key_bytes = key.encode("utf-8")
+        with self._write_locked() as mapping:
+            index = self._find(mapping, key_bytes, self._hash(key_bytes))
+            if index is not None:
+                self._set_state(mapping, index, self.DELETED)
+
+    def clear_expired(self, now: float) -> int:
+        removed = 0
+        with self._write_locked() as mapping:
+            for index in range(self.slots):
+                _, state, _, expires, _, _ = self._read_header(mapping, index)
+                if state == self.USED and expires <= now:
+                    self._set_state(mapping, index, self.DELETED)
+                    removed += 1
+        return removed
+
+    def clear_all(self) -> None:
+        with self._write_locked() as mapping:
+            for index in range(self.slots):
+                _, state, _, _, _, _ = self._read_header(mapping, index)
+                if state != self.EMPTY:
+                    self._set_state(mapping, index, self.EMPTY)
+
+    def stats(self, now: float) -> Dict[str, Any]:
+        mapping = self._mapping()
+        total = active = size = 0
+        for index in range(self.slots):
+            _, state, _, expires, _, value_len = self._read_header(mapping, index)
+            if state == self.USED:
+                total += 1
+                active += expires > now
+                size += value_len
+        return {
+            "total_items": total,
+            "active_items": active,
+            "expired_items": total - active,
+            "memory_usage_estimate": size,
+            "backend": "mmap",
+            "slots": self.slots,
+            "slot_size": self.slot_size,
+        }
+
+
+class RedisError(Exception):
+    """Error reply from a Redis server."""
+    pass
+
+
+class RedisBackend:
+    """
+    Networked backend for the Redis protocol (RESP), shared by every app instance.
+
+    Entries are stored under "cache:<namespace>:<key>" in the compact binary encoding
+    of cache_codec.py with a server-side expiry, so clear_expired() has nothing to do.
+    Multi-key reads and writes (get_entries/set_entries, used by SimpleCache.get_many/
+    set_many) are pipelined: all commands are sent in one write and the replies read
+    back together, costing one round trip.
+
+    A small near-cache keeps recently read and written entries in process memory for
+    `near_ttl` seconds, so hot keys do not cross the network on every request. Another
+    instance's change to a key becomes visible here once the near-cache entry expires.
+
+    Connections are opened lazily, one per thread and process. Network and server
+    errors are logged and treated as misses (or failed writes); for RETRY_DELAY seconds
+    after a failure the server is not contacted at all, so an unreachable server does
+    not add a connect timeout to every lookup.
+    """
+
+    SCAN_COUNT = 500
+    RETRY_DELAY = 1.0
+
+    def __init__(self, url: str, namespace: str, near_ttl: float = 2.0, near_max_entries: int = 1024,
+                 timeout: float = 0.5):
+        parsed = urlparse(url)
+        if parsed.scheme not in ("redis", ""):
+            raise ValueError(f"Unsupported cache URL scheme: {parsed.scheme}")
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = unquote(parsed.password) if parsed.password else None
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.namespace = namespace
+        self.prefix = f"cache:{namespace}:"
+        self.timeout = timeout
+        self.near_ttl = near_ttl
+        self.near_max_entries = near_max_entries
+        self._near: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._near_lock = threading.Lock()
+        self._local = threading.local()
+        self._retry_at = 0.0
+
+    # --- Connection and protocol ---
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and getattr(self._local, "pid", None) == os.getpid():
+            return conn
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        conn = (sock, sock.makefile("rb"))
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        setup = []
+        if self.password:
+            setup.append(("AUTH", self.password))
+        if self.db:
+            setup.append(("SELECT", str(self.db)))
+        if setup:
+            for reply in self._pipeline(setup):
+                if isinstance(reply, RedisError):
+                    self._disconnect()
+                    raise reply
+        return conn
+
+    def _disconnect(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        self._local.conn = None
+        if conn is not None and getattr(self._local, "pid", None) == os.getpid():
+            try:
+                conn[1].close()
+                conn[0].close()
+            except OSError:
+                pass
+
+    @staticmethod
+    def _pack(command) -> bytes:
+        parts = [f"*{len(command)}\r\n".encode()]
+        for arg in command:
+            if isinstance(arg, str):
+                arg = arg.encode("utf-8")
+            parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+        return b"".join(parts)
+
+    @classmethod
+    def _read_reply(cls, reader):
+        line = reader.readline()
+        if not line.endswith(b"\r\n"):
+            raise ConnectionError("Connection closed by the cache server")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest.decode()
+        if kind == b"-":
+            return RedisError(rest.decode())
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            length = int(rest)
+            if length < 0:
+                return None
+            data = reader.read(length + 2)
+            if len(data) != length + 2:
+                raise ConnectionError("Connection closed by the cache server")
+            return data[:-2]
+        if kind == b"*":
+            count = int(rest)
+            return None if count < 0 else [cls._read_reply(reader) for _ in range(count)]
+        raise ConnectionError(f"Unexpected reply from the cache server: {line[:40]!r}")
+
+    def _pipeline(self, commands):
+        """Send all commands in one write and return their replies (errors as RedisError)."""
+        sock, reader = self._connection()
+        try:
+            sock.sendall(b"".join(self._pack(command) for command in commands))
+            return [self._read_reply(reader) for _ in commands]
+        except (OSError, ValueError):
+            # A half-read pipeline leaves the connection out of sync; start over next time
+            self._disconnect()
+            raise
+
+    def _call(self, commands, default):
+        if time.monotonic() < self._retry_at:
+            return default
+        try:
+            return self._pipeline(commands)
+        except (OSError, ValueError, RedisError) as e:
+            self._retry_at = time.monotonic() + self.RETRY_DELAY
+            logging.warning(f"Redis cache request failed for '{self.namespace}': {e}")
+            return default
+
+    # --- Near-cache ---
+    def _near_get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._near_lock:
+            cached = self._near.get(key)
+            if cached is None:
+                return None
+            if cached[0] <= time.time():
+                del self._near[key]
+                return None
+            self._near.move_to_end(key)
+            return cached[1]
+
+    def _near_set(self, key: str, entry: Dict[str, Any]) -> None:
+        if self.near_ttl <= 0:
+            return
+        with self._near_lock:
+            self._near[key] = (min(time.time() + self.near_ttl, entry["expires"]), entry)
+            self._near.move_to_end(key)
+            while len(self._near) > self.near_max_entries:
+                self._near.popitem(last=False)
+
+    def _near_discard(self, key: Optional[str] = None) -> None:
+        with self._near_lock:
+            if key is None:
+                self._near.clear()
+            else:
+                self._near.pop(key, None)
+
+    # --- Backend interface ---
+    def _decode(self, key: str, raw: Optional[bytes]) -> Optional[Dict[str, Any]]:
+        if raw is None or isinstance(raw, RedisError):
+            return None
+        try:
+            entry = cache_codec.decode_entry(raw)
+        except ValueError as e:
+            logging.warning(f"Undecodable Redis cache entry for {key}: {e}")
+            return None
+        self._near_set(key, entry)
+        return entry
+
+    def get_entry(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self._near_get(key)
+        if entry is not None:
+            return entry
+        replies = self._call([("GET", self.prefix + key)], [None])
+        return self._decode(key, replies[0])
+
+    def get_entries(self, keys) -> Dict[str, Optional[Dict[str, Any]]]:
+        """Entries of several keys, fetched with one MGET for those not in the near-cache."""
+        entries = {key: self._near_get(key) for key in keys}
+        missing = [key for key, entry in entries.items() if entry is None]
+        if missing:
+            replies = self._call([("MGET", *(self.prefix + key for key in missing))], [[None] * len(missing)])
+            values = replies[0] if isinstance(replies[0], list) else [None] * len(missing)
+            for key, raw in zip(missing, values):
+                entries[key] = self._decode(key, raw)
+        return entries
+
+    def _set_command(self, key: str, entry: Dict[str, Any]):
+        try:
+            value = cache_codec.encode_entry(entry)
+        except TypeError as e:
+            logging.debug(f"Value for {key} cannot be encoded, not cached: {e}")
+            return None
+        ttl_ms = int((entry["expires"] - time.time()) * 1000)
+        if ttl_ms <= 0:
+            return None
+        return ("SET", self.prefix + key, value, "PX", str(ttl_ms))
+
+    def set_entry(self, key: str, entry: Dict[str, Any]) -> bool:
+        return self.set_entries({key: entry}) == 1
+
+    def set_entries(self, entries: Dict[str, Dict[str, Any]]) -> int:
+        """Store several entries in one pipelined round trip; returns how many were stored."""
+        commands, keys = [], []
+        for key, entry in entries.items():
+            command = self._set_command(key, entry)
+            if command is not None:
+                commands.append(command)
+                keys.append(key)
+        if not commands:
+            return 0
+        stored = 0
+        for key, reply in zip(keys, self._call(commands, [None] * len(commands))):
+            if reply == "OK":
+                self._near_set(key, entries[key])
+                stored += 1
+            else:
+                self._near_discard(key)
+        return stored
+
+    def delete(self, key: str) -> None:
+        self._near_discard(key)
+        self._call([("DEL", self.prefix + key)], None)
+
+    def clear_expired(self, now: float) -> int:
+        # The server expires keys itself; only the near-cache needs pruning
+        with self._near_lock:
+            expired = [key for key, (expires, _) in self._near.items() if expires <= now]
+            for key in expired:
+                del self._near[key]
+        return 0
+
+    def _scan_keys(self):
+        cursor = "0"
+        while True:
+            replies = self._call([("SCAN", cursor, "MATCH", f"{self.prefix}*", "COUNT", str(self.SCAN_COUNT))], None)
+            if not replies or not isinstance(replies[0], list):
+                return
+            cursor, keys = replies[0][0].decode(), replies[0][1]
+            yield keys
+            if cursor == "0":
+                return
+
+    def clear_all(self) -> None:
+        self._near_discard()
+        for keys in self._scan_keys():
+            if keys:
+                self._call([("DEL", *keys)], None)
+
+    def stats(self, now: float) -> Dict[str, Any]:
+        total = sum(len(keys) for keys in self._scan_keys())
+        with self._near_lock:
+            near_items = len(self._near)
+        return {
+            "total_items": total,
+            "active_items": total,
+            "expired_items": 0,
+            "memory_usage_estimate": None,
+            "backend": "redis",
+            "near_cache_items": near_items,
+        }
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+Compact binary encoding of cache entries
+
+Used by cache backends that ship entries over the network (RedisBackend), where JSON
+text is needlessly large. Values are encoded with a one-byte type tag followed by
+the payload; integers and lengths use zigzag/LEB128 varints, so the small counters and
+scores that make up most provider results take one or two bytes.
+
+Supported value types are those JSON supports (None, bool, int, float, str, list,
+dict) plus bytes; tuples are encoded as lists. Anything else raises TypeError, like
+json.dumps would, and the backend then skips caching that value.
+
+pack() adds a one-byte compression marker: encodings of at least `compress_threshold`
+bytes are compressed with zlib (or lz4, if installed and requested) when that makes
+them smaller. SimpleCache(compact=True) keeps its in-memory values packed this way, and
+entries sent to Redis are packed with COMPRESS_THRESHOLD.
+
+    encode_entry({'data': ..., 'expires': ..., 'created': ..., 'fresh_until': ...}) -> bytes
+    decode_entry(bytes) -> dict
+    pack(value, compress_threshold=1024, compression="zlib") -> bytes
+    unpack(bytes) -> value
+"""
+import struct
+import zlib
+from typing import Any, Dict, Optional, Tuple
+
+try:
+    import lz4.frame as lz4_frame  # optional; faster than zlib at a lower ratio
+except ImportError:
+    lz4_frame = None
+
+FORMAT_VERSION = 3
+# Encoded values from this many bytes on are compressed by encode_entry()
+COMPRESS_THRESHOLD = 1024
+
+_NONE, _FALSE, _TRUE, _INT, _FLOAT, _STR, _BYTES, _LIST, _DICT = range(9)
+_PLAIN, _ZLIB, _LZ4 = range(3)  # pack() compression markers
+_DOUBLE = struct.Struct("<d")
+_ENTRY_HEADER = struct.Struct("<Bddd")  # format version, expires, created, fresh until
+
+
+def _write_varint(out: bytearray, value: int) -> None:
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(buffer: bytes, offset: int) -> Tuple[int, int]:
+    result = shift = 0
+    while True:
+        byte = buffer[offset]
+        offset += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result, offset
+        shift += 7
+
+
+def _encode(value: Any, out: bytearray) -> None:
+    if value is None:
+        out.append(_NONE)
+    elif value is True:
+        out.append(_TRUE)
+    elif value is False:
+        out.append(_FALSE)
+    elif isinstance(value, int):
+        out.append(_INT)
+        # Zigzag: small negative numbers stay small
+        _write_varint(out, value * 2 if value >= 0 else -value * 2 - 1)
+    elif isinstance(value, float):
+        out.append(_FLOAT)
+        out += _DOUBLE.pack(value)
+    elif isinstance(value, str):
+        data = value.encode("utf-8")
+        out.append(_STR)
+        _write_varint(out, len(data))
+        out += data
+    elif isinstance(value, (bytes, bytearray)):
+        out.append(_BYTES)
+        _write_varint(out, len(value))
+        out += value
+    elif isinstance(value, (list, tuple)):
+        out.append(_LIST)
+        _write_varint(out, len(value))
+        for item in value:
+            _encode(item, out)
+    elif isinstance(value, dict):
+        out.append(_DICT)
+        _write_varint(out, len(value))
+        for key, item in value.items():
+            _encode(key, out)
+            _encode(item, out)
+    else:
+        raise TypeError(f"Object of type {type(value).__name__} cannot be cache-encoded")
+
+
+def _decode(buffer: bytes, offset: int) -> Tuple[Any, int]:
+    tag = buffer[offset]
+    offset += 1
+    if tag == _NONE:
+        return None, offset
+    if tag == _TRUE:
+        return True, offset
+    if tag == _FALSE:
+        return False, offset
+    if tag == _INT:
+        raw, offset = _read_varint(buffer, offset)
+        return (raw >> 1) if not raw & 1 else -((raw + 1) >> 1), offset
+    if tag == _FLOAT:
+        return _DOUBLE.unpack_from(buffer, offset)[0], offset + _DOUBLE.size
+    if tag in (_STR, _BYTES):
+        length, offset = _read_varint(buffer, offset)
+        data = bytes(buffer[offset:offset + length])
+        return (data.decode("utf-8") if tag == _STR else data), offset + length
+    if tag == _LIST:
+        count, offset = _read_varint(buffer, offset)
+        items = []
+        for _ in range(count):
+            item, offset = _decode(buffer, offset)
+            items.append(item)
+        return items, offset
+    if tag == _DICT:
+        count, offset = _read_varint(buffer, offset)
+        result = {}
+        for _ in range(count):
+            key, offset = _decode(buffer, offset)
+            result[key], offset = _decode(buffer, offset)
+        return result, offset
+    raise ValueError(f"Unknown cache encoding tag {tag}")
+
+
+def encode(value: Any) -> bytes:
+    """Encode a value. Raises TypeError for unsupported types."""
+    out = bytearray()
+    _encode(value, out)
+    return bytes(out)
+
+
+def decode(data: bytes) -> Any:
+    """Decode a value produced by encode(). Raises ValueError for malformed input."""
+    try:
+        value, offset = _decode(data, 0)
+    except (IndexError, struct.error, UnicodeDecodeError) as e:
+        raise ValueError(f"Malformed cache value: {e}") from e
+    if offset != len(data):
+        raise ValueError("Malformed cache value: trailing bytes")
+    return value
+
+
+def available_compressions() -> Tuple[str, ...]:
+    """Compression names pack() accepts here ("lz4" only if the lz4 package is installed)."""
+    return ("none", "zlib", "lz4") if lz4_frame is not None else ("none", "zlib")
+
+
+def pack(value: Any, compress_threshold: Optional[int] = COMPRESS_THRESHOLD, compression: str = "zlib") -> bytes:
+    """
+    Encode a value, compressed if its encoding has at least `compress_threshold` bytes.
+
+    Raises TypeError for unsupported types, ValueError for an unavailable compression.
+    """
+    out = bytearray(b"\x00")
+    _encode(value, out)
+    if compress_threshold is None or len(out) - 1 < compress_threshold or compression == "none":
+        return bytes(out)
+    raw = memoryview(out)[1:]
+    if compression == "zlib":
+        marker, compressed = _ZLIB, zlib.compress(raw)
+    elif compression == "lz4" and lz4_frame is not None:
+        marker, compressed = _LZ4, lz4_frame.compress(raw)
+    else:
+        raise ValueError(f"Unsupported cache compression {compression!r}")
+    if len(compressed) + 1 >= len(out):
+        return bytes(out)
+    return bytes((marker,)) + compressed
+
+
+def unpack(data: bytes) -> Any:
+    """Decode a value produced by pack(). Raises ValueError for malformed input."""
+    if not data:
+        raise ValueError("Malformed cache value: empty")
+    marker, payload = data[0], memoryview(data)[1:]
+    if marker == _PLAIN:
+        return decode(payload)
+    try:
+        if marker == _ZLIB:
+            return decode(zlib.decompress(payload))
+        if marker == _LZ4 and lz4_frame is not None:
+            return decode(lz4_frame.decompress(payload))
+    except (zlib.error, RuntimeError) as e:
+        raise ValueError(f"Malformed cache value: {e}") from e
+    raise ValueError(f"Unsupported cache compression marker {marker}")
+
+
+def encode_entry(entry: Dict[str, Any], compression: str = "zlib") -> bytes:
+    """Encode a SimpleCache entry ({'data', 'expires', 'created', 'fresh_until'})."""
+    header = _ENTRY_HEADER.pack(
+        FORMAT_VERSION, entry["expires"], entry.get("created", 0.0), entry.get("fresh_until", entry["expires"])
+    )
+    return header + pack(entry["data"], COMPRESS_THRESHOLD, compression)
+
+
+def decode_entry(data: bytes) -> Dict[str, Any]:
+    """Decode an entry produced by encode_entry(). Raises ValueError for malformed input."""
+    # Version 2 entries (uncompressed values) may still be around during a rolling deploy
+    if len(data) < _ENTRY_HEADER.size or data[0] not in (2, FORMAT_VERSION):
+        raise ValueError("Unsupported cache entry format")
+    version, expires, created, fresh_until = _ENTRY_HEADER.unpack_from(data, 0)
+    payload = data[_ENTRY_HEADER.size:]
+    return {
+        "data": unpack(payload) if version == FORMAT_VERSION else decode(payload),
+        "expires": expires,
+        "created": created,
+        "fresh_until": fresh_until,
+    }
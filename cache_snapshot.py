@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+Cache snapshots: keep in-memory caches warm across restarts and deploys
+
+With CACHE_SNAPSHOT_DIR set, every worker writes the unexpired entries of its named
+in-memory caches (see SimpleCache(name=...)) to `<dir>/<cache>-<pid>.snapshot` every
+CACHE_SNAPSHOT_INTERVAL seconds and when it shuts down. On startup restore() streams
+all snapshot files of each cache back in, oldest first, skipping entries that expired
+while the service was down; with gunicorn's preload_app this happens once in the master,
+so the forked workers start with the entries. Files with no unexpired entry left are
+deleted. Caches kept in a backend (SQLite, shared memory, Redis) are not snapshotted.
+
+File format: an 8-byte magic, then `<Bd` (format version, latest expiry of any entry),
+then per entry `<dddII` (fresh until, expires, created, key length, value length), the
+UTF-8 key and the value as encoded by cache_codec.pack(). Expiry times are absolute,
+so an entry's remaining TTL is whatever is left of it when the file is read.
+
+    snapshotter.restore()          # at import, before serving
+    snapshotter.ensure_started()   # in each worker: periodic snapshots and one at exit
+    snapshotter.shutdown()         # final snapshot (gunicorn worker_exit, ASGI lifespan)
+"""
+import atexit
+import glob
+import logging
+import os
+import struct
+import threading
+import time
+from typing import BinaryIO, Iterator, Optional, Tuple
+
+import cache_codec
+from cache import CACHE_COMPRESS_THRESHOLD, CACHE_COMPRESSION, SimpleCache, registered_caches
+
+CACHE_SNAPSHOT_DIR = os.getenv("CACHE_SNAPSHOT_DIR")
+# Seconds between the periodic snapshots of each worker
+CACHE_SNAPSHOT_INTERVAL = float(os.getenv("CACHE_SNAPSHOT_INTERVAL", "300"))
+
+SNAPSHOT_MAGIC = b"DMCSNAP\x00"
+SNAPSHOT_VERSION = 1
+_HEADER = struct.Struct("<Bd")  # format version, latest expiry
+_RECORD = struct.Struct("<dddII")  # fresh until, expires, created, key length, value length
+
+Record = Tuple[str, bytes, float, float, float]  # key, packed value, fresh until, expires, created
+
+
+def write_snapshot(cache: SimpleCache, path: str) -> int:
+    """
+    Write the unexpired in-memory entries of `cache` to `path` (replaced atomically).
+
+    Returns:
+        int: Entries written. Values the codec cannot encode are left out.
+    """
+    items = cache.items()
+    temporary = f"{path}.tmp"
+    written = 0
+    with open(temporary, "wb") as f:
+        f.write(SNAPSHOT_MAGIC)
+        f.write(_HEADER.pack(SNAPSHOT_VERSION, max((item["expires"] for _, item in items), default=0.0)))
+        for key, item in items:
+            if item.get("packed"):
+                value = item["data"]
+            else:
+                try:
+                    value = cache_codec.pack(item["data"], CACHE_COMPRESS_THRESHOLD, CACHE_COMPRESSION)
+                except TypeError:
+                    continue
+            encoded_key = key.encode("utf-8")
+            f.write(_RECORD.pack(item["fresh_until"], item["expires"], item["created"], len(encoded_key), len(value)))
+            f.write(encoded_key)
+            f.write(value)
+            written += 1
+    os.replace(temporary, path)
+    return written
+
+
+def _read_exactly(f: BinaryIO, size: int) -> bytes:
+    data = f.read(size)
+    if len(data) != size:
+        raise ValueError("Truncated cache snapshot")
+    return data
+
+
+def _read_header(f: BinaryIO) -> float:
+    if f.read(len(SNAPSHOT_MAGIC)) != SNAPSHOT_MAGIC:
+        raise ValueError("Not a cache snapshot")
+    version, latest_expiry = _HEADER.unpack(_read_exactly(f, _HEADER.size))
+    if version != SNAPSHOT_VERSION:
+        raise ValueError(f"Unsupported cache snapshot version {version}")
+    return latest_expiry
+
+
+def read_snapshot(path: str) -> Iterator[Record]:
+    """Stream the entries of a snapshot file. Raises ValueError for a malformed file."""
+    with open(path, "rb") as f:
+        _read_header(f)
+        while True:
+            header = f.read(_RECORD.size)
+            if not header:
+                return
+            if len(header) != _RECORD.size:
+                raise ValueError("Truncated cache snapshot")
+            fresh_until, expires, created, key_length, value_length = _RECORD.unpack(header)
+            key = _read_exactly(f, key_length).decode("utf-8")
+            yield key, _read_exactly(f, value_length), fresh_until, expires, created
+
+
+def load_snapshot(cache: SimpleCache, path: str) -> int:
+    """
+    Insert the entries of a snapshot file that have not expired into `cache`.
+
+    Returns:
+        int: Entries loaded. A malformed file stops loading (what was read is kept).
+    """
+    loaded = 0
+    try:
+        for key, value, fresh_until, expires, created in read_snapshot(path):
+            try:
+                if cache.restore(key, value, fresh_until, expires, created, packed=True):
+                    loaded += 1
+            except ValueError as e:  # e.g. lz4-compressed without lz4 installed
+                logging.debug(f"Skipping snapshot entry {key}: {e}")
+    except (OSError, ValueError, UnicodeDecodeError) as e:
+        logging.warning(f"Could not read cache snapshot {path}: {e}")
+    return loaded
+
+
+# Without preload_app every worker restores at import, so a file may be deleted (or
+# replaced) by another worker at any point
+def _with_mtimes(paths) -> Iterator[Tuple[float, str]]:
+    for path in paths:
+        try:
+            yield os.path.getmtime(path), path
+        except OSError:
+            pass
+
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class Snapshotter:
+    """Periodic and on-shutdown snapshots of the named in-memory caches of this process"""
+
+    def __init__(self, directory: Optional[str] = CACHE_SNAPSHOT_DIR, interval: float = CACHE_SNAPSHOT_INTERVAL):
+        self.directory = directory
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._pid: Optional[int] = None
+        self._stopped = threading.Event()
+
+    def _caches(self) -> Iterator[Tuple[str, SimpleCache]]:
+        for name, cache in registered_caches().items():
+            if cache.backend is None:
+                yield name, cache
+
+    def restore(self) -> int:
+        """Load every cache's snapshot files, oldest first; delete files that have fully expired."""
+        if not self.directory:
+            return 0
+        started = time.perf_counter()
+        total = 0
+        for name, cache in self._caches():
+            paths = glob.glob(os.path.join(self.directory, f"{name}-*.snapshot"))
+            for _, path in sorted(_with_mtimes(paths)):
+                try:
+                    with open(path, "rb") as f:
+                        latest_expiry = _read_header(f)
+                except FileNotFoundError:
+                    continue
+                except (OSError, ValueError) as e:
+                    logging.warning(f"Could not read cache snapshot {path}: {e}")
+                    continue
+                if latest_expiry <= time.time():
+                    _remove(path)
+                    continue
+                total += load_snapshot(cache, path)
+        logging.info(f"Restored {total} cache entries from {self.directory} in {time.perf_counter() - started:.2f}s")
+        return total
+
+    def save(self) -> int:
+        """Snapshot every cache of this process now; returns the entries written."""
+        if not self.directory:
+            return 0
+        os.makedirs(self.directory, exist_ok=True)
+        total = 0
+        with self._lock:
+            for name, cache in self._caches():
+                path = os.path.join(self.directory, f"{name}-{os.getpid()}.snapshot")
+                try:
+                    total += write_snapshot(cache, path)
+                except OSError as e:
+                    logging.warning(f"Could not write cache snapshot {path}: {e}")
+        return total
+
+    def ensure_started(self) -> None:
+        """Start the periodic snapshots in this process, and snapshot at exit (no-op if running)."""
+        if not self.directory or self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._stopped = threading.Event()
+            threading.Thread(target=self._run, name="cache-snapshotter", daemon=True).start()
+            atexit.register(self.shutdown)
+
+    def shutdown(self) -> None:
+        """Take the final snapshot of this process (once; only where ensure_started() ran)."""
+        if self._pid != os.getpid() or self._stopped.is_set():
+            return
+        self._stopped.set()
+        written = self.save()
+        logging.info(f"Saved {written} cache entries to {self.directory}")
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            try:
+                self.save()
+            except Exception as e:
+                logging.warning(f"Cache snapshot failed: {e}")
+
+snapshotter = Snapshotter()
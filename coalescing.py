@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+Request coalescing for identical concurrent API calls
+
+When a link is shared, many clients ask for the same `/api/overview?domain=x` within
+seconds. Route coroutines decorated with `@coalesced(endpoint, normalize)` run once per
+distinct (endpoint, normalized parameters) at a time in each worker: callers arriving
+while a computation is in flight await the same result, and successful results are
+served for a short retention window (COALESCE_RETENTION seconds) after it finished.
+
+The shared computation runs in its own request scope (see request_context.py) rather
+than in the scope of whichever caller started it, so one client disconnecting does
+not fail the others; it is cancelled only when every caller waiting for it has gone.
+
+How often each endpoint was computed, joined in flight or served from the retention
+window is counted per worker process; see `RequestCoalescer.stats()`.
+
+The in-flight sharing itself is `SingleFlight`, which SimpleCache.get_or_compute() also
+uses so that concurrent misses on one cache key compute the value once.
+"""
+import asyncio
+import functools
+import logging
+import os
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+from async_runtime import ASYNC_CALL_TIMEOUT
+import request_context
+
+# Seconds a finished result keeps answering identical requests (0 disables retention)
+COALESCE_RETENTION = float(os.getenv("COALESCE_RETENTION", "5"))
+
+
+def _retrieve_exception(future: asyncio.Future) -> None:
+    # A computation every caller abandoned may fail unobserved; don't log it as unretrieved
+    if not future.cancelled():
+        future.exception()
+
+
+class _Flight:
+    """One in-flight computation and the number of callers waiting for it."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.waiters = 1
+        self.future: Optional[asyncio.Future] = None
+        self.max_age: Optional[float] = None  # reported by the computation's request scope
+
+
+class SingleFlight:
+    """
+    Runs at most one computation per key at a time on each event loop.
+
+    Callers of run() with a key that is already being computed await the same result
+    instead of starting another computation. The computation runs in its own request
+    scope, bounded by the deadline of the caller that started it, and is cancelled only
+    when every caller waiting for it has gone. The max_age it reports (see
+    request_context.limit_max_age) is passed on to every caller.
+    """
+
+    def __init__(self):
+        # Callers may run on different event loops (the WSGI background loop, the ASGI
+        # server loop), so the map is guarded by a thread lock
+        self._lock = threading.Lock()
+        self._inflight: Dict[Hashable, _Flight] = {}
+
+    async def run(self, key: Hashable, factory: Callable[[], Awaitable[Any]], name: str = "single flight",
+                  record: Optional[Callable[[str], None]] = None, timeout: Optional[float] = None) -> Any:
+        """
+        Await the computation of `key`, starting `factory()` unless it is already in flight.
+
+        Args:
+            key: Hashable identity of the computation.
+            factory: Creates the coroutine computing the result.
+            name (str): Name of the computation's request scope (for logs).
+            record: Called with "computed" or "coalesced" (under the lock) for stats.
+            timeout (float, optional): Deadline of a computation started by this call.
+                Defaults to ASYNC_CALL_TIMEOUT, shortened to the caller's deadline.
+
+        Returns:
+            The (shared) result. Exceptions are re-raised to every waiting caller.
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            flight = self._inflight.get(key)
+            if flight is not None and flight.loop is loop:
+                flight.waiters += 1
+                if record is not None:
+                    record("coalesced")
+                logging.debug(f"Joined {name} ({flight.waiters} callers waiting)")
+            else:
+                # A flight on another loop cannot be awaited here; compute separately
+                flight = _Flight(loop)
+                if key not in self._inflight:
+                    self._inflight[key] = flight
+                if record is not None:
+                    record("computed")
+                # Bounded by the deadline of the caller that starts it
+                if timeout is None:
+                    timeout = request_context.timeout_for(ASYNC_CALL_TIMEOUT)
+                flight.future = asyncio.ensure_future(self._compute(key, flight, factory, timeout, name))
+                flight.future.add_done_callback(_retrieve_exception)
+
+        try:
+            # Shielded: a caller going away must not cancel the result for the others
+            result = await asyncio.shield(flight.future)
+            request_context.limit_max_age(flight.max_age)
+            return result
+        finally:
+            with self._lock:
+                flight.waiters -= 1
+                abandoned = flight.waiters == 0 and not flight.future.done()
+            if abandoned:
+                flight.future.cancel()
+
+    async def _compute(self, key: Hashable, flight: _Flight, factory: Callable[[], Awaitable[Any]],
+                       timeout: float, name: str) -> Any:
+        context = request_context.RequestContext(timeout, name)
+        try:
+            return await request_context.run(factory(), context=context)
+        finally:
+            flight.max_age = context.max_age
+            with self._lock:
+                if self._inflight.get(key) is flight:
+                    del self._inflight[key]
+
+
+class RequestCoalescer:
+    """Shares in-flight and recently finished route results between identical calls."""
+
+    def __init__(self, retention: float = COALESCE_RETENTION):
+        self.retention = retention
+        self._flights = SingleFlight()
+        self._lock = threading.Lock()
+        # key -> (retained until, result, valid until per the result's max_age or None)
+        self._retained: Dict[Hashable, Tuple[float, Any, Optional[float]]] = {}
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    def _record(self, endpoint: str, outcome: str) -> None:
+        with self._lock:
+            counters = self._stats.setdefault(endpoint, {"computed": 0, "coalesced": 0, "retained": 0})
+            counters[outcome] += 1
+
+    @staticmethod
+    def _retainable(result: Any) -> bool:
+        # Route coroutines return (payload, status_code); only keep non-5xx answers
+        return isinstance(result, tuple) and len(result) == 2 and result[1] < 500
+
+    async def run(self, endpoint: str, params: Hashable, factory: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Run `factory()` unless an identical call is in flight or was just answered.
+
+        Args:
+            endpoint (str): Endpoint name (part of the key, and the stats label).
+            params: Hashable, normalized request parameters.
+            factory: Creates the coroutine computing the result.
+
+        Returns:
+            The (shared) result. Exceptions are re-raised to every waiting caller.
+        """
+        key = (endpoint, params)
+        now = time.monotonic()
+        with self._lock:
+            retained = self._retained.get(key)
+            fresh = retained is not None and retained[0] > now
+        if fresh:
+            self._record(endpoint, "retained")
+            if retained[2] is not None:
+                request_context.limit_max_age(retained[2] - now)
+            return retained[1]
+
+        return await self._flights.run(
+            key,
+            lambda: self._compute(key, factory),
+            f"coalesced {endpoint}",
+            lambda outcome: self._record(endpoint, outcome),
+        )
+
+    async def _compute(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Any:
+        result = await factory()
+        if self.retention > 0 and self._retainable(result):
+            now = time.monotonic()
+            max_age = request_context.current().max_age
+            with self._lock:
+                # Drop expired entries while we hold the lock; the map stays small
+                for stale_key in [k for k, (expires, _, _) in self._retained.items() if expires <= now]:
+                    del self._retained[stale_key]
+                self._retained[key] = (now + self.retention, result, None if max_age is None else now + max_age)
+        return result
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Per-endpoint counts of computed, coalesced (joined in flight) and retained answers."""
+        with self._lock:
+            return {endpoint: dict(counters) for endpoint, counters in self._stats.items()}
+
+    def clear(self) -> None:
+        """Forget retained results."""
+        with self._lock:
+            self._retained.clear()
+
+
+coalescer = RequestCoalescer()
+
+
+def coalesced(endpoint: str, normalize: Callable[..., Optional[Hashable]]):
+    """
+    Decorate a route coroutine so identical concurrent calls share one computation.
+
+    Args:
+        endpoint (str): Endpoint name, e.g. "/api/overview".
+        normalize: Called with the coroutine's arguments; returns the hashable,
+            normalized parameters identifying the call, or None to run it directly
+            (e.g. internal calls that pass a shared DomainSnapshot).
+
+        @coalesced("/api/reputation", lambda domain, snapshot=None: None if snapshot else domain.lower())
+        async def reputation_payload(domain, snapshot=None):
+            ...
+
+    The decorated function's `key(*args, **kwargs)` returns the (endpoint, parameters)
+    identity of a call, e.g. for HTTP validators (see http_caching.py).
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            params = normalize(*args, **kwargs)
+            if params is None:
+                return await func(*args, **kwargs)
+            return await coalescer.run(endpoint, params, lambda: func(*args, **kwargs))
+
+        def key(*args, **kwargs) -> Optional[Hashable]:
+            """(endpoint, normalized parameters) identifying a call, or None if it is not coalesced."""
+            params = normalize(*args, **kwargs)
+            return None if params is None else (endpoint, params)
+
+        wrapper.key = key
+        return wrapper
+    return decorator
@@ -1,6 +1,7 @@
 import asyncio
 import dns.asyncresolver
 import logging
+import request_context
 from error_handling import (
     DmarcError, DomainError, DnsLookupError, RecordParsingError,
     handle_dns_exception
@@ -9,6 +10,30 @@ from error_handling import (
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
 
+class TtlReportingResolver(dns.asyncresolver.Resolver):
+    """
+    Async resolver that reports the TTL of every answer to the current request, so API
+    responses are not cached by clients longer than the records they were built from
+    (see request_context.limit_max_age).
+    """
+
+    async def resolve(self, *args, **kwargs):
+        answer = await super().resolve(*args, **kwargs)
+        if answer.rrset is not None:
+            request_context.limit_max_age(answer.rrset.ttl)
+        return answer
+
+def new_resolver():
+    """
+    Create an async resolver whose query lifetime is bounded by the current request's deadline.
+
+    Returns:
+        TtlReportingResolver: The resolver.
+    """
+    resolver = TtlReportingResolver()
+    resolver.lifetime = request_context.timeout_for(resolver.lifetime)
+    return resolver
+
 # ---------------------------- DMARC Record Lookup ----------------------------
 async def get_dmarc_record(domain):
     """
@@ -34,7 +59,7 @@ async def get_dmarc_record(domain):
         
     try:
         logging.debug(f"Starting DMARC lookup for domain: {domain}")
-        resolver = dns.asyncresolver.Resolver()
+        resolver = new_resolver()
         result = await resolver.resolve(f"_dmarc.{domain}", 'TXT')
         records = [record.to_text() for record in result]
 
@@ -133,7 +158,7 @@ async def get_spf_record(domain):
         
     try:
         logging.debug(f"Starting SPF lookup for domain: {domain}")
-        resolver = dns.asyncresolver.Resolver()
+        resolver = new_resolver()
         result = await resolver.resolve(domain, 'TXT')
 
         for record in result:
@@ -218,17 +243,94 @@ async def get_spf_record(domain):
         return {"error": f"Internal server error: {str(e)}"}
 
 # ----------------------------- DKIM Record Lookup ----------------------------
-async def get_all_dkim_records(domain, selectors=None):
+async def lookup_dkim_selector(resolver, domain, selector):
     """
-    Fetch all DKIM records for the provided selectors and domain with enhanced error handling.
+    Look up and parse the DKIM record of a single selector.
 
     Args:
+        resolver (dns.asyncresolver.Resolver): The resolver to use.
         domain (str): The domain name to query.
-        selectors (list): A list of DKIM selectors to query. Defaults to common selectors if not provided.
+        selector (str): The DKIM selector.
 
     Returns:
-        dict: A dictionary containing DKIM records and parsed data, or errors for each selector.
-        
+        dict: The parsed records ("status": "success") or an error entry for the selector.
+    """
+    try:
+        # Log the start of the DKIM lookup process
+        logging.debug(f"Starting DKIM lookup for selector {selector} on domain {domain}")
+
+        # Perform the DNS TXT record lookup for the DKIM selector
+        result = await resolver.resolve(f"{selector}._domainkey.{domain}", 'TXT')
+
+        # Extract and parse the DKIM records from the result
+        dkim_records = [record.to_text() for record in result]
+        logging.info(f"DKIM record(s) found for {selector}.{domain}: {dkim_records}")
+
+        return {
+            "dkim_records": dkim_records,
+            "parsed_records": [parse_dkim(record) for record in dkim_records if record],
+            "status": "success",
+        }
+
+    except dns.resolver.NoAnswer:
+        # Handle cases where no DKIM record is found for the selector
+        logging.warning(f"No DKIM record found for {selector}.{domain}")
+        return {
+            "error": f"No DKIM record found for {selector}.{domain}",
+            "error_code": "DKIM_SELECTOR_NOT_FOUND",
+            "status": "error",
+            "suggestions": [
+                f"The selector '{selector}' is not configured for your domain.",
+                "Check with your email service provider for the correct selector name."
+            ]
+        }
+    except dns.resolver.NXDOMAIN:
+        # Handle cases where the domain does not exist
+        logging.error(f"Domain does not exist: {domain}")
+        return {
+            "error": f"Domain {domain} does not exist",
+            "error_code": "DOMAIN_NOT_FOUND",
+            "status": "error",
+            "suggestions": [
+                "Check for typos in the domain name.",
+                "Verify that the domain is properly registered and has DNS configured."
+            ]
+        }
+    except dns.resolver.Timeout:
+        # Handle cases where the DNS query times out
+        logging.error(f"Timeout while resolving DKIM record for {selector}.{domain}")
+        return {
+            "error": "Timeout while resolving DKIM record",
+            "error_code": "DNS_TIMEOUT",
+            "status": "error",
+            "suggestions": [
+                "This could be a temporary network issue. Try again later.",
+                "The domain's authoritative DNS servers might be experiencing problems."
+            ]
+        }
+    except Exception as e:
+        # Handle any unexpected errors
+        logging.error(f"Unexpected error fetching DKIM record for {selector}.{domain}: {e}")
+        return {
+            "error": f"Internal server error: {str(e)}",
+            "error_code": "INTERNAL_ERROR",
+            "status": "error",
+            "suggestions": ["Please try again later."]
+        }
+
+DEFAULT_DKIM_SELECTORS = ["default", "google", "selector1", "selector2", "email", "dkim1"]
+
+def validate_dkim_selectors(domain, selectors):
+    """
+    Validate the inputs of a DKIM lookup.
+
+    Args:
+        domain (str): The domain name to query.
+        selectors (list): DKIM selectors, or None for the default selectors.
+
+    Returns:
+        list: The distinct selectors to query, in their original order.
+
     Raises:
         DomainError: If the domain parameter is invalid.
         ValueError: If the selectors are invalid.
@@ -246,88 +348,30 @@ async def get_all_dkim_records(domain, selectors=None):
 
     # Handle missing or invalid selectors
     if selectors is None:
-        selectors = ["default", "google", "selector1", "selector2", "email", "dkim1"]  # Default selectors
+        selectors = DEFAULT_DKIM_SELECTORS
     elif not isinstance(selectors, list) or not all(isinstance(sel, str) and sel.strip() for sel in selectors):
         logging.error(f"Invalid selectors received: {selectors}")
         raise ValueError("Invalid selectors. Must be a list of non-empty strings.")
 
     # Log validated selectors
     logging.debug(f"Validated selectors: {selectors}")
+    return list(dict.fromkeys(selectors))
 
-    results = {}  # To store results for each selector
-    resolver = dns.asyncresolver.Resolver()
-
-    valid_selector_found = False  # Track if at least one valid selector is found
-
-    for selector in selectors:
-        try:
-            # Log the start of the DKIM lookup process
-            logging.debug(f"Starting DKIM lookup for selector {selector} on domain {domain}")
-
-            # Perform the DNS TXT record lookup for the DKIM selector
-            result = await resolver.resolve(f"{selector}._domainkey.{domain}", 'TXT')
-
-            # Extract and parse the DKIM records from the result
-            dkim_records = [record.to_text() for record in result]
-            logging.info(f"DKIM record(s) found for {selector}.{domain}: {dkim_records}")
-
-            valid_selector_found = True
+def build_dkim_results(selectors, lookups):
+    """
+    Combine per-selector DKIM lookups into the get_all_dkim_records result.
 
-            # Store the successful result in the results dictionary
-            results[selector] = {
-                "dkim_records": dkim_records,
-                "parsed_records": [parse_dkim(record) for record in dkim_records if record],
-                "status": "success",
-            }
+    Args:
+        selectors (list): The selectors that were queried.
+        lookups (list): The lookup_dkim_selector result for each selector.
 
-        except dns.resolver.NoAnswer:
-            # Handle cases where no DKIM record is found for the selector
-            logging.warning(f"No DKIM record found for {selector}.{domain}")
-            results[selector] = {
-                "error": f"No DKIM record found for {selector}.{domain}",
-                "error_code": "DKIM_SELECTOR_NOT_FOUND",
-                "status": "error",
-                "suggestions": [
-                    f"The selector '{selector}' is not configured for your domain.",
-                    "Check with your email service provider for the correct selector name."
-                ]
-            }
-        except dns.resolver.NXDOMAIN:
-            # Handle cases where the domain does not exist
-            logging.error(f"Domain does not exist: {domain}")
-            results[selector] = {
-                "error": f"Domain {domain} does not exist",
-                "error_code": "DOMAIN_NOT_FOUND",
-                "status": "error",
-                "suggestions": [
-                    "Check for typos in the domain name.",
-                    "Verify that the domain is properly registered and has DNS configured."
-                ]
-            }
-        except dns.resolver.Timeout:
-            # Handle cases where the DNS query times out
-            logging.error(f"Timeout while resolving DKIM record for {selector}.{domain}")
-            results[selector] = {
-                "error": "Timeout while resolving DKIM record",
-                "error_code": "DNS_TIMEOUT",
-                "status": "error",
-                "suggestions": [
-                    "This could be a temporary network issue. Try again later.",
-                    "The domain's authoritative DNS servers might be experiencing problems."
-                ]
-            }
-        except Exception as e:
-            # Handle any unexpected errors
-            logging.error(f"Unexpected error fetching DKIM record for {selector}.{domain}: {e}")
-            results[selector] = {
-                "error": f"Internal server error: {str(e)}",
-                "error_code": "INTERNAL_ERROR",
-                "status": "error",
-                "suggestions": ["Please try again later."]
-            }
+    Returns:
+        dict: Results per selector plus "overall_status" (and "recommendations" if none were found).
+    """
+    results = dict(zip(selectors, lookups))  # To store results for each selector
 
     # Add overall recommendations if no valid DKIM selectors were found
-    if not valid_selector_found:
+    if not any(entry["status"] == "success" for entry in lookups):
         results["overall_status"] = "error"
         results["recommendations"] = [
             "No DKIM records were found for any of the selectors tried.",
@@ -340,6 +384,30 @@ async def get_all_dkim_records(domain, selectors=None):
     # Return the results for all selectors
     return results
 
+async def get_all_dkim_records(domain, selectors=None):
+    """
+    Fetch all DKIM records for the provided selectors and domain with enhanced error handling.
+
+    Args:
+        domain (str): The domain name to query.
+        selectors (list): A list of DKIM selectors to query. Defaults to common selectors if not provided.
+
+    Returns:
+        dict: A dictionary containing DKIM records and parsed data, or errors for each selector.
+        
+    Raises:
+        DomainError: If the domain parameter is invalid.
+        ValueError: If the selectors are invalid.
+    """
+    selectors = validate_dkim_selectors(domain, selectors)
+    resolver = new_resolver()
+
+    # Query every selector concurrently; results keep the order of `selectors`
+    lookups = await request_context.gather(*(
+        lookup_dkim_selector(resolver, domain, selector) for selector in selectors
+    ))
+    return build_dkim_results(selectors, lookups)
+
 # ----------------------------- All DNS Records Lookup -----------------------------
 async def get_all_dns_records(domain):
     """
@@ -363,7 +431,7 @@ async def get_all_dns_records(domain):
         )
         
     records = {}
-    resolver = dns.asyncresolver.Resolver()
+    resolver = new_resolver()
 
     try:
         for record_type in ['A', 'AAAA', 'MX', 'TXT']:
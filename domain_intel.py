@@ -22,9 +22,17 @@ from __future__ import annotations
 
 import os
 import asyncio
+import hashlib
+import json
+import logging
+import threading
+import weakref
 from typing import Any, Dict, List, Tuple
 import aiohttp
 
+from cache import domain_intel_cache
+import request_context
+
 # Result shape contract (normalized):
 # {
 #   "provider": "intelx|leakcheck|...",
@@ -51,6 +59,10 @@ INTELX_BASE_URL = os.getenv("INTELX_BASE_URL", "https://free.intelx.io")
 LEAKCHECK_API_KEY = os.getenv("LEAKCHECK_API_KEY")
 # Allow overriding LeakCheck endpoint; default to the public API URL
 LEAKCHECK_BASE_URL = os.getenv("LEAKCHECK_BASE_URL", "https://leakcheck.io/api/public")
+# Maximum IntelX queries in flight at once across all lookups (per worker event loop)
+INTELX_MAX_CONCURRENCY = int(os.getenv("INTELX_MAX_CONCURRENCY", "4"))
+# How long merged per-domain results are served from memory
+DOMAIN_INTEL_CACHE_TTL = int(os.getenv("DOMAIN_INTEL_CACHE_TTL", "1800"))
 
 
 def _guess_type_from_text(title: str, source: str) -> str:
@@ -62,6 +74,60 @@ def _guess_type_from_text(title: str, source: str) -> str:
     return "credential" if any(k in t for k in ["combo", "dump", "leak"]) else "mention"
 
 
+def _intelx_item_key(item: Any) -> str:
+    """Stable identity for an IntelX result: its system/storage ID, else a content hash."""
+    if isinstance(item, dict):
+        for id_field in ("systemid", "storageid", "id"):
+            if item.get(id_field):
+                return f"{id_field}:{item[id_field]}"
+        payload = json.dumps(item, sort_keys=True, default=str)
+    else:
+        payload = str(item)
+    return "sha1:" + hashlib.sha1(payload.encode()).hexdigest()
+
+
+# One IntelX limiter per event loop (the WSGI background loop, the ASGI server loop): a
+# semaphore only works on the loop it was first used on, so each is created lazily there
+_intelx_limiters: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+_intelx_limiters_lock = threading.Lock()
+
+
+def _intelx_limiter() -> asyncio.Semaphore:
+    """The IntelX concurrency limit shared by every lookup on the running loop."""
+    loop = asyncio.get_running_loop()
+    with _intelx_limiters_lock:
+        semaphore = _intelx_limiters.get(loop)
+        if semaphore is None:
+            semaphore = _intelx_limiters[loop] = asyncio.Semaphore(INTELX_MAX_CONCURRENCY)
+    return semaphore
+
+
+async def _intelx_query_variant(
+    session: aiohttp.ClientSession,
+    semaphore: asyncio.Semaphore,
+    search_url: str,
+    headers: Dict[str, str],
+    term: str,
+) -> List[Any]:
+    """Run one IntelX query variant and return its raw candidate items."""
+    payload = {"term": term, "maxresults": 10, "timeout": 10}
+    async with semaphore:
+        async with session.post(search_url, json=payload, headers=headers) as resp:
+            if resp.status not in (200, 202):
+                # Variant not accepted or errored; the other variants may still match
+                return []
+            data = await resp.json(content_type=None)
+
+    # Normalize candidates
+    if isinstance(data, dict):
+        for key in ("records", "result", "selectors", "items"):
+            if key in data and isinstance(data[key], list):
+                return data[key][:10]
+    elif isinstance(data, list):
+        return data[:10]
+    return []
+
+
 async def _intelx_search(session: aiohttp.ClientSession, domain: str) -> Dict[str, Any]:
     if not INTELX_API_KEY:
         return {
@@ -90,46 +156,50 @@ async def _intelx_search(session: aiohttp.ClientSession, domain: str) -> Dict[st
     query_variants = [domain, f"@{domain}", f'"@{domain}"', f'"{domain}"']
 
     try:
+        # Run all variants concurrently, bounded per provider across lookups
+        semaphore = _intelx_limiter()
+        variant_results = await request_context.gather(
+            *(_intelx_query_variant(session, semaphore, search_url, headers, term) for term in query_variants),
+            return_exceptions=True,
+        )
+        failures = [r for r in variant_results if isinstance(r, BaseException)]
+        if failures and len(failures) == len(variant_results):
+            # Every variant failed: surface the first error through the handlers below
+            raise failures[0]
+
+        # Merge variants, dropping items already seen under another variant
+        seen_items = set()
         findings: List[Dict[str, Any]] = []
-        for term in query_variants:
-            payload = {"term": term, "maxresults": 10, "timeout": 10}
-            async with session.post(search_url, json=payload, headers=headers) as resp:
-                if resp.status not in (200, 202):
-                    # Try next variant if this one is not accepted or yields an error
+        for candidates in variant_results:
+            if isinstance(candidates, BaseException):
+                continue
+            for item in candidates:
+                item_key = _intelx_item_key(item)
+                if item_key in seen_items:
                     continue
-                data = await resp.json(content_type=None)
-                # Normalize candidates
-                candidates: List[Any] = []
-                if isinstance(data, dict):
-                    for key in ("records", "result", "selectors", "items"):
-                        if key in data and isinstance(data[key], list):
-                            candidates = data[key]
-                            break
-                elif isinstance(data, list):
-                    candidates = data
-
-                for item in candidates[:10]:
-                    if isinstance(item, dict):
-                        title = item.get("name") or item.get("system") or "IntelX Result"
-                        date = item.get("date") or item.get("timestamp")
-                        source = item.get("bucket") or item.get("source") or "IntelX"
-                        ftype = _guess_type_from_text(str(title), str(source))
-                        findings.append({
-                            "type": ftype,
-                            "title": str(title),
-                            "source": str(source),
-                            "date": str(date) if date else None,
-                            "metadata": {k: v for k, v in item.items() if k not in ("name", "system", "bucket", "source", "date", "timestamp")},
-                        })
-                    else:
-                        t = str(item)
-                        findings.append({
-                            "type": _guess_type_from_text(t, "IntelX"),
-                            "title": t,
-                            "source": "IntelX",
-                            "date": None,
-                            "metadata": {"raw": t},
-                        })
+                seen_items.add(item_key)
+
+                if isinstance(item, dict):
+                    title = item.get("name") or item.get("system") or "IntelX Result"
+                    date = item.get("date") or item.get("timestamp")
+                    source = item.get("bucket") or item.get("source") or "IntelX"
+                    ftype = _guess_type_from_text(str(title), str(source))
+                    findings.append({
+                        "type": ftype,
+                        "title": str(title),
+                        "source": str(source),
+                        "date": str(date) if date else None,
+                        "metadata": {k: v for k, v in item.items() if k not in ("name", "system", "bucket", "source", "date", "timestamp")},
+                    })
+                else:
+                    t = str(item)
+                    findings.append({
+                        "type": _guess_type_from_text(t, "IntelX"),
+                        "title": t,
+                        "source": "IntelX",
+                        "date": None,
+                        "metadata": {"raw": t},
+                    })
 
         if findings:
             # Deduplicate by title+source
@@ -309,16 +379,28 @@ async def _leakcheck_search(session: aiohttp.ClientSession, domain: str) -> Dict
 
 
 async def search_domain_intel(domain: str) -> Dict[str, Any]:
-    """Query all configured providers concurrently and return a merged summary."""
+    """
+    Query all configured providers concurrently and return a merged summary.
+
+    Merged results are cached per domain for DOMAIN_INTEL_CACHE_TTL seconds unless a
+    provider reported an error, so a transient failure is retried on the next call.
+    """
+    cache_key = domain_intel_cache._generate_key("domain_intel", domain.lower())
+    cached_result = domain_intel_cache.get(cache_key)
+    if cached_result is not None:
+        logging.debug(f"Using cached domain intel for {domain}")
+        return cached_result
+
     results: List[Dict[str, Any]] = []
 
-    timeout = aiohttp.ClientTimeout(total=20)
+    # Per provider request, never past the request's own deadline
+    timeout = aiohttp.ClientTimeout(total=request_context.timeout_for(20))
     async with aiohttp.ClientSession(timeout=timeout) as session:
         provider_tasks = [
             _intelx_search(session, domain),
             _leakcheck_search(session, domain),
         ]
-        results = await asyncio.gather(*provider_tasks, return_exceptions=False)
+        results = await request_context.gather(*provider_tasks, return_exceptions=False)
 
     # Build summary
     total = sum(r.get("findings_count", 0) for r in results if isinstance(r, dict))
@@ -327,7 +409,7 @@ async def search_domain_intel(domain: str) -> Dict[str, Any]:
         for f in r.get("findings", []):
             categories[f.get("type", "unknown")] = categories.get(f.get("type", "unknown"), 0) + 1
 
-    return {
+    merged = {
         "domain": domain,
         "providers": {r.get("provider", f"provider_{i}"): r for i, r in enumerate(results)},
         "summary": {
@@ -335,3 +417,6 @@ async def search_domain_intel(domain: str) -> Dict[str, Any]:
             "categories": categories,
         },
     }
+    if not any(r.get("status") == "error" for r in results):
+        domain_intel_cache.set(cache_key, merged, ttl=DOMAIN_INTEL_CACHE_TTL)
+    return merged
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Request-scoped snapshot of a domain's DNS records
+
+A DomainSnapshot fetches each record type (and each DKIM selector) of one domain at
+most once, on first use, and hands the same result to every checker that asks for it
+during the request. Concurrent callers share the in-flight lookup instead of starting
+their own.
+
+Create one per request and pass it to the checkers (overview, record routes,
+verify_*_setup, run_email_test); each of them creates its own if none is given.
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from dns.asyncresolver import Resolver
+
+import dmarc_lookup
+import reputation
+import request_context
+
+
+def _retrieve_exception(future: asyncio.Future) -> None:
+    # Prefetched lookups may never be awaited; don't log their errors as unretrieved
+    if not future.cancelled():
+        future.exception()
+
+
+class DomainSnapshot:
+    """Lazily fetched, memoized DNS records of one domain."""
+
+    def __init__(self, domain: str):
+        self.domain = domain
+        self._fetches: Dict[str, asyncio.Future] = {}
+        self._resolver: Optional[Resolver] = None
+
+    def _fetch(self, key: str, factory: Callable[[], Awaitable[Any]]) -> asyncio.Future:
+        future = self._fetches.get(key)
+        if future is None:
+            # Registered with the request so abandoned lookups are cancelled with it
+            future = request_context.create_task(factory())
+            future.add_done_callback(_retrieve_exception)
+            self._fetches[key] = future
+        return future
+
+    async def _get(self, key: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+        # Shielded so one cancelled consumer does not cancel the lookup for the others
+        return await asyncio.shield(self._fetch(key, factory))
+
+    @property
+    def resolver(self) -> Resolver:
+        if self._resolver is None:
+            self._resolver = dmarc_lookup.new_resolver()
+        return self._resolver
+
+    async def dmarc(self) -> dict:
+        """Result of dmarc_lookup.get_dmarc_record for the domain."""
+        return await self._get("dmarc", lambda: dmarc_lookup.get_dmarc_record(self.domain))
+
+    async def spf(self) -> dict:
+        """Result of dmarc_lookup.get_spf_record for the domain."""
+        return await self._get("spf", lambda: dmarc_lookup.get_spf_record(self.domain))
+
+    async def dns(self) -> dict:
+        """Result of dmarc_lookup.get_all_dns_records for the domain."""
+        return await self._get("dns", lambda: dmarc_lookup.get_all_dns_records(self.domain))
+
+    async def reputation(self) -> dict:
+        """Result of reputation.check_domain_reputation for the domain."""
+        return await self._get("reputation", lambda: reputation.check_domain_reputation(self.domain))
+
+    async def dkim(self, selectors: Optional[List[str]] = None) -> dict:
+        """
+        Same result as dmarc_lookup.get_all_dkim_records, built from per-selector lookups
+        that are shared with any other DKIM request for overlapping selectors.
+
+        Args:
+            selectors (list, optional): DKIM selectors. Defaults to the common selectors.
+
+        Returns:
+            dict: Results per selector plus the overall status.
+        """
+        selectors = dmarc_lookup.validate_dkim_selectors(self.domain, selectors)
+        lookups = await asyncio.gather(*(
+            self._get(
+                f"dkim:{selector}",
+                lambda selector=selector: dmarc_lookup.lookup_dkim_selector(self.resolver, self.domain, selector)
+            )
+            for selector in selectors
+        ))
+        return dmarc_lookup.build_dkim_results(selectors, lookups)
+
+    def prefetch(self, *record_types: str, dkim_selectors: Optional[List[str]] = None) -> None:
+        """
+        Start lookups in the background so later calls find them in flight.
+
+        Args:
+            *record_types: Any of "dmarc", "spf", "dns", "reputation", "dkim".
+            dkim_selectors (list, optional): Selectors to prefetch for "dkim".
+        """
+        for record_type in record_types:
+            if record_type == "dkim":
+                self._fetch(f"prefetch:dkim:{','.join(dkim_selectors or [])}",
+                            lambda: self.dkim(dkim_selectors))
+            else:
+                self._fetch(f"prefetch:{record_type}", getattr(self, record_type))
+
+    def close(self) -> None:
+        """Cancel lookups that are still running (e.g. when the request is abandoned)."""
+        for future in self._fetches.values():
+            if not future.done():
+                future.cancel()
@@ -14,7 +14,7 @@ from datetime import datetime
 from error_handling import (
     DmarcError, DomainError, DnsLookupError, RecordParsingError
 )
-import dmarc_lookup
+from domain_snapshot import DomainSnapshot
 import reputation_check
 
 # Configure logging
@@ -57,13 +57,14 @@ class ValidationError(Exception):
         self.suggestions = suggestions or []
         super().__init__(self.message)
 
-async def run_email_test(test_data):
+async def run_email_test(test_data, snapshot=None):
     """
     Run an email deliverability test - either by actually sending an email
     or by simulating the delivery.
     
     Args:
         test_data (dict): Test parameters including email addresses, content, etc.
+        snapshot (DomainSnapshot, optional): Record snapshot for the tested domain
         
     Returns:
         dict: Test results including score, authentication results, etc.
@@ -89,10 +90,15 @@ async def run_email_test(test_data):
     # Check authentication records for the domain
     domain = test_data['domain']
     auth_results = {}
+    selectors = ['default', 'google', 'selector1', 'selector2']  # Common DKIM selectors
+
+    # All three lookups start at once; the awaits below pick up the shared results
+    snapshot = snapshot or DomainSnapshot(domain)
+    snapshot.prefetch('dmarc', 'spf', 'dkim', dkim_selectors=selectors)
     
     try:
         # Get DMARC record
-        dmarc_data = await dmarc_lookup.get_dmarc_record(domain)
+        dmarc_data = await snapshot.dmarc()
         if 'error' not in dmarc_data:
             auth_results['dmarc'] = {
                 'status': 'pass' if dmarc_data.get('parsed_record', {}).get('p') else 'none',
@@ -106,7 +112,7 @@ async def run_email_test(test_data):
             }
             
         # Get SPF record
-        spf_data = await dmarc_lookup.get_spf_record(domain)
+        spf_data = await snapshot.spf()
         if 'error' not in spf_data:
             # Check for "-all" or "~all" in SPF record
             spf_record = spf_data.get('spf_record', '')
@@ -137,8 +143,7 @@ async def run_email_test(test_data):
             }
             
         # Get DKIM records
-        selectors = ['default', 'google', 'selector1', 'selector2']  # Common selectors
-        dkim_data = await dmarc_lookup.get_all_dkim_records(domain, selectors)
+        dkim_data = await snapshot.dkim(selectors)
         
         # Check if any valid DKIM selector was found
         dkim_status = 'fail'
@@ -1,3 +1,4 @@
+import concurrent.futures
 import logging
 from functools import wraps
 from flask import jsonify
@@ -80,6 +81,58 @@ def handle_dns_exception(exception):
         "suggestions": error_details["suggestions"]
     }
 
+def error_response_for(exception):
+    """
+    Map an exception raised by an API handler to an error payload and status code.
+
+    Shared by the Flask decorator below and the async (ASGI) handlers in asgi.py.
+
+    Args:
+        exception: The exception raised while handling the request
+
+    Returns:
+        tuple: (error response dict, HTTP status code)
+    """
+    e = exception
+    if isinstance(e, DmarcError):
+        logging.error(f"DMARC Error: {e.error_code} - {e.message}")
+        return {
+            "error": e.message,
+            "error_code": e.error_code,
+            "suggestions": e.suggestions
+        }, 400
+    if isinstance(e, dns.resolver.NXDOMAIN):
+        logging.error(f"DNS Error - Domain not found: {e}")
+        return handle_dns_exception(e), 404
+    if isinstance(e, dns.resolver.NoAnswer):
+        logging.error(f"DNS Error - No record found: {e}")
+        return handle_dns_exception(e), 404
+    if isinstance(e, dns.resolver.Timeout):
+        logging.error(f"DNS Error - Timeout: {e}")
+        return handle_dns_exception(e), 408
+    if isinstance(e, dns.exception.DNSException):
+        logging.error(f"DNS Error - General: {e}")
+        return handle_dns_exception(e), 500
+    if isinstance(e, (concurrent.futures.TimeoutError, TimeoutError)):
+        logging.error(f"Request timed out waiting for async work: {e!r}")
+        return {
+            "error": "The check took too long to complete.",
+            "error_code": "REQUEST_TIMEOUT",
+            "suggestions": [
+                "Please try again in a few moments.",
+                "Some DNS servers or external services may be responding slowly."
+            ]
+        }, 504
+    logging.error(f"Unexpected error in API: {e}", exc_info=e)
+    return {
+        "error": "An unexpected error occurred.",
+        "error_code": "INTERNAL_SERVER_ERROR",
+        "suggestions": [
+            "Please try again later.",
+            "If the problem persists, contact support."
+        ]
+    }, 500
+
 def api_error_handler(f):
     """
     Decorator for API routes to handle exceptions consistently.
@@ -94,35 +147,9 @@ def api_error_handler(f):
     def decorated(*args, **kwargs):
         try:
             return f(*args, **kwargs)
-        except DmarcError as e:
-            logging.error(f"DMARC Error: {e.error_code} - {e.message}")
-            return jsonify({
-                "error": e.message,
-                "error_code": e.error_code,
-                "suggestions": e.suggestions
-            }), 400
-        except dns.resolver.NXDOMAIN as e:
-            logging.error(f"DNS Error - Domain not found: {e}")
-            return jsonify(handle_dns_exception(e)), 404
-        except dns.resolver.NoAnswer as e:
-            logging.error(f"DNS Error - No record found: {e}")
-            return jsonify(handle_dns_exception(e)), 404
-        except dns.resolver.Timeout as e:
-            logging.error(f"DNS Error - Timeout: {e}")
-            return jsonify(handle_dns_exception(e)), 408
-        except dns.exception.DNSException as e:
-            logging.error(f"DNS Error - General: {e}")
-            return jsonify(handle_dns_exception(e)), 500
         except Exception as e:
-            logging.exception(f"Unexpected error in API: {e}")
-            return jsonify({
-                "error": "An unexpected error occurred.",
-                "error_code": "INTERNAL_SERVER_ERROR",
-                "suggestions": [
-                    "Please try again later.",
-                    "If the problem persists, contact support."
-                ]
-            }), 500
+            error_response, status_code = error_response_for(e)
+            return jsonify(error_response), status_code
     return decorated
 
 # More specific error handlers for different record types
@@ -1,3 +1,41 @@
+import os
+
 bind = "0.0.0.0:10000"  # Render will use this port
 workers = 4  # Number of worker processes
-timeout = 180  # Increase timeout for DNS operations
\ No newline at end of file
+timeout = 180  # Increase timeout for DNS operations
+threads = 8  # Request threads per worker (gthread); async work shares one event loop per worker
+
+# Import the app once in the master and fork the workers from it, so read-only state
+# (blacklist registries, provider tables, compiled patterns, the HIBP catalog) is
+# shared copy-on-write. Set GUNICORN_PRELOAD=0 to import the app in each worker instead.
+preload_app = os.getenv("GUNICORN_PRELOAD", "1") != "0"
+
+
+def when_ready(server):
+    """Master, after the app is loaded and before the first worker is forked."""
+    import warmup
+
+    if preload_app:
+        warmup.warm_up()
+    server.log.info(f"Master memory before forking: {warmup.format_memory(warmup.memory_usage())}")
+
+
+def post_fork(server, worker):
+    import warmup
+
+    server.log.info(f"Worker {worker.pid} memory after fork: {warmup.format_memory(warmup.memory_usage())}")
+
+
+def post_worker_init(worker):
+    import warmup
+    from cache_snapshot import snapshotter
+
+    snapshotter.ensure_started()
+    worker.log.info(f"Worker {worker.pid} memory after init: {warmup.format_memory(warmup.memory_usage())}")
+
+
+def worker_exit(server, worker):
+    """Worker process, on its way out: snapshot its caches for the next start."""
+    from cache_snapshot import snapshotter
+
+    snapshotter.shutdown()
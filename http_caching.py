@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+HTTP caching for the JSON API: ETag / Last-Modified validators and Cache-Control
+
+Responses of the lookup endpoints (/api/overview, /api/<record_type>, /api/reputation,
+/api/ip-info) get a strong ETag derived from the serialized body and a Cache-Control
+max-age equal to the smallest TTL of the data they were built from: the DNS answers
+and cache entries reported through request_context.limit_max_age, capped at
+HTTP_CACHE_MAX_AGE.
+
+Each worker remembers the validators of the responses it sent for as long as they are
+fresh (keyed like the coalescer: endpoint and normalized parameters). A conditional
+request (If-None-Match, or If-Modified-Since without it) whose validators match a
+remembered response is answered 304 before any lookup runs or anything is serialized.
+Otherwise the response is computed; if its ETag still matches, the answer is a 304 too.
+
+    cached = http_caching.not_modified(key, if_none_match, if_modified_since)
+    if cached is not None:
+        return 304 with cached headers
+    ...compute and serialize body...
+    status, headers = http_caching.finish(key, body, status, max_age, if_none_match, if_modified_since)
+"""
+import hashlib
+import os
+import time
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Dict, Hashable, Optional, Tuple
+
+from cache import SimpleCache
+
+# Longest max-age sent, and the max-age of responses built without any reported TTL
+HTTP_CACHE_MAX_AGE = int(os.getenv("HTTP_CACHE_MAX_AGE", "300"))
+# Validators remembered per worker
+HTTP_CACHE_VALIDATORS = int(os.getenv("HTTP_CACHE_VALIDATORS", "10000"))
+
+_validators = SimpleCache(default_ttl=HTTP_CACHE_MAX_AGE, max_entries=HTTP_CACHE_VALIDATORS, name="http_validators")
+
+
+def _validator_key(key: Hashable) -> str:
+    # "<endpoint>:<parameters>", so cache metrics group validators by endpoint
+    endpoint, params = key
+    return f"{endpoint}:{params!r}"
+
+
+def etag_for(body: bytes) -> str:
+    """Strong ETag of a response body."""
+    return f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header matches `etag` (weak comparison, as RFC 9110 specifies)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = (tag.strip() for tag in if_none_match.split(","))
+    return etag in (tag[2:] if tag.startswith("W/") else tag for tag in candidates)
+
+
+def _not_modified_since(if_modified_since: Optional[str], last_modified: float) -> bool:
+    if not if_modified_since:
+        return False
+    try:
+        return int(last_modified) <= parsedate_to_datetime(if_modified_since).timestamp()
+    except (TypeError, ValueError):
+        return False
+
+
+def _is_fresh(validator: Dict[str, float], if_none_match: Optional[str], if_modified_since: Optional[str]) -> bool:
+    # If-Modified-Since is only considered without If-None-Match
+    if if_none_match:
+        return etag_matches(if_none_match, validator["etag"])
+    return _not_modified_since(if_modified_since, validator["last_modified"])
+
+
+def _headers(etag: str, last_modified: float, max_age: int, private: bool) -> Dict[str, str]:
+    return {
+        "ETag": etag,
+        "Last-Modified": formatdate(last_modified, usegmt=True),
+        "Cache-Control": f"{'private' if private else 'public'}, max-age={max_age}",
+    }
+
+
+def not_modified(key: Hashable, if_none_match: Optional[str], if_modified_since: Optional[str],
+                 private: bool = False) -> Optional[Dict[str, str]]:
+    """
+    Headers for a 304 answer if the request's validators match a fresh remembered response.
+
+    Args:
+        key: Identity of the resource (endpoint and normalized parameters).
+        if_none_match (str, optional): The If-None-Match request header.
+        if_modified_since (str, optional): The If-Modified-Since request header.
+        private (bool): Whether the response depends on the client (Cache-Control: private).
+
+    Returns:
+        dict: Response headers for the 304, or None if the request must be computed.
+    """
+    if key is None or not (if_none_match or if_modified_since):
+        return None
+    validator = _validators.get(_validator_key(key))
+    if validator is None or not _is_fresh(validator, if_none_match, if_modified_since):
+        return None
+    max_age = max(0, int(validator["expires"] - time.time()))
+    return _headers(validator["etag"], validator["last_modified"], max_age, private)
+
+
+def finish(key: Hashable, body: bytes, status: int, max_age: Optional[float], if_none_match: Optional[str],
+           if_modified_since: Optional[str], private: bool = False) -> Tuple[int, Dict[str, str]]:
+    """
+    Status and caching headers for a computed response.
+
+    Args:
+        key: Identity of the resource (endpoint and normalized parameters), or None
+            to send validators without remembering them.
+        body (bytes): The serialized response body.
+        status (int): The response status code.
+        max_age (float, optional): Smallest TTL reported while computing it.
+        if_none_match (str, optional): The If-None-Match request header.
+        if_modified_since (str, optional): The If-Modified-Since request header.
+        private (bool): Whether the response depends on the client (Cache-Control: private).
+
+    Returns:
+        tuple: (304 if the client's copy is still current, else `status`; headers)
+    """
+    if status != 200:
+        return status, {"Cache-Control": "no-cache"}
+
+    max_age = HTTP_CACHE_MAX_AGE if max_age is None else int(min(max_age, HTTP_CACHE_MAX_AGE))
+    etag = etag_for(body)
+    now = time.time()
+    previous = _validators.get(_validator_key(key)) if key is not None else None
+    # Last-Modified is when this content was first sent
+    last_modified = previous["last_modified"] if previous and previous["etag"] == etag else now
+    if key is not None:
+        if max_age > 0:
+            validator = {"etag": etag, "last_modified": last_modified, "expires": now + max_age}
+            _validators.set(_validator_key(key), validator, ttl=max_age)
+        else:
+            _validators.delete(_validator_key(key))
+
+    headers = _headers(etag, last_modified, max_age, private)
+    if _is_fresh({"etag": etag, "last_modified": last_modified}, if_none_match, if_modified_since):
+        return 304, headers
+    return status, headers
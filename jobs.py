@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+Background jobs for long-running checks
+
+Reputation checks, IP lookups and email tests can take longer than the HTTP timeouts of
+proxies in front of the app. POST /api/jobs hands them to a JobQueue instead: the
+request returns a job ID immediately and the check runs on this worker's background
+event loop (see async_runtime.py), at most JOB_WORKERS at a time. Clients poll
+GET /api/jobs/<job_id> for the status and, once finished, the result.
+
+Job records live in a SQLite-backed SimpleCache, so a poll can be answered by any
+worker on the host, and are removed JOB_RESULT_TTL seconds after the job finished.
+Submitting a job identical to one that is still queued or running returns the existing
+job instead of starting another, on any worker of the host: the pending job is claimed
+with an atomic insert into the shared store. When a worker already has JOB_MAX_PENDING jobs
+queued or running, submit() raises JobQueueFull and the API answers 503.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import secrets
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from async_runtime import runtime
+from cache import SimpleCache, CACHE_SQLITE_PATH
+from cache_backends import SqliteBackend
+from error_handling import error_response_for
+import request_context
+
+# Checks run at once per worker process
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "8"))
+# Queued + running jobs per worker process before new jobs are refused
+JOB_MAX_PENDING = int(os.getenv("JOB_MAX_PENDING", "100"))
+# Deadline of a single job, counted from when it starts running
+JOB_TIMEOUT = float(os.getenv("JOB_TIMEOUT", "300"))
+# Finished jobs (and their results) are kept this many seconds
+JOB_RESULT_TTL = int(os.getenv("JOB_RESULT_TTL", "600"))
+# Job records are always stored in SQLite so every worker can answer a poll
+JOB_STATE_PATH = os.getenv(
+    "JOB_STATE_PATH",
+    CACHE_SQLITE_PATH or os.path.join(os.path.dirname(os.path.abspath(__file__)), "instance", "jobs.sqlite3"),
+)
+
+JOB_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{8,64}$")
+FINISHED_STATUSES = ("completed", "failed")
+# Tries at claiming a dedupe key held by a stale claim before running unclaimed
+CLAIM_ATTEMPTS = 3
+
+Runner = Callable[[Dict[str, Any]], Awaitable[Any]]
+
+
+class JobQueueFull(Exception):
+    """Raised by JobQueue.submit() when the worker has no room for another job."""
+    pass
+
+
+class JobQueue:
+    """Runs registered check types as background jobs with bounded concurrency."""
+
+    def __init__(
+        self,
+        store: SimpleCache,
+        workers: int = JOB_WORKERS,
+        max_pending: int = JOB_MAX_PENDING,
+        job_timeout: float = JOB_TIMEOUT,
+        result_ttl: int = JOB_RESULT_TTL,
+    ):
+        self.store = store
+        self.workers = workers
+        self.max_pending = max_pending
+        self.job_timeout = job_timeout
+        self.result_ttl = result_ttl
+        self._runners: Dict[str, Runner] = {}
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._running = 0
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._semaphore_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def register(self, job_type: str, runner: Runner) -> None:
+        """
+        Register a job type.
+
+        Args:
+            job_type (str): Name clients pass as "type".
+            runner: Coroutine function called with the job's (validated) parameters;
+                its JSON-serializable return value becomes the job result.
+        """
+        self._runners[job_type] = runner
+
+    @property
+    def job_types(self):
+        return sorted(self._runners)
+
+    @staticmethod
+    def _dedupe_key(job_type: str, params: Dict[str, Any]) -> str:
+        digest = hashlib.sha256(json.dumps([job_type, params], sort_keys=True).encode()).hexdigest()
+        return f"pending:{digest}"
+
+    def _save(self, job: Dict[str, Any]) -> bool:
+        """Store the job record; False if the store refused it (e.g. a result that is not JSON)."""
+        # Unfinished jobs must outlive their deadline; finished ones are kept for result_ttl
+        ttl = self.result_ttl if job["status"] in FINISHED_STATUSES else self.job_timeout + self.result_ttl
+        return self.store.set(f"job:{job['job_id']}", job, ttl=ttl)
+
+    def _claim(self, dedupe_key: str) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+        """(job id holding a dedupe key, that job if it is still queued or running)"""
+        claim_id = self.store.get(dedupe_key)
+        existing = self.get(claim_id) if claim_id else None
+        if existing is not None and existing["status"] not in FINISHED_STATUSES:
+            return claim_id, existing
+        return claim_id, None
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """The job record (status, timestamps and result or error), or None if unknown or expired."""
+        if not JOB_ID_PATTERN.match(job_id or ""):
+            return None
+        return self.store.get(f"job:{job_id}")
+
+    def submit(self, job_type: str, params: Dict[str, Any]) -> Tuple[Dict[str, Any], bool]:
+        """
+        Queue a job, or find the identical job that is already queued or running.
+
+        Args:
+            job_type (str): A registered job type.
+            params (dict): Validated, normalized parameters (part of the dedupe key).
+
+        Returns:
+            tuple: (job record, True if a new job was created)
+
+        Raises:
+            JobQueueFull: If this worker already has max_pending unfinished jobs.
+        """
+        if job_type not in self._runners:
+            raise ValueError(f"Unknown job type: {job_type}")
+        dedupe_key = self._dedupe_key(job_type, params)
+
+        with self._lock:
+            _, existing = self._claim(dedupe_key)
+            if existing is not None:
+                return existing, False
+
+            if self._pending >= self.max_pending:
+                raise JobQueueFull(f"{self._pending} jobs are already queued or running")
+
+            job = {
+                "job_id": secrets.token_urlsafe(12),
+                "type": job_type,
+                "params": params,
+                "status": "queued",
+                "created": time.time(),
+                "started": None,
+                "finished": None,
+            }
+            # The record is saved before the claim, so a worker that loses the claim
+            # to this job finds it
+            self._save(job)
+            claim_ttl = self.job_timeout + self.result_ttl
+            for _ in range(CLAIM_ATTEMPTS):
+                if self.store.add(dedupe_key, job["job_id"], ttl=claim_ttl):
+                    break
+                # Another worker claimed it first
+                claim_id, existing = self._claim(dedupe_key)
+                if existing is not None:
+                    self.store.delete(f"job:{job['job_id']}")
+                    return existing, False
+                # A claim left by a finished or vanished job: release exactly that claim
+                # (another worker may replace it meanwhile) and try again
+                if claim_id is not None:
+                    self.store.delete_if(dedupe_key, claim_id)
+            else:
+                logging.warning(f"Could not claim {dedupe_key}, running job {job['job_id']} without deduplication")
+            self._pending += 1
+
+        runtime.submit(self._execute(job, dedupe_key))
+        return job, True
+
+    def _worker_slots(self) -> asyncio.Semaphore:
+        # Created on (and bound to) the background loop, which is re-created after a fork
+        loop = asyncio.get_event_loop()
+        if self._semaphore is None or self._semaphore_loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.workers)
+            self._semaphore_loop = loop
+        return self._semaphore
+
+    async def _execute(self, job: Dict[str, Any], dedupe_key: str) -> None:
+        try:
+            async with self._worker_slots():
+                with self._lock:
+                    self._running += 1
+                job = {**job, "status": "running", "started": time.time()}
+                self._save(job)
+                try:
+                    result = await request_context.run(
+                        self._runners[job["type"]](job["params"]),
+                        self.job_timeout,
+                        f"job {job['job_id']} ({job['type']})",
+                    )
+                    job = {**job, "status": "completed", "result": result}
+                except Exception as e:
+                    error_response, _ = error_response_for(e)
+                    job = {**job, "status": "failed", "error": error_response}
+                finally:
+                    with self._lock:
+                        self._running -= 1
+                job["finished"] = time.time()
+                if not self._save(job):
+                    # Without this the last saved (running) record would be served until it expires
+                    job = {key: value for key, value in job.items() if key != "result"}
+                    job.update(status="failed", error={
+                        "error": "The job result could not be stored",
+                        "error_code": "JOB_RESULT_NOT_STORABLE",
+                    })
+                    self._save(job)
+        finally:
+            # Only this job's claim; after a takeover the key belongs to another job
+            self.store.delete_if(dedupe_key, job["job_id"])
+            with self._lock:
+                self._pending -= 1
+
+    def stats(self) -> Dict[str, int]:
+        """Jobs queued and running in this worker process."""
+        with self._lock:
+            return {
+                "queued": self._pending - self._running,
+                "running": self._running,
+                "workers": self.workers,
+                "max_pending": self.max_pending,
+            }
+
+
+job_store = SimpleCache(default_ttl=JOB_RESULT_TTL, backend=SqliteBackend(JOB_STATE_PATH, "jobs"), name="jobs")
+job_queue = JobQueue(job_store)
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Cache and request metrics of this worker process
+
+snapshot() collects the counters kept by the named SimpleCache instances (overall and
+per key prefix, see SimpleCache.prefix_stats()), the request coalescer, request
+cancellation and the job queue. prometheus_text() renders a snapshot in the Prometheus
+text exposition format. app.py serves both behind ADMIN_TOKEN:
+
+    GET /api/admin/cache-stats   JSON snapshot
+    GET /metrics                 Prometheus text
+
+Counters are per worker process (the `pid` label / field tells them apart) and restart
+at zero with the worker; entries kept in a shared backend are counted by every worker
+that reads or writes them.
+"""
+import os
+from typing import Any, Dict, Iterable, List, Tuple
+
+import jobs
+import request_context
+from cache import registered_caches
+from coalescing import coalescer
+
+# Prefix counters exported as dmarc_cache_<name>_total
+_PREFIX_COUNTERS = ("hits", "misses", "stale_served", "sets", "set_bytes", "evictions", "expirations", "get_seconds")
+# Cache-wide gauges exported as dmarc_cache_<name>
+_CACHE_GAUGES = {"total_items": "items", "memory_usage_estimate": "bytes", "max_entries": "max_entries", "max_bytes": "max_bytes"}
+
+
+def snapshot() -> Dict[str, Any]:
+    """All metrics of this worker process as a JSON-serializable dict."""
+    caches = {}
+    for name, cache in registered_caches().items():
+        stats = cache.get_stats()
+        stats["prefixes"] = cache.prefix_stats()
+        caches[name] = stats
+    return {
+        "pid": os.getpid(),
+        "caches": caches,
+        "coalescing": coalescer.stats(),
+        "requests": request_context.metrics(),
+        "jobs": jobs.job_queue.stats(),
+    }
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _sample(name: str, labels: Dict[str, Any], value: Any) -> str:
+    label_text = ",".join(f'{key}="{_escape(label)}"' for key, label in labels.items())
+    value = repr(float(value)) if isinstance(value, float) else str(int(value))
+    return f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}"
+
+
+def _family(lines: List[str], name: str, kind: str, help_text: str, samples: Iterable[Tuple[Dict[str, Any], Any]]) -> None:
+    samples = [(labels, value) for labels, value in samples if isinstance(value, (int, float))]
+    if not samples:
+        return
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} {kind}")
+    lines.extend(_sample(name, labels, value) for labels, value in samples)
+
+
+def prometheus_text(data: Dict[str, Any]) -> str:
+    """Render a snapshot() in the Prometheus text exposition format (version 0.0.4)."""
+    pid = data["pid"]
+    caches = data["caches"]
+    lines: List[str] = []
+
+    for counter in _PREFIX_COUNTERS:
+        _family(lines, f"dmarc_cache_{counter}_total", "counter", f"Cache {counter.replace('_', ' ')} per key prefix", (
+            ({"pid": pid, "cache": name, "prefix": prefix}, counters[counter])
+            for name, stats in caches.items()
+            for prefix, counters in stats["prefixes"].items()
+        ))
+    for field, metric in _CACHE_GAUGES.items():
+        _family(lines, f"dmarc_cache_{metric}", "gauge", f"Cache {metric.replace('_', ' ')} (in-memory caches)", (
+            ({"pid": pid, "cache": name}, stats.get(field)) for name, stats in caches.items()
+        ))
+    _family(lines, "dmarc_coalesced_requests_total", "counter", "Requests computed, coalesced or served from a retained result", (
+        ({"pid": pid, "endpoint": endpoint, "outcome": outcome}, count)
+        for endpoint, counters in data["coalescing"].items()
+        for outcome, count in counters.items()
+    ))
+    for name, count in data["requests"].items():
+        _family(lines, f"dmarc_requests_{name}_total", "counter", f"Request cancellations: {name.replace('_', ' ')}", [({"pid": pid}, count)])
+    for name, count in data["jobs"].items():
+        _family(lines, f"dmarc_jobs_{name}", "gauge", f"Background jobs {name.replace('_', ' ')}", [({"pid": pid}, count)])
+    return "\n".join(lines) + "\n"
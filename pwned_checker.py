@@ -0,0 +1,689 @@
+"""
+Have I Been Pwned (HIBP) integration
+
+Checks email addresses against the HIBP v3 API without downloading the full breach
+objects for every lookup:
+
+- The public breach catalog (`GET /breaches`) is fetched once, indexed by breach name
+  and refreshed on a schedule (`HIBP_CATALOG_REFRESH_SECONDS`) by the bulk worker
+  thread every process runs; lookups also refresh a stale catalog themselves.
+- Per-email lookups use `truncateResponse=true`, so HIBP only returns breach names.
+  The full breach objects are joined back in locally from the catalog.
+- Per-email answers are cached as breach-name lists under a salted hash of the
+  address, so plain email addresses never appear in cache keys.
+
+`check_email` returns `(payload, status_code)` so the Flask route can pass the HIBP
+status (401/403/429/...) straight through to the client.
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import os
+import re
+import secrets
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import aiohttp
+
+from async_runtime import runtime
+from cache import breach_cache
+
+try:
+    import fcntl  # POSIX only; without it every process acts as the bulk worker
+except ImportError:  # Windows development setups
+    fcntl = None
+
+HIBP_API_KEY = os.getenv("HIBP_API_KEY")
+HIBP_BASE_URL = os.getenv("HIBP_BASE_URL", "https://haveibeenpwned.com/api/v3")
+# HIBP requires a User-Agent, be specific
+HIBP_USER_AGENT = "Neozeit-DMARC-Checker/1.0"
+# How long the breach catalog is considered fresh (HIBP adds a handful of breaches per week)
+CATALOG_REFRESH_SECONDS = int(os.getenv("HIBP_CATALOG_REFRESH_SECONDS", str(6 * 3600)))
+# Minimum gap between forced refreshes triggered by unknown breach names
+CATALOG_MIN_REFRESH_GAP = 60
+
+
+def _default_cache_salt() -> bytes:
+    """
+    Salt for per-email cache keys when HIBP_CACHE_SALT is not set: derived from the API
+    key, so every worker and every restart (see cache_snapshot) hashes an address to the
+    same key. Without a key there are no lookups to cache.
+    """
+    if HIBP_API_KEY:
+        return hmac.new(HIBP_API_KEY.encode(), b"dmarc-checker hibp cache salt", hashlib.sha256).digest()
+    return secrets.token_bytes(16)
+
+
+# Set HIBP_CACHE_SALT to keep cache keys independent of the API key
+HIBP_CACHE_SALT = os.getenv("HIBP_CACHE_SALT", "").encode() or _default_cache_salt()
+# Per-email results (breach names only)
+EMAIL_RESULT_TTL = int(os.getenv("HIBP_EMAIL_RESULT_TTL", "3600"))
+
+REQUEST_TIMEOUT = aiohttp.ClientTimeout(total=15)  # per HIBP request
+
+
+class BreachCatalog:
+    """In-memory index of the HIBP breach catalog, keyed by lower-cased breach name."""
+
+    def __init__(self, refresh_seconds: int = CATALOG_REFRESH_SECONDS):
+        self.refresh_seconds = refresh_seconds
+        self.by_name: Dict[str, Dict[str, Any]] = {}
+        self.fetched_at: float = 0.0
+        self._refresh_started: float = 0.0
+
+    def is_stale(self) -> bool:
+        return not self.by_name or time.time() - self.fetched_at >= self.refresh_seconds
+
+    def get(self, name: str) -> Optional[Dict[str, Any]]:
+        return self.by_name.get(name.lower())
+
+    def load(self, breaches: List[Dict[str, Any]]) -> None:
+        """Replace the index with a freshly downloaded catalog."""
+        index = {
+            str(b["Name"]).lower(): b
+            for b in breaches
+            if isinstance(b, dict) and b.get("Name")
+        }
+        # Swap in one assignment so concurrent readers never see a partial index
+        self.by_name = index
+        self.fetched_at = time.time()
+
+    async def refresh(self, session: aiohttp.ClientSession, force: bool = False) -> bool:
+        """
+        Download the catalog if it is stale (or `force` is set).
+
+        Only one refresh runs at a time; callers that lose the race keep using the
+        current index. Returns True if the index was replaced.
+        """
+        now = time.time()
+        if not force and not self.is_stale():
+            return False
+        if now - self._refresh_started < CATALOG_MIN_REFRESH_GAP and self.by_name:
+            return False
+        self._refresh_started = now
+
+        url = f"{HIBP_BASE_URL.rstrip('/')}/breaches"
+        try:
+            async with session.get(url, headers={"User-Agent": HIBP_USER_AGENT}, timeout=REQUEST_TIMEOUT) as response:
+                if response.status != 200:
+                    logging.warning(f"HIBP breach catalog request failed ({response.status})")
+                    return False
+                breaches = await response.json(content_type=None)
+        except (asyncio.TimeoutError, aiohttp.ClientError) as e:
+            logging.warning(f"Could not refresh HIBP breach catalog: {e}")
+            return False
+
+        if not isinstance(breaches, list):
+            logging.warning("Unexpected HIBP breach catalog payload, keeping previous index")
+            return False
+
+        self.load(breaches)
+        logging.info(f"HIBP breach catalog refreshed: {len(self.by_name)} breaches")
+        return True
+
+    def join(self, names: List[str]) -> Tuple[List[Dict[str, Any]], List[str]]:
+        """
+        Expand breach names into full breach objects.
+
+        Returns the joined list and the names missing from the catalog. Missing
+        breaches get a minimal placeholder so the frontend can still render them.
+        """
+        joined: List[Dict[str, Any]] = []
+        missing: List[str] = []
+        for name in names:
+            breach = self.get(name)
+            if breach is None:
+                missing.append(name)
+                breach = {"Name": name, "Title": name, "Description": "", "DataClasses": []}
+            joined.append(breach)
+        return joined, missing
+
+
+catalog = BreachCatalog()
+
+
+async def refresh_catalog() -> bool:
+    """Refresh the breach catalog if it is stale, on the worker's pooled session."""
+    session = await runtime.http_session()
+    return await catalog.refresh(session)
+
+
+def email_cache_key(email: str) -> str:
+    """Salted, non-reversible cache key for an email address."""
+    digest = hmac.new(HIBP_CACHE_SALT, email.strip().lower().encode(), hashlib.sha256).hexdigest()
+    return f"hibp:{digest}"
+
+
+def _build_result(names: List[str]) -> Dict[str, Any]:
+    if not names:
+        return {"status": "not_pwned"}
+    breaches, _ = catalog.join(names)
+    return {"status": "pwned", "breaches": breaches}
+
+
+async def _fetch_breach_names(session: aiohttp.ClientSession, email: str) -> Tuple[Any, int]:
+    """
+    Query HIBP for the breach names of one address.
+
+    Returns `(names, 200)` on success (an empty list when not pwned), otherwise an
+    error payload and the HTTP status to report.
+    """
+    url = f"{HIBP_BASE_URL.rstrip('/')}/breachedaccount/{email}"
+    headers = {"hibp-api-key": HIBP_API_KEY, "User-Agent": HIBP_USER_AGENT}
+    async with session.get(url, headers=headers, params={"truncateResponse": "true"}, timeout=REQUEST_TIMEOUT) as response:
+        if response.status == 200:
+            data = await response.json(content_type=None)
+            return [str(item.get("Name")) for item in data if isinstance(item, dict) and item.get("Name")], 200
+        elif response.status == 404:
+            return [], 200
+        elif response.status == 401:
+            logging.error("HIBP API Key Unauthorized (401)")
+            return {"error": "API key is invalid or unauthorized.", "error_code": "HIBP_UNAUTHORIZED"}, 401
+        elif response.status == 403:
+            logging.error(f"HIBP API Key Forbidden (403) - Check User-Agent: {HIBP_USER_AGENT}")
+            return {"error": "Access forbidden - check User-Agent or API key permissions.", "error_code": "HIBP_FORBIDDEN"}, 403
+        elif response.status == 429:
+            logging.warning("HIBP Rate limit exceeded")
+            retry_after = response.headers.get("Retry-After")
+            wait_time = f" for {retry_after} seconds" if retry_after else ""
+            return {
+                "error": f"Rate limit exceeded. Please try again later{wait_time}.",
+                "error_code": "HIBP_RATE_LIMITED",
+                "retry_after": retry_after,
+            }, 429
+        else:
+            # Attempt to get error message from HIBP response body
+            try:
+                error_detail = await response.json(content_type=None)
+                error_message = error_detail.get("message", "Unknown HIBP API Error")
+            except Exception:
+                error_message = await response.text()  # Fallback to raw text
+            logging.error(f"HIBP API error ({response.status}): {error_message}")
+            return {
+                "error": f"HIBP API error ({response.status}): {error_message}",
+                "error_code": f"HIBP_API_ERROR_{response.status}",
+            }, response.status
+
+
+async def check_email(email: str, pacer: Optional["RatePacer"] = None) -> Tuple[Dict[str, Any], int]:
+    """
+    Check one email address against HIBP.
+
+    Args:
+        email (str): The address to check (already format-validated by the caller).
+        pacer (RatePacer, optional): If given, HIBP calls wait for a pacing slot.
+            Cached answers never consume a slot.
+
+    Returns:
+        tuple: `(payload, status_code)`. On success the payload is
+        `{"status": "pwned", "breaches": [...]}` or `{"status": "not_pwned"}`.
+    """
+    key = email_cache_key(email)
+    cached_names = breach_cache.get(key)
+    if cached_names is not None:
+        logging.debug("Using cached HIBP result")
+        return _build_result(cached_names), 200
+
+    try:
+        if pacer is not None:
+            await pacer.acquire()
+        # Pooled session living on the worker's background loop
+        session = await runtime.http_session()
+        # Catalog refresh runs alongside the per-email lookup
+        names_result, _ = await asyncio.gather(
+            _fetch_breach_names(session, email),
+            catalog.refresh(session),
+        )
+        names, status = names_result
+        if status != 200:
+            return names, status
+
+        # A breach newer than our catalog: pull the catalog once more
+        if names and any(catalog.get(n) is None for n in names):
+            await catalog.refresh(session, force=True)
+    except asyncio.TimeoutError:
+        logging.error("Timeout connecting to HIBP API")
+        return {"error": "Request to breach checking service timed out.", "error_code": "HIBP_TIMEOUT"}, 504
+    except aiohttp.ClientError as e:
+        logging.error(f"Network error connecting to HIBP API: {e}")
+        return {"error": "Could not connect to the breach checking service.", "error_code": "HIBP_CONNECTION_ERROR"}, 503
+    except Exception as e:
+        logging.exception(f"Unexpected error during HIBP check: {e}")
+        return {"error": "An unexpected error occurred while checking for breaches.", "error_code": "HIBP_UNEXPECTED_ERROR"}, 500
+
+    logging.info(f"HIBP lookup complete: {len(names)} breach(es)")
+    breach_cache.set(key, names, ttl=EMAIL_RESULT_TTL)
+    return _build_result(names), 200
+
+
+# ----------------------------- Bulk Breach Checks -----------------------------
+# Bulk jobs check a whole list of mailboxes through one pacing queue per host.
+# Each job lives in HIBP_BULK_STATE_DIR as two files:
+#   <job_id>.json           job metadata (status, timestamps; the addresses until the job ends)
+#   <job_id>.results.jsonl  one line per finished address, appended as results arrive
+# Results refer to addresses by their index in the job's address list, so the plain
+# addresses are dropped once a job ends, and store breach names only (they are joined
+# with the catalog when read).
+# The process holding `worker.lock` processes jobs; a restarted worker resumes any
+# job whose results file is shorter than its address list.
+
+BULK_STATE_DIR = os.getenv(
+    "HIBP_BULK_STATE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "instance", "hibp_jobs"),
+)
+# HIBP rate limits are per API key and depend on the subscription (Pwned 1 = 10 RPM)
+HIBP_REQUESTS_PER_MINUTE = float(os.getenv("HIBP_REQUESTS_PER_MINUTE", "10"))
+BULK_MAX_EMAILS = int(os.getenv("HIBP_BULK_MAX_EMAILS", "1000"))
+# Finished jobs are removed after this many seconds
+BULK_RETENTION_SECONDS = int(os.getenv("HIBP_BULK_RETENTION_SECONDS", str(24 * 3600)))
+BULK_MAX_RETRIES = 5
+# A job whose processing raises this many times in a row is marked failed
+BULK_MAX_JOB_ERRORS = 3
+# HIBP answers that no later address can get past (invalid or revoked API key)
+BULK_FATAL_STATUSES = (401, 403)
+BULK_IDLE_POLL = 1.0  # seconds between scans for new jobs
+BULK_LOCK_RETRY = 5.0  # seconds between attempts to become the bulk worker
+# Seconds a results stream stays open; the client then reconnects with Last-Event-ID
+# and the stream resumes after the last result it received
+BULK_STREAM_WINDOW = float(os.getenv("HIBP_BULK_STREAM_WINDOW", "25"))
+
+EMAIL_PATTERN = re.compile(r"[^@]+@[^@]+\.[^@]+")
+JOB_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{8,64}$")
+
+
+class BulkJobFailed(Exception):
+    """Raised while checking an address when the rest of the job cannot succeed either."""
+
+    def __init__(self, payload: Dict[str, Any]):
+        super().__init__(payload.get("error"))
+        self.payload = payload
+
+
+class RatePacer:
+    """Spaces out HIBP calls so a single worker never exceeds the key's request rate."""
+
+    def __init__(self, requests_per_minute: float = HIBP_REQUESTS_PER_MINUTE):
+        self.interval = 60.0 / max(requests_per_minute, 0.01)
+        self._next_slot = 0.0
+
+    async def acquire(self) -> None:
+        """Wait for the next free request slot."""
+        now = time.monotonic()
+        slot = max(now, self._next_slot)
+        self._next_slot = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    def defer(self, seconds: float) -> None:
+        """Push the next slot back, e.g. after a 429 with Retry-After."""
+        self._next_slot = max(self._next_slot, time.monotonic() + seconds)
+
+
+def parse_stream_cursor(value: Optional[str]) -> int:
+    """Byte offset into a job's results from a Last-Event-ID header (0 if absent or invalid)."""
+    if value and value.strip().isdigit():
+        return int(value.strip())
+    return 0
+
+
+def normalize_email_list(emails: List[Any]) -> Tuple[List[str], List[str]]:
+    """
+    Lower-case, strip and de-duplicate a list of addresses, preserving order.
+
+    Returns:
+        tuple: (valid unique addresses, invalid entries)
+    """
+    seen = set()
+    valid: List[str] = []
+    invalid: List[str] = []
+    for raw in emails:
+        email = str(raw).strip().lower()
+        if not email or email in seen:
+            continue
+        seen.add(email)
+        if EMAIL_PATTERN.fullmatch(email):
+            valid.append(email)
+        else:
+            invalid.append(email)
+    return valid, invalid
+
+
+class BulkCheckManager:
+    """Creates, persists and processes bulk breach-check jobs."""
+
+    def __init__(self, state_dir: str = BULK_STATE_DIR, requests_per_minute: float = HIBP_REQUESTS_PER_MINUTE):
+        self.state_dir = state_dir
+        self.pacer = RatePacer(requests_per_minute)
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._start_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._next_catalog_check = 0.0
+
+    # --- File helpers ---
+    def _meta_path(self, job_id: str) -> str:
+        return os.path.join(self.state_dir, f"{job_id}.json")
+
+    def _results_path(self, job_id: str) -> str:
+        return os.path.join(self.state_dir, f"{job_id}.results.jsonl")
+
+    def _write_meta(self, meta: Dict[str, Any]) -> None:
+        path = self._meta_path(meta["job_id"])
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, path)  # atomic on POSIX and Windows
+
+    def load_meta(self, job_id: str) -> Optional[Dict[str, Any]]:
+        if not JOB_ID_PATTERN.match(job_id or ""):
+            return None
+        try:
+            with open(self._meta_path(job_id), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def read_results(self, job_id: str, offset: int = 0) -> Tuple[List[Dict[str, Any]], int]:
+        """Read complete result lines starting at byte `offset`; returns (results, new_offset)."""
+        try:
+            with open(self._results_path(job_id), "rb") as f:
+                f.seek(offset)
+                chunk = f.read()
+        except OSError:
+            return [], offset
+        # Only consume whole lines, a writer may be mid-append
+        end = chunk.rfind(b"\n") + 1
+        results = []
+        for line in chunk[:end].splitlines():
+            if line.strip():
+                try:
+                    results.append(json.loads(line))
+                except ValueError:
+                    logging.warning(f"Skipping corrupt result line in bulk job {job_id}")
+        return results, offset + end
+
+    def _repair_results(self, job_id: str) -> None:
+        """Drop a partial last line left by a crash mid-append, so appends start on a new line."""
+        try:
+            with open(self._results_path(job_id), "r+b") as f:
+                data = f.read()
+                end = data.rfind(b"\n") + 1
+                if end != len(data):
+                    logging.warning(f"Dropping a partial result line in bulk job {job_id}")
+                    f.truncate(end)
+        except FileNotFoundError:
+            pass
+
+    def _append_result(self, job_id: str, result: Dict[str, Any]) -> None:
+        with open(self._results_path(job_id), "a", encoding="utf-8") as f:
+            f.write(json.dumps(result) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    # --- Public API ---
+    def create_job(self, emails: List[str], invalid: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        Persist a new job and wake the worker. `emails` must already be normalized.
+
+        Results refer to addresses by index: `emails` first, then `invalid`.
+        """
+        os.makedirs(self.state_dir, exist_ok=True)
+        job_id = secrets.token_urlsafe(12)
+        meta = {
+            "job_id": job_id,
+            "status": "queued",
+            "emails": emails,
+            "total": len(emails) + len(invalid or []),
+            "created": time.time(),
+            "finished": None,
+        }
+        self._write_meta(meta)
+        # Invalid addresses are answered immediately so totals line up
+        for index in range(len(emails), meta["total"]):
+            self._append_result(job_id, {"index": index, "status": "error", "error_code": "INVALID_EMAIL_FORMAT"})
+        self.ensure_started()
+        self._wakeup.set()
+        return meta
+
+    def job_status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Current progress and results of a job, with breaches joined from the catalog."""
+        meta = self.load_meta(job_id)
+        if meta is None:
+            return None
+        results, _ = self.read_results(job_id)
+        status = {
+            "job_id": job_id,
+            "status": meta["status"],
+            "total": meta["total"],
+            "completed": len(results),
+            "created": meta["created"],
+            "finished": meta.get("finished"),
+            "results": [self.expand_result(r) for r in results],
+        }
+        if meta.get("error"):
+            status["error"] = meta["error"]
+        return status
+
+    @staticmethod
+    def expand_result(result: Dict[str, Any]) -> Dict[str, Any]:
+        if result.get("status") == "pwned":
+            breaches, _ = catalog.join(result.get("breaches", []))
+            return {**result, "breaches": breaches}
+        return result
+
+    def _poll_events(self, job_id: str, offset: int) -> Tuple[List[Tuple[str, Dict[str, Any], Optional[str]]], int, bool]:
+        """
+        Events for the results appended after byte `offset`.
+
+        Returns:
+            tuple: ([(event, data, event_id)], new offset, whether the job is over). The
+            last event carries the new offset as its id, for Last-Event-ID.
+        """
+        results, offset = self.read_results(job_id, offset)
+        events = [("result", self.expand_result(result)) for result in results]
+        meta = self.load_meta(job_id)
+        finished = meta is None or meta["status"] in ("completed", "failed")
+        if meta is None:
+            events.append(("error", {"error": "Bulk job not found", "error_code": "BULK_JOB_NOT_FOUND"}))
+        elif finished:
+            # Drain anything appended between the read and the status check
+            results, offset = self.read_results(job_id, offset)
+            events.extend(("result", self.expand_result(result)) for result in results)
+            done = {"job_id": job_id, "status": meta["status"], "total": meta["total"]}
+            if meta.get("error"):
+                done["error"] = meta["error"]
+            events.append(("done", done))
+        return [
+            (event, data, str(offset) if i == len(events) - 1 else None)
+            for i, (event, data) in enumerate(events)
+        ], offset, finished
+
+    def iter_events(self, job_id: str, offset: int = 0, window: float = BULK_STREAM_WINDOW,
+                    poll_interval: float = 1.0):
+        """
+        Yield `(event, data, event_id)` for a job: one "result" per address finished
+        after byte `offset` (see parse_stream_cursor), then a final "done" event.
+
+        Stops after `window` seconds even if the job is still running, so a stream
+        never holds a request thread for the life of a job; the client reconnects and
+        resumes from the last event id. Works from any worker since it tails the job files.
+        """
+        deadline = time.monotonic() + window
+        while True:
+            events, offset, finished = self._poll_events(job_id, offset)
+            yield from events
+            if finished or time.monotonic() >= deadline:
+                return
+            time.sleep(poll_interval)
+
+    async def aiter_events(self, job_id: str, offset: int = 0, window: float = BULK_STREAM_WINDOW,
+                           poll_interval: float = 1.0):
+        """iter_events() as an async generator, for the ASGI server."""
+        deadline = time.monotonic() + window
+        while True:
+            events, offset, finished = self._poll_events(job_id, offset)
+            for event in events:
+                yield event
+            if finished or time.monotonic() >= deadline:
+                return
+            await asyncio.sleep(poll_interval)
+
+    # --- Worker ---
+    def ensure_started(self) -> None:
+        """Start the bulk worker thread in this process (no-op if already running)."""
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            os.makedirs(self.state_dir, exist_ok=True)
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="hibp-bulk-worker", daemon=True)
+            self._thread.start()
+
+    def _try_acquire_worker_lock(self):
+        if fcntl is None:
+            return True
+        lock_file = open(os.path.join(self.state_dir, "worker.lock"), "a")
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return None
+        # Kept open for the life of the process; the OS drops the lock if we die
+        return lock_file
+
+    def _pending_jobs(self) -> List[Dict[str, Any]]:
+        jobs = []
+        for name in os.listdir(self.state_dir):
+            if not name.endswith(".json"):
+                continue
+            meta = self.load_meta(name[:-len(".json")])
+            if meta is not None:
+                jobs.append(meta)
+        return sorted(jobs, key=lambda m: m["created"])
+
+    def _cleanup_expired_jobs(self, jobs: List[Dict[str, Any]]) -> None:
+        now = time.time()
+        for meta in jobs:
+            finished = meta.get("finished")
+            if finished and now - finished > BULK_RETENTION_SECONDS:
+                for path in (self._meta_path(meta["job_id"]), self._results_path(meta["job_id"])):
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+
+    def _finish(self, meta: Dict[str, Any], status: str, error: Optional[Dict[str, Any]] = None) -> None:
+        meta["status"] = status
+        meta["finished"] = time.time()
+        meta.pop("emails", None)  # results only need the indexes from here on
+        if error is not None:
+            meta["error"] = error
+        self._write_meta(meta)
+
+    def _refresh_catalog_if_due(self) -> None:
+        """Keep this process's breach catalog fresh between requests (checked once a minute)."""
+        now = time.monotonic()
+        if now < self._next_catalog_check:
+            return
+        self._next_catalog_check = now + CATALOG_MIN_REFRESH_GAP
+        if catalog.is_stale():
+            runtime.run(refresh_catalog())
+
+    def _run(self) -> None:
+        worker_lock = None
+        errors: Dict[str, int] = {}  # consecutive processing errors per job
+        while True:
+            job = None
+            try:
+                # Every process runs this thread, bulk worker or not, and keeps its own catalog
+                self._refresh_catalog_if_due()
+                if worker_lock is None:
+                    worker_lock = self._try_acquire_worker_lock()
+                    if worker_lock is None:
+                        # Another process is the bulk worker; check again later in case it exits
+                        time.sleep(BULK_LOCK_RETRY)
+                        continue
+                jobs = self._pending_jobs()
+                pending = [m for m in jobs if m["status"] in ("queued", "running")]
+                if not pending:
+                    self._cleanup_expired_jobs(jobs)
+                    self._wakeup.wait(BULK_IDLE_POLL)
+                    self._wakeup.clear()
+                    continue
+                job = pending[0]
+                # Jobs run on the worker's shared event loop; this thread only waits
+                runtime.run(self._process_job(job), timeout=None)
+                errors.pop(job["job_id"], None)
+            except Exception as e:
+                logging.exception(f"Bulk breach worker error: {e}")
+                if job is not None:
+                    self._record_job_error(job, errors)
+                time.sleep(BULK_IDLE_POLL)
+
+    def _record_job_error(self, meta: Dict[str, Any], errors: Dict[str, int]) -> None:
+        """Count a failed attempt at a job; give up on it after BULK_MAX_JOB_ERRORS in a row."""
+        job_id = meta["job_id"]
+        errors[job_id] = errors.get(job_id, 0) + 1
+        if errors[job_id] < BULK_MAX_JOB_ERRORS:
+            return
+        del errors[job_id]
+        logging.error(f"Bulk job {job_id} failed {BULK_MAX_JOB_ERRORS} times in a row, giving up")
+        try:
+            self._finish(meta, "failed", {"error": "The bulk check could not be processed.", "error_code": "BULK_JOB_ERROR"})
+        except OSError as e:
+            logging.error(f"Could not mark bulk job {job_id} as failed: {e}")
+
+    async def _process_job(self, meta: Dict[str, Any]) -> None:
+        job_id = meta["job_id"]
+        self._repair_results(job_id)
+        done, _ = self.read_results(job_id)
+        done_indexes = {r.get("index") for r in done}
+        remaining = [(i, e) for i, e in enumerate(meta["emails"]) if i not in done_indexes]
+        if meta["status"] == "running" and done_indexes:
+            logging.info(f"Resuming bulk job {job_id}: {len(remaining)} address(es) left")
+
+        meta["status"] = "running"
+        self._write_meta(meta)
+
+        try:
+            for index, email in remaining:
+                self._append_result(job_id, {"index": index, **await self._check_one(email)})
+        except BulkJobFailed as e:
+            # Every remaining address would fail the same way and still use up a request slot
+            self._finish(meta, "failed", e.payload)
+            logging.error(f"Bulk job {job_id} failed: {e}")
+            return
+
+        self._finish(meta, "completed")
+        logging.info(f"Bulk job {job_id} completed ({meta['total']} address(es))")
+
+    async def _check_one(self, email: str) -> Dict[str, Any]:
+        for _ in range(BULK_MAX_RETRIES):
+            payload, status = await check_email(email, pacer=self.pacer)
+            if status == 200:
+                return {
+                    "status": payload["status"],
+                    "breaches": [b["Name"] for b in payload.get("breaches", [])],
+                }
+            if status == 429:
+                try:
+                    retry_after = float(payload.get("retry_after") or 0)
+                except ValueError:
+                    retry_after = 0.0
+                self.pacer.defer(max(retry_after, self.pacer.interval))
+                continue
+            if status in BULK_FATAL_STATUSES:
+                raise BulkJobFailed(payload)
+            return {"status": "error", "error_code": payload.get("error_code")}
+        return {"status": "error", "error_code": "HIBP_RATE_LIMITED"}
+
+
+bulk_manager = BulkCheckManager()
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+Minimal Redis-protocol server for tests and benchmarks
+
+Implements the subset of commands RedisBackend uses (PING, AUTH, SELECT, GET, MGET, SET
+with EX/PX/EXAT/PXAT/NX/XX, DEL, SCAN, DBSIZE, FLUSHDB, FLUSHALL, QUIT) over RESP, with
+key expiry. Everything lives in one in-process dict, so it is not a database: it lets
+the test suite and bench_cache_backends.py exercise the networked cache backend, and
+several app instances share it, without a Redis installation.
+
+    server = RedisStandin(port=0)      # 0 picks a free port
+    server.start()                     # serves on a daemon thread
+    url = server.url                   # e.g. redis://127.0.0.1:54321/0
+    server.stop()
+
+Or standalone:
+    python redis_standin.py --port 6399
+"""
+import argparse
+import fnmatch
+import socketserver
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self) -> None:
+        server: "RedisStandin" = self.server.standin
+        while True:
+            try:
+                command = self._read_command()
+            except (ConnectionError, ValueError):
+                return
+            if command is None:
+                return
+            reply = server.execute(command)
+            self.wfile.write(reply)
+            if command and command[0].upper() == b"QUIT":
+                return
+
+    def _read_command(self) -> Optional[List[bytes]]:
+        line = self.rfile.readline()
+        if not line:
+            return None
+        if not line.startswith(b"*"):
+            # Inline command (e.g. typed into telnet)
+            return line.split()
+        args = []
+        for _ in range(int(line[1:-2])):
+            header = self.rfile.readline()
+            if not header.startswith(b"$"):
+                raise ValueError("Expected a bulk string")
+            length = int(header[1:-2])
+            data = self.rfile.read(length + 2)
+            if len(data) != length + 2:
+                raise ConnectionError("Client went away")
+            args.append(data[:-2])
+        return args
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def _bulk(value: Optional[bytes]) -> bytes:
+    if value is None:
+        return b"$-1\r\n"
+    return b"$%d\r\n%s\r\n" % (len(value), value)
+
+
+def _array(values: List[Optional[bytes]]) -> bytes:
+    return b"*%d\r\n" % len(values) + b"".join(_bulk(value) for value in values)
+
+
+def _error(message: str) -> bytes:
+    return f"-ERR {message}\r\n".encode()
+
+
+class RedisStandin:
+    """In-process Redis-protocol server with one keyspace per SELECTable database number."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, password: Optional[str] = None):
+        self.password = password
+        # database number -> key -> (value, expiry in epoch ms or None)
+        self._data: Dict[int, Dict[bytes, Tuple[bytes, Optional[int]]]] = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._server = _Server((host, port), _Handler, bind_and_activate=True)
+        self._server.standin = self
+        self._thread: Optional[threading.Thread] = None
+        self.commands = 0  # commands processed, for benchmarks
+
+    @property
+    def address(self) -> Tuple[str, int]:
+        return self._server.server_address[:2]
+
+    @property
+    def url(self) -> str:
+        host, port = self.address
+        return f"redis://{host}:{port}/0"
+
+    def start(self) -> "RedisStandin":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="redis-standin", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def serve_forever(self) -> None:
+        self._server.serve_forever()
+
+    # --- Commands ---
+    def _db(self) -> Dict[bytes, Tuple[bytes, Optional[int]]]:
+        return self._data.setdefault(getattr(self._local, "db", 0), {})
+
+    def _live(self, db, key: bytes, now_ms: int) -> Optional[bytes]:
+        item = db.get(key)
+        if item is None:
+            return None
+        if item[1] is not None and item[1] <= now_ms:
+            del db[key]
+            return None
+        return item[0]
+
+    def execute(self, command: List[bytes]) -> bytes:
+        """Run one command (connection state is per handler thread) and return the RESP reply."""
+        if not command:
+            return _error("empty command")
+        name = command[0].upper().decode(errors="replace")
+        args = command[1:]
+        self.commands += 1
+        if name == "AUTH":
+            if self.password is not None and args[-1:] != [self.password.encode()]:
+                return b"-WRONGPASS invalid password\r\n"
+            self._local.authenticated = True
+            return b"+OK\r\n"
+        if self.password is not None and not getattr(self._local, "authenticated", False):
+            return b"-NOAUTH Authentication required.\r\n"
+        handler = getattr(self, f"_cmd_{name.lower()}", None)
+        if handler is None:
+            return _error(f"unknown command '{name}'")
+        try:
+            with self._lock:
+                return handler(args, int(time.time() * 1000))
+        except (IndexError, ValueError):
+            return _error(f"wrong number or type of arguments for '{name.lower()}' command")
+
+    def _cmd_ping(self, args, now_ms):
+        return _bulk(args[0]) if args else b"+PONG\r\n"
+
+    def _cmd_quit(self, args, now_ms):
+        return b"+OK\r\n"
+
+    def _cmd_select(self, args, now_ms):
+        self._local.db = int(args[0])
+        return b"+OK\r\n"
+
+    def _cmd_get(self, args, now_ms):
+        return _bulk(self._live(self._db(), args[0], now_ms))
+
+    def _cmd_mget(self, args, now_ms):
+        if not args:
+            raise ValueError
+        db = self._db()
+        return _array([self._live(db, key, now_ms) for key in args])
+
+    def _cmd_set(self, args, now_ms):
+        key, value = args[0], args[1]
+        expires, condition = None, None
+        options = iter(args[2:])
+        for option in options:
+            option = option.upper()
+            if option in (b"NX", b"XX"):
+                condition = option
+            elif option == b"EX":
+                expires = now_ms + int(next(options)) * 1000
+            elif option == b"PX":
+                expires = now_ms + int(next(options))
+            elif option == b"EXAT":
+                expires = int(next(options)) * 1000
+            elif option == b"PXAT":
+                expires = int(next(options))
+            else:
+                return _error("syntax error")
+        db = self._db()
+        exists = self._live(db, key, now_ms) is not None
+        if (condition == b"NX" and exists) or (condition == b"XX" and not exists):
+            return _bulk(None)
+        db[key] = (value, expires)
+        return b"+OK\r\n"
+
+    def _cmd_del(self, args, now_ms):
+        if not args:
+            raise ValueError
+        db = self._db()
+        removed = sum(1 for key in args if self._live(db, key, now_ms) is not None and db.pop(key))
+        return b":%d\r\n" % removed
+
+    def _cmd_dbsize(self, args, now_ms):
+        db = self._db()
+        return b":%d\r\n" % sum(1 for key in list(db) if self._live(db, key, now_ms) is not None)
+
+    def _cmd_scan(self, args, now_ms):
+        # The cursor is a position in the sorted key list; keys added during a scan
+        # may be missed, as Redis allows
+        cursor, pattern, count = int(args[0]), None, 10
+        options = iter(args[1:])
+        for option in options:
+            option = option.upper()
+            if option == b"MATCH":
+                pattern = next(options).decode("utf-8", errors="surrogateescape")
+            elif option == b"COUNT":
+                count = max(1, int(next(options)))
+            else:
+                return _error("syntax error")
+        db = self._db()
+        keys = sorted(db)
+        batch = keys[cursor:cursor + count]
+        next_cursor = cursor + count if cursor + count < len(keys) else 0
+        matches = [
+            key for key in batch
+            if self._live(db, key, now_ms) is not None
+            and (pattern is None or fnmatch.fnmatchcase(key.decode("utf-8", errors="surrogateescape"), pattern))
+        ]
+        return b"*2\r\n" + _bulk(str(next_cursor).encode()) + _array(matches)
+
+    def _cmd_flushdb(self, args, now_ms):
+        self._db().clear()
+        return b"+OK\r\n"
+
+    def _cmd_flushall(self, args, now_ms):
+        self._data.clear()
+        return b"+OK\r\n"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run a minimal Redis-protocol server for local testing")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6399)
+    parser.add_argument("--password", help="require AUTH with this password")
+    args = parser.parse_args()
+
+    server = RedisStandin(args.host, args.port, args.password)
+    print(f"Serving {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
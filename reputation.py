@@ -8,8 +8,10 @@ import logging
 import json
 import re
 import os # Ensure os is imported
+import request_context
+from dmarc_lookup import TtlReportingResolver
 from error_handling import DmarcError, DomainError, DnsLookupError
-from cache import ip_info_cache, reputation_cache, external_api_cache
+from cache import ip_info_cache, reputation_cache, external_api_cache, cached, TtlPolicy
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
@@ -18,6 +20,64 @@ logging.basicConfig(level=logging.DEBUG)
 ABUSEIPDB_API_KEY = os.getenv("ABUSEIPDB_API_KEY")
 VIRUSTOTAL_API_KEY = os.getenv("VIRUSTOTAL_API_KEY")
 
+# Per-request timeout for AbuseIPDB/VirusTotal calls (shortened to the request's deadline)
+EXTERNAL_API_TIMEOUT = 15
+
+def external_api_timeout():
+    return aiohttp.ClientTimeout(total=request_context.timeout_for(EXTERNAL_API_TIMEOUT))
+
+# --- Provider payload projection ---
+# Only these fields of each provider payload are cached and returned by default
+# (dot-separated paths inside the source's "data" object). They cover everything
+# calculate_overall_reputation_score, the recommendations and the IP checker UI read.
+# Callers that pass detail="full" (`/api/ip-info?detail=full`) get the complete payload.
+PROVIDER_PROJECTIONS = {
+    "AbuseIPDB": [
+        "data.ipAddress",
+        "data.abuseConfidencePercentage",
+        "data.totalReports",
+        "data.numDistinctUsers",
+        "data.usageType",
+        "data.isp",
+        "data.domain",
+        "data.countryCode",
+        "data.isWhitelisted",
+        "data.lastReportedAt",
+    ],
+    "VirusTotal": [
+        "reputation",
+        "last_analysis_stats",
+        "as_owner",
+        "last_modification_date",
+    ],
+}
+
+def project_fields(payload, paths):
+    """
+    Copy only the given dot-separated paths from a nested dict.
+
+    Args:
+        payload (dict): Provider payload.
+        paths (list): Paths to keep, e.g. "data.abuseConfidencePercentage".
+
+    Returns:
+        dict: A new dict containing only the requested paths that exist in payload.
+    """
+    projected = {}
+    for path in paths:
+        parts = path.split(".")
+        source = payload
+        for part in parts:
+            if not isinstance(source, dict) or part not in source:
+                break
+            source = source[part]
+        else:
+            target = projected
+            for part in parts[:-1]:
+                target = target.setdefault(part, {})
+            target[parts[-1]] = source
+    return projected
+
 # Placeholder for your existing DNSBL list or logic from reputation_check.py
 # You might want to expand this list:
 ADDITIONAL_DNSBLS = [
@@ -40,7 +100,7 @@ async def get_ip_info(ip_address=None):
             api_url = f"https://ipapi.co/{ip_address if ip_address else 'json'}/json/"
 
             async with aiohttp.ClientSession() as session:
-                async with session.get(api_url, timeout=5) as response:
+                async with session.get(api_url, timeout=request_context.timeout_for(5)) as response:
                     if response.status == 200:
                         data = await response.json()
 
@@ -64,7 +124,7 @@ async def get_ip_info(ip_address=None):
             fallback_url = f"https://ipinfo.io/{ip_address if ip_address else ''}/json"
 
             async with aiohttp.ClientSession() as session:
-                async with session.get(fallback_url, timeout=5) as response:
+                async with session.get(fallback_url, timeout=request_context.timeout_for(5)) as response:
                     if response.status == 200:
                         data = await response.json()
                         # Check for rate limit or other specific errors from ipinfo if necessary
@@ -81,7 +141,7 @@ async def get_ip_info(ip_address=None):
         if not ip_address:
             try:
                 async with aiohttp.ClientSession() as session:
-                    async with session.get("https://api.ipify.org?format=json", timeout=5) as response:
+                    async with session.get("https://api.ipify.org?format=json", timeout=request_context.timeout_for(5)) as response:
                         if response.status == 200:
                             data = await response.json()
                             ip = data.get('ip')
@@ -224,7 +284,7 @@ async def check_ip_reputation(ip_address):
     }
 
     # Use the IP-based blacklists defined below
-    ip_blacklists = [item for item in BLACKLISTS if item["type"] == "ip"]
+    ip_blacklists = IP_BLACKLISTS
     results["total_services"] = len(ip_blacklists)
 
     tasks = []
@@ -233,7 +293,9 @@ async def check_ip_reputation(ip_address):
 
     # Run all tasks concurrently with a timeout
     try:
-        service_results = await asyncio.wait_for(asyncio.gather(*tasks, return_exceptions=True), timeout=25)
+        service_results = await asyncio.wait_for(
+            request_context.gather(*tasks, return_exceptions=True), timeout=request_context.timeout_for(25)
+        )
     except asyncio.TimeoutError:
         logging.warning(f"Timeout during IP blacklist check for {ip_address}")
         return {**results, "error": "IP reputation check timed out", "error_code": "IP_REPUTATION_TIMEOUT"}
@@ -267,91 +329,120 @@ async def check_ip_reputation(ip_address):
     return results
 
 
-async def query_abuseipdb(session, ip_address):
+def provider_outcome(result):
+    """Outcome of an external provider lookup, for its cache TTL (see PROVIDER_TTL_POLICY)."""
+    if "error" in result:
+        return "rate_limited" if result.get("rate_limited") else "error"
+    return "not_found" if "info" in result and "data" not in result else "success"
+
+
+# Successful lookups use external_api_cache's default TTL; 404s are kept for 5 minutes,
+# API and connection errors for a minute (so the API is not hammered), rate limits not at all
+PROVIDER_TTL_POLICY = TtlPolicy(success=None, not_found=300, rate_limited=0, error=60, classify=provider_outcome)
+
+
+async def query_abuseipdb(session, ip_address, detail="summary"):
     if not ABUSEIPDB_API_KEY:
         return {"error": "AbuseIPDB API key not configured", "source": "AbuseIPDB"}
-    
-    # Check cache first
-    cache_key = external_api_cache._generate_key("abuseipdb", ip_address)
-    cached_result = external_api_cache.get(cache_key)
-    if cached_result:
-        logging.debug(f"Using cached AbuseIPDB result for {ip_address}")
-        return cached_result
-    
+
+    full = detail == "full"
+    cache_key = external_api_cache._generate_key("abuseipdb_full" if full else "abuseipdb", ip_address)
+    return await external_api_cache.get_or_compute(
+        cache_key, lambda: _fetch_abuseipdb(session, ip_address, full), PROVIDER_TTL_POLICY
+    )
+
+
+async def _fetch_abuseipdb(session, ip_address, full):
+    if session.closed:
+        # A background refresh of a stale cache entry outlives the caller's session
+        async with aiohttp.ClientSession() as own_session:
+            return await _fetch_abuseipdb(own_session, ip_address, full)
     url = "https://api.abuseipdb.com/api/v2/check"
     headers = {"Key": ABUSEIPDB_API_KEY, "Accept": "application/json"}
-    params = {"ipAddress": ip_address, "maxAgeInDays": "90", "verbose": ""} # Added verbose for more details
+    params = {"ipAddress": ip_address, "maxAgeInDays": "90"}
+    if full:
+        params["verbose"] = ""  # Individual reports, only needed for the full payload
     try:
-        async with session.get(url, headers=headers, params=params) as response:
+        async with session.get(url, headers=headers, params=params, timeout=external_api_timeout()) as response:
             if response.status == 200:
-                result = {"data": await response.json(), "source": "AbuseIPDB"}
-                external_api_cache.set(cache_key, result)  # Cache successful result
-                return result
+                data = await response.json()
+                if not full:
+                    data = project_fields(data, PROVIDER_PROJECTIONS["AbuseIPDB"])
+                return {"data": data, "source": "AbuseIPDB"}
             # Handle rate limits (often 429) and other errors
             elif response.status == 429:
-                error_result = {"error": "AbuseIPDB rate limit exceeded", "source": "AbuseIPDB"}
-                # Don't cache rate limit errors
-                return error_result
+                return {"error": "AbuseIPDB rate limit exceeded", "rate_limited": True, "source": "AbuseIPDB"}
             else:
-                error_result = {"error": f"AbuseIPDB API error: {response.status}", "details": await response.text(), "source": "AbuseIPDB"}
-                # Cache API errors for a short time to avoid hammering the API
-                external_api_cache.set(cache_key, error_result, ttl=60)
-                return error_result
+                return {"error": f"AbuseIPDB API error: {response.status}", "details": await response.text(), "source": "AbuseIPDB"}
     except Exception as e:
-        error_result = {"error": f"Failed to query AbuseIPDB: {str(e)}", "source": "AbuseIPDB"}
-        # Cache connection errors for a short time
-        external_api_cache.set(cache_key, error_result, ttl=60)
-        return error_result
+        return {"error": f"Failed to query AbuseIPDB: {str(e)}", "source": "AbuseIPDB"}
 
 
-async def query_virustotal_ip(session, ip_address):
+async def query_virustotal_ip(session, ip_address, detail="summary"):
     if not VIRUSTOTAL_API_KEY:
         return {"error": "VirusTotal API key not configured", "source": "VirusTotal"}
-    
-    # Check cache first
-    cache_key = external_api_cache._generate_key("virustotal", ip_address)
-    cached_result = external_api_cache.get(cache_key)
-    if cached_result:
-        logging.debug(f"Using cached VirusTotal result for {ip_address}")
-        return cached_result
-    
+
+    full = detail == "full"
+    cache_key = external_api_cache._generate_key("virustotal_full" if full else "virustotal", ip_address)
+    return await external_api_cache.get_or_compute(
+        cache_key, lambda: _fetch_virustotal_ip(session, ip_address, full), PROVIDER_TTL_POLICY
+    )
+
+
+async def _fetch_virustotal_ip(session, ip_address, full):
+    if session.closed:
+        # A background refresh of a stale cache entry outlives the caller's session
+        async with aiohttp.ClientSession() as own_session:
+            return await _fetch_virustotal_ip(own_session, ip_address, full)
     url = f"https://www.virustotal.com/api/v3/ip_addresses/{ip_address}"
     headers = {"x-apikey": VIRUSTOTAL_API_KEY}
     try:
-        async with session.get(url, headers=headers) as response:
+        async with session.get(url, headers=headers, timeout=external_api_timeout()) as response:
             if response.status == 200:
                 data = await response.json()
-                result = {
-                    "data": {
-                        "reputation": data.get("data", {}).get("attributes", {}).get("reputation"),
-                        "last_analysis_stats": data.get("data", {}).get("attributes", {}).get("last_analysis_stats"),
-                        "as_owner": data.get("data", {}).get("attributes", {}).get("as_owner"),
-                        "last_modification_date": data.get("data", {}).get("attributes", {}).get("last_modification_date"),
-                        # Add more fields as needed
-                    },
+                attributes = data.get("data", {}).get("attributes", {})
+                if not full:
+                    # Drops e.g. last_analysis_results (~90 engine verdicts)
+                    attributes = project_fields(attributes, PROVIDER_PROJECTIONS["VirusTotal"])
+                return {
+                    "data": attributes,
                     "source": "VirusTotal"
                 }
-                external_api_cache.set(cache_key, result)  # Cache successful result
-                return result
             elif response.status == 404:
-                info_result = {"info": "IP address not found in VirusTotal", "source": "VirusTotal"}
-                external_api_cache.set(cache_key, info_result, ttl=300)  # Cache 404s for shorter time
-                return info_result
+                return {"info": "IP address not found in VirusTotal", "source": "VirusTotal"}
             elif response.status == 429: # Common for rate limits
-                error_result = {"error": "VirusTotal rate limit exceeded", "source": "VirusTotal"}
-                # Don't cache rate limit errors
-                return error_result
+                return {"error": "VirusTotal rate limit exceeded", "rate_limited": True, "source": "VirusTotal"}
             else:
-                error_result = {"error": f"VirusTotal API error: {response.status}", "details": await response.text(), "source": "VirusTotal"}
-                external_api_cache.set(cache_key, error_result, ttl=60)  # Cache API errors briefly
-                return error_result
+                return {"error": f"VirusTotal API error: {response.status}", "details": await response.text(), "source": "VirusTotal"}
     except Exception as e:
-        error_result = {"error": f"Failed to query VirusTotal: {str(e)}", "source": "VirusTotal"}
-        external_api_cache.set(cache_key, error_result, ttl=60)  # Cache connection errors briefly
-        return error_result
+        return {"error": f"Failed to query VirusTotal: {str(e)}", "source": "VirusTotal"}
 
 # You would also add functions for other services like IPQualityScore, AlienVault OTX etc.
 
+# Default comprehensive list of DNSBL servers for check_comprehensive_dnsbls
+DEFAULT_DNSBL_SERVERS = (
+    "zen.spamhaus.org",
+    "bl.spamcop.net",
+    "dnsbl.sorbs.net",
+    "b.barracudacentral.org",
+    "ix.dnsbl.manitu.net",
+    "psbl.surriel.com",
+    "ubl.unsubscore.com",
+    "cbl.abuseat.org",
+    "pbl.spamhaus.org",
+    "sbl.spamhaus.org",
+    "xbl.spamhaus.org",
+    "dnsbl-1.uceprotect.net",
+    "dnsbl-2.uceprotect.net",
+    "dnsbl-3.uceprotect.net",
+    "bl.spamcannibal.org",
+    "dyna.spamrats.com",
+    "noptr.spamrats.com",
+    "spam.spamrats.com",
+)
+
+IPV4_PATTERN = re.compile(r'^\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}$')
+
 # --- DNSBL Checking (Enhance or integrate existing logic) ---
 # This function should be merged/enhanced with your existing DNSBL logic from reputation_check.py
 # Ensure it uses dnspython asynchronously if possible (e.g., using asyncio.to_thread for resolver calls)
@@ -367,30 +458,10 @@ async def check_comprehensive_dnsbls(ip_address, dnsbl_servers_list=None):
         dict: DNSBL check results with detailed information
     """
     if not dnsbl_servers_list:
-        # Default comprehensive list of DNSBL servers
-        dnsbl_servers_list = [
-            "zen.spamhaus.org",
-            "bl.spamcop.net", 
-            "dnsbl.sorbs.net",
-            "b.barracudacentral.org",
-            "ix.dnsbl.manitu.net",
-            "psbl.surriel.com",
-            "ubl.unsubscore.com",
-            "cbl.abuseat.org",
-            "pbl.spamhaus.org",
-            "sbl.spamhaus.org",
-            "xbl.spamhaus.org",
-            "dnsbl-1.uceprotect.net",
-            "dnsbl-2.uceprotect.net", 
-            "dnsbl-3.uceprotect.net",
-            "bl.spamcannibal.org",
-            "dyna.spamrats.com",
-            "noptr.spamrats.com",
-            "spam.spamrats.com"
-        ]
+        dnsbl_servers_list = DEFAULT_DNSBL_SERVERS
     
     # Validate IP address format
-    if not ip_address or not re.match(r'^\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}$', ip_address):
+    if not ip_address or not IPV4_PATTERN.match(ip_address):
         return {
             "info": f"Invalid IP address format: {ip_address}",
             "checked_servers": [],
@@ -426,7 +497,7 @@ async def check_comprehensive_dnsbls(ip_address, dnsbl_servers_list=None):
                 # Use asyncio.to_thread to make DNS resolution async
                 await asyncio.wait_for(
                     asyncio.to_thread(socket.getaddrinfo, query_domain, None),
-                    timeout=5.0
+                    timeout=request_context.timeout_for(5.0)
                 )
                 return dnsbl_server, {
                     "status": "listed",
@@ -455,7 +526,7 @@ async def check_comprehensive_dnsbls(ip_address, dnsbl_servers_list=None):
     # Run all DNSBL checks concurrently
     try:
         tasks = [check_single_dnsbl(server) for server in dnsbl_servers_list]
-        dnsbl_results = await asyncio.gather(*tasks, return_exceptions=True)
+        dnsbl_results = await request_context.gather(*tasks, return_exceptions=True)
         
         # Process results
         for result in dnsbl_results:
@@ -507,18 +578,30 @@ async def check_comprehensive_dnsbls(ip_address, dnsbl_servers_list=None):
         }
 
 
-async def get_complete_ip_info(ip_address=None):
+def _complete_ip_cache_key(ip_address=None, detail="summary"):
+    # Lookups of the caller's own address (no IP given) differ per client; not cached
+    if not ip_address:
+        return None
+    return ip_info_cache._generate_key("complete_ip_full" if detail == "full" else "complete_ip", ip_address)
+
+
+def complete_ip_outcome(result):
+    """Outcome of get_complete_ip_info(), for its cache TTL."""
+    reputation = result.get("reputation", {})
+    if "error" in result or (isinstance(reputation, dict) and "error" in reputation):
+        return "error"
+    return "success"
+
+
+@cached(ip_info_cache, _complete_ip_cache_key, TtlPolicy(success=None, error=60, classify=complete_ip_outcome))
+async def get_complete_ip_info(ip_address=None, detail="summary"):
     """
     Get complete information about an IP address including basic info and reputation from multiple sources.
     Enhanced with external threat intelligence APIs.
+
+    Provider payloads are reduced to PROVIDER_PROJECTIONS unless detail="full". Results
+    are cached in ip_info_cache (failed lookups for a minute only).
     """
-    # Check cache first for complete IP info
-    cache_key = ip_info_cache._generate_key("complete_ip", ip_address or "client_ip")
-    cached_result = ip_info_cache.get(cache_key)
-    if cached_result:
-        logging.debug(f"Using cached complete IP info for {ip_address or 'client_ip'}")
-        return cached_result
-    
     # Get basic IP information
     ip_info = await get_ip_info(ip_address)
 
@@ -546,10 +629,10 @@ async def get_complete_ip_info(ip_address=None):
         # Create session for external API calls
         async with aiohttp.ClientSession() as session:
             # Run all reputation checks concurrently
-            results = await asyncio.gather(
+            results = await request_context.gather(
                 check_ip_reputation(actual_ip),  # Existing DNSBL checks
-                query_abuseipdb(session, actual_ip),  # AbuseIPDB
-                query_virustotal_ip(session, actual_ip),  # VirusTotal
+                query_abuseipdb(session, actual_ip, detail),  # AbuseIPDB
+                query_virustotal_ip(session, actual_ip, detail),  # VirusTotal
                 check_comprehensive_dnsbls(actual_ip),  # Enhanced DNSBL checking
                 return_exceptions=True
             )
@@ -819,6 +902,27 @@ BLACKLISTS = [
     # e.g., Spamhaus DBL, URIBL, ivm*, IMP*, Sender Score
 ]
 
+# Read-only registries derived from BLACKLISTS, built once at import instead of on every
+# check. With gunicorn's preload_app (see gunicorn_config.py and warmup.py) they are
+# built in the master process and shared copy-on-write by all workers.
+DOMAIN_BLACKLISTS = tuple(bl for bl in BLACKLISTS if bl["type"] == "domain")
+IP_BLACKLISTS = tuple(bl for bl in BLACKLISTS if bl["type"] == "ip")
+SERVICE_NAMES = {bl["service"]: bl["name"] for bl in BLACKLISTS}
+
+# Listing weights for calculate_reputation_score
+HIGH_IMPACT_BLACKLISTS = frozenset(["zen.spamhaus.org", "b.barracudacentral.org", "bl.spamcop.net", "psbl.surriel.com", "bl.mailspike.net"])
+MEDIUM_IMPACT_BLACKLISTS = frozenset(["combined.mail.abusix.zone", "spam.rbl.msrbl.net", "dnsbl-1.uceprotect.net", "multi.surbl.org", "dbl.nordspam.com"])
+
+# Blacklists known not to support IPv6 well or at all
+IPV6_UNSUPPORTED_BLACKLISTS = frozenset([
+    "bl.spamcop.net",
+    "psbl.surriel.com",
+    "dyna.spamrats.com",
+    "noptr.spamrats.com",
+    "spam.spamrats.com",
+    "ips.backscatterer.org",
+])
+
 async def check_domain_reputation(domain):
     """
     Check the reputation of a domain by checking various blacklists.
@@ -850,16 +954,17 @@ async def check_domain_reputation(domain):
             logging.warning(f"Could not resolve IPs for domain {domain}. Proceeding with domain checks only.")
             results["ip_lookup_error"] = "Could not resolve IP addresses for the domain."
 
-        # Create tasks for both domain and IP checks
-        domain_task = check_domain_blacklists(domain)
-        ip_task = check_ip_blacklists(ips) # Will handle empty list gracefully
+        # Create tasks for both domain and IP checks (registered with the request, so
+        # they are cancelled if the client goes away)
+        domain_task = request_context.create_task(check_domain_blacklists(domain))
+        ip_task = request_context.create_task(check_ip_blacklists(ips)) # Will handle empty list gracefully
 
-        # Run tasks with a timeout
+        # Run tasks with a timeout, never past the request's own deadline
         try:
             # Use gather to run concurrently
             gathered_results = await asyncio.wait_for(
                 asyncio.gather(domain_task, ip_task, return_exceptions=True),
-                timeout=45 # Increased timeout
+                timeout=request_context.timeout_for(45) # Increased timeout
             )
             domain_results = gathered_results[0] if not isinstance(gathered_results[0], Exception) else {"domain_services": {}, "error": str(gathered_results[0])}
             ip_results = gathered_results[1] if not isinstance(gathered_results[1], Exception) else {"ip_services": {}, "error": str(gathered_results[1])}
@@ -885,7 +990,7 @@ async def check_domain_reputation(domain):
 
         # Determine overall blacklist status and count
         blacklisted_services = []
-        service_name_map = {bl["service"]: bl["name"] for bl in BLACKLISTS} # Map for friendly names
+        service_name_map = SERVICE_NAMES # Map for friendly names
 
         # Check domain blacklists
         for service, status in results["domain_services"].items():
@@ -914,7 +1019,7 @@ async def check_domain_reputation(domain):
         results["recommendations"] = generate_domain_reputation_recommendations(results)
 
         # Add service names map for frontend use
-        results["service_names"] = service_name_map
+        results["service_names"] = dict(service_name_map)
 
 
         return results
@@ -931,9 +1036,9 @@ async def resolve_domain_to_ips(domain):
     Resolve a domain name to its IP addresses (A and AAAA).
     """
     ips = []
-    resolver = dns.asyncresolver.Resolver()
+    resolver = TtlReportingResolver()
     resolver.timeout = 5 # Set timeout for DNS resolution
-    resolver.lifetime = 5
+    resolver.lifetime = request_context.timeout_for(5)
 
     async def query(qtype):
         try:
@@ -950,7 +1055,7 @@ async def resolve_domain_to_ips(domain):
             return ["error"] # Indicate error
 
     # Run A and AAAA lookups concurrently
-    results = await asyncio.gather(query('A'), query('AAAA'))
+    results = await request_context.gather(query('A'), query('AAAA'))
 
     # Combine results, filtering out 'timeout' or 'error' indicators
     for ip_list in results:
@@ -975,7 +1080,7 @@ async def check_domain_blacklists(domain):
     Check if a domain is on any domain-based blacklists.
     """
     results = {"domain_services": {}}
-    domain_blacklists_meta = [bl for bl in BLACKLISTS if bl["type"] == "domain"]
+    domain_blacklists_meta = DOMAIN_BLACKLISTS
     tasks = []
 
     for blacklist in domain_blacklists_meta:
@@ -983,7 +1088,7 @@ async def check_domain_blacklists(domain):
         tasks.append(check_single_domain_blacklist(domain, service))
 
     # Run all tasks concurrently
-    service_results = await asyncio.gather(*tasks, return_exceptions=True)
+    service_results = await request_context.gather(*tasks, return_exceptions=True)
 
     # Process results
     for i, blacklist in enumerate(domain_blacklists_meta):
@@ -1002,9 +1107,9 @@ async def check_single_domain_blacklist(domain, service):
     try:
         logging.debug(f"Checking domain {domain} against {service}")
         lookup = f"{domain}.{service}"
-        resolver = dns.asyncresolver.Resolver()
+        resolver = TtlReportingResolver()
         resolver.timeout = 3.0 # Shorter timeout per service
-        resolver.lifetime = 3.0
+        resolver.lifetime = request_context.timeout_for(3.0)
 
         try:
             await resolver.resolve(lookup, 'A')
@@ -1036,14 +1141,14 @@ async def check_ip_blacklists(ips):
     # Process each IP
     for ip in ips:
         tasks = []
-        ip_blacklists_meta = [bl for bl in BLACKLISTS if bl["type"] == "ip"]
+        ip_blacklists_meta = IP_BLACKLISTS
 
         for blacklist in ip_blacklists_meta:
             service = blacklist["service"]
             tasks.append(check_single_ip_blacklist(ip, service))
 
         # Run all tasks for this IP concurrently
-        service_results = await asyncio.gather(*tasks, return_exceptions=True)
+        service_results = await request_context.gather(*tasks, return_exceptions=True)
 
         # Process results for this IP
         for i, blacklist in enumerate(ip_blacklists_meta):
@@ -1064,15 +1169,7 @@ async def check_single_ip_blacklist(ip, service):
         # Reverse the IP address for the lookup
         if ":" in ip:  # IPv6 - Basic check, full IPv6 reversal is complex
             # Skip blacklists known not to support IPv6 well or at all
-            ipv6_unsupported = [
-                "bl.spamcop.net",
-                 "psbl.surriel.com",
-                 "dyna.spamrats.com",
-                 "noptr.spamrats.com",
-                 "spam.spamrats.com",
-                 "ips.backscatterer.org"
-            ]
-            if service in ipv6_unsupported:
+            if service in IPV6_UNSUPPORTED_BLACKLISTS:
                 logging.debug(f"Skipping IPv6 check for {ip} on {service}")
                 return "unsupported_ipv6"
 
@@ -1096,9 +1193,9 @@ async def check_single_ip_blacklist(ip, service):
              return "ip_reversal_failed"
 
         lookup = f"{reversed_ip}.{service}"
-        resolver = dns.asyncresolver.Resolver()
+        resolver = TtlReportingResolver()
         resolver.timeout = 3.0 # Shorter timeout per service
-        resolver.lifetime = 3.0
+        resolver.lifetime = request_context.timeout_for(3.0)
 
         try:
             answers = await resolver.resolve(lookup, 'A')
@@ -1130,11 +1227,9 @@ def calculate_reputation_score(results):
     medium_impact_count = 0
     low_impact_count = 0
 
-    # Define blacklist impacts (example, adjust based on real-world impact)
-    high_impact = ["zen.spamhaus.org", "b.barracudacentral.org", "bl.spamcop.net", "psbl.surriel.com", "bl.mailspike.net"]
-    medium_impact = ["combined.mail.abusix.zone", "spam.rbl.msrbl.net", "dnsbl-1.uceprotect.net", "multi.surbl.org", "dbl.nordspam.com"]
-
-    service_name_map = {bl["service"]: bl["name"] for bl in BLACKLISTS}
+    # Blacklist impacts (example, adjust based on real-world impact)
+    high_impact = HIGH_IMPACT_BLACKLISTS
+    medium_impact = MEDIUM_IMPACT_BLACKLISTS
 
     # Check domain listings
     for service, status in results.get("domain_services", {}).items():
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+Per-request deadline and cancellation scope for async checks
+
+Each API request runs its async work inside a RequestContext (stored in a context
+variable, so every task created below it inherits it). Checkers use it to:
+
+- bound their own timeouts by the time left on the request (`timeout_for`), and
+- register the tasks they fan out (`create_task` / `gather`), so that when the request
+  is abandoned - the client disconnected, the deadline passed, or the handler failed -
+  every outstanding task is cancelled instead of running to completion, and
+- report how long the data they return stays valid (`limit_max_age`: DNS answer TTLs,
+  remaining cache TTLs), so the response can be sent with a matching Cache-Control
+  max-age. A scope nested in another passes its max_age on to the enclosing one.
+
+Cancelled tasks are counted per worker process; see `metrics()`.
+"""
+import asyncio
+import contextvars
+import logging
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Dict, List, Optional, Set
+
+
+class RequestContext:
+    """Deadline and set of outstanding tasks for one request."""
+
+    def __init__(self, timeout: Optional[float] = None, name: str = "request"):
+        self.name = name
+        self.deadline = None if timeout is None else time.monotonic() + timeout
+        self.cancel_reason: Optional[str] = None
+        self.cancelled_tasks = 0
+        # Smallest TTL of the data the response is built from (None: nothing reported)
+        self.max_age: Optional[float] = None
+        self._tasks: Set[asyncio.Future] = set()
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left until the deadline (never negative), or None without a deadline."""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def timeout_for(self, default: float) -> float:
+        """`default`, shortened to the time left on the request."""
+        remaining = self.remaining()
+        return default if remaining is None else min(default, remaining)
+
+    def limit_max_age(self, seconds: Optional[float]) -> None:
+        """Lower max_age to `seconds` (ignored if None)."""
+        if seconds is None:
+            return
+        seconds = max(0.0, seconds)
+        self.max_age = seconds if self.max_age is None else min(self.max_age, seconds)
+
+    def track(self, future: asyncio.Future) -> asyncio.Future:
+        """Register a task so it is cancelled if the request is abandoned."""
+        if not future.done():
+            self._tasks.add(future)
+            future.add_done_callback(self._task_done)
+        return future
+
+    def _task_done(self, future: asyncio.Future) -> None:
+        self._tasks.discard(future)
+        # Counted however the cancellation reached the task (directly from cancel(), or
+        # propagated from an awaiting parent or an expired timeout)
+        if future.cancelled():
+            self.cancelled_tasks += 1
+            _record("cancelled_tasks")
+
+    def cancel(self, reason: str) -> int:
+        """
+        Cancel every outstanding task of the request.
+
+        Args:
+            reason (str): Why the request was abandoned (for logs).
+
+        Returns:
+            int: The number of tasks that were still running.
+        """
+        self.cancel_reason = self.cancel_reason or reason
+        tasks, self._tasks = self._tasks, set()
+        cancelled = sum(1 for task in tasks if task.cancel())
+        if cancelled:
+            logging.info(f"Cancelling {cancelled} outstanding task(s) of {self.name} ({reason})")
+        return cancelled
+
+    async def wait(self, aw: Awaitable[Any]) -> Any:
+        """
+        Await `aw`, cancelling it and raising TimeoutError once the deadline passes.
+        """
+        remaining = self.remaining()
+        if remaining is None:
+            return await aw
+        try:
+            return await asyncio.wait_for(aw, remaining)
+        except asyncio.TimeoutError:
+            _record("deadline_exceeded")
+            self.cancel("deadline exceeded")
+            raise TimeoutError(f"{self.name} did not finish within its deadline") from None
+
+
+@asynccontextmanager
+async def scope(timeout: Optional[float] = None, name: str = "request",
+                context: Optional[RequestContext] = None) -> AsyncIterator[RequestContext]:
+    """
+    Make a new RequestContext current for the enclosed code.
+
+    On exit, tasks the request left running are cancelled. Leaving through
+    CancelledError (client gone, caller timed out) is recorded as a cancelled request.
+    Pass `context` to use a RequestContext created by the caller (e.g. to read its
+    max_age afterwards) instead of a new one.
+
+        async with request_context.scope(timeout=30, name="/api/overview") as context:
+            ...
+    """
+    parent = _current.get()
+    context = context or RequestContext(timeout, name)
+    token = _current.set(context)
+    try:
+        yield context
+    except asyncio.CancelledError:
+        _record("cancelled_requests")
+        context.cancel("request cancelled")
+        raise
+    finally:
+        context.cancel("request finished")
+        _current.reset(token)
+        if parent is not None:
+            parent.limit_max_age(context.max_age)
+
+
+_current: contextvars.ContextVar = contextvars.ContextVar("request_context", default=None)
+
+
+def current() -> Optional[RequestContext]:
+    """The RequestContext of the running request, if any."""
+    return _current.get()
+
+
+def timeout_for(default: float) -> float:
+    """`default`, shortened to the time left on the current request (if any)."""
+    context = _current.get()
+    return default if context is None else context.timeout_for(default)
+
+
+def limit_max_age(seconds: Optional[float]) -> None:
+    """Report that the current request's result is built from data valid for `seconds`."""
+    context = _current.get()
+    if context is not None:
+        context.limit_max_age(seconds)
+
+
+def create_task(aw: Awaitable[Any]) -> asyncio.Future:
+    """asyncio.ensure_future, registered with the current request for cancellation."""
+    task = asyncio.ensure_future(aw)
+    context = _current.get()
+    return context.track(task) if context is not None else task
+
+
+async def gather(*aws: Awaitable[Any], return_exceptions: bool = False) -> List[Any]:
+    """asyncio.gather whose tasks are registered with the current request."""
+    return await asyncio.gather(*(create_task(aw) for aw in aws), return_exceptions=return_exceptions)
+
+
+async def run(aw: Awaitable[Any], timeout: Optional[float] = None, name: str = "request",
+              context: Optional[RequestContext] = None) -> Any:
+    """
+    Run `aw` as a request: in its own scope and bounded by `timeout`.
+
+    Args:
+        aw: The coroutine to run.
+        timeout (float, optional): The request deadline in seconds.
+        name (str): Name used in logs.
+        context (RequestContext, optional): The context to run in (see scope()).
+
+    Returns:
+        The coroutine's result. Raises TimeoutError if the deadline passes.
+    """
+    async with scope(timeout, name, context) as context:
+        return await context.wait(aw)
+
+
+async def iterate(agen: AsyncIterator[Any], timeout: Optional[float] = None, name: str = "stream") -> AsyncIterator[Any]:
+    """
+    Consume an async generator as a request (see run()); for streaming responses.
+
+    The scope lives as long as the stream: closing or cancelling the stream (client
+    disconnected) cancels everything the generator left running.
+    """
+    async with scope(timeout, name):
+        try:
+            async for item in agen:
+                yield item
+        finally:
+            await agen.aclose()
+
+
+# --- Metrics (per worker process) ---
+_metrics_lock = threading.Lock()
+_metrics: Dict[str, int] = {
+    "cancelled_tasks": 0,      # tasks cancelled because their request was abandoned
+    "cancelled_requests": 0,   # requests cancelled before finishing (client gone, caller timeout)
+    "deadline_exceeded": 0,    # requests that ran past their deadline
+}
+
+
+def _record(name: str, amount: int = 1) -> None:
+    with _metrics_lock:
+        _metrics[name] += amount
+
+
+def metrics() -> Dict[str, int]:
+    """Cancellation counters of this worker process."""
+    with _metrics_lock:
+        return dict(_metrics)
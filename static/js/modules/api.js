@@ -4,6 +4,7 @@ import { validateDomain } from "../domainValidation.js";
 import {
   renderDetailedRecords,
   renderDetailedRecord,
+  renderDetailedRecordCard,
 } from "./recordDisplay.js";
 import { showToast } from "./toast.js";
 import { addToHistory } from "./history.js";
@@ -71,6 +72,30 @@ export async function checkRecord() {
     </div>
   `;
 
+  // Stream the overview so each section appears as soon as it is checked
+  if (recordType === "overview" && "EventSource" in window) {
+    try {
+      const data = await streamOverview(domain);
+
+      addToHistory(domain, recordType);
+      errorState.retryCount = 0;
+
+      overviewContainer.style.display = "block";
+      overviewContainer.classList.remove("hidden");
+      updateOverviewDashboard(data.records);
+      return;
+    } catch (error) {
+      if (error.error_code) {
+        // The server reported an error on the stream
+        resultBox.innerHTML = renderErrorMessage(error, "OVERVIEW");
+        return;
+      }
+      // The stream could not be opened (e.g. a proxy without SSE support, or a
+      // validation error response); fall back to the regular endpoint below
+      console.warn("Overview stream unavailable, falling back to /api/overview");
+    }
+  }
+
   try {
     // Fetch data from API
     const response = await fetch(url);
@@ -152,6 +177,61 @@ export async function checkRecord() {
   }
 }
 
+// Overview sections in the order the server reports them
+const OVERVIEW_SECTIONS = ["DMARC", "SPF", "DKIM", "DNS", "REPUTATION"];
+
+// Open /api/overview/stream and render each record card as its event arrives.
+// Resolves with the summary ({ records }) or rejects with the server's error payload
+// (or a plain Error if the stream could not be opened).
+function streamOverview(domain) {
+  return new Promise((resolve, reject) => {
+    const source = new EventSource(
+      `/api/overview/stream?domain=${encodeURIComponent(domain)}`
+    );
+    let opened = false;
+
+    resultBox.innerHTML = OVERVIEW_SECTIONS.map(
+      (title, index) => `
+      <div id="overview-section-${index}">
+        <div class="loading-container">
+          <div class="spinner"></div>
+          <div>Checking ${title} for ${domain}...</div>
+        </div>
+      </div>`
+    ).join("");
+
+    source.addEventListener("open", () => {
+      opened = true;
+    });
+
+    source.addEventListener("record", (event) => {
+      const { index, record } = JSON.parse(event.data);
+      const section = document.getElementById(`overview-section-${index}`);
+      if (section) {
+        section.innerHTML = renderDetailedRecordCard(record, index);
+      }
+    });
+
+    source.addEventListener("summary", (event) => {
+      source.close();
+      resolve(JSON.parse(event.data));
+    });
+
+    source.addEventListener("failure", (event) => {
+      source.close();
+      reject(JSON.parse(event.data));
+    });
+
+    // Connection errors (EventSource would otherwise keep reconnecting)
+    source.addEventListener("error", () => {
+      source.close();
+      reject(
+        new Error(opened ? "Overview stream interrupted" : "Overview stream failed")
+      );
+    });
+  });
+}
+
 // Render error message
 export function renderErrorMessage(error, recordType = null) {
   // Extract error details
@@ -48,7 +48,12 @@ export function renderDetailedRecordCard(record, index) {
   // Determine the correct status for the record
   let statusClass, statusText, statusIcon;
 
-  if (record.title === "DKIM") {
+  if (record.status === "timeout") {
+    // The check missed the overview deadline; it can be retried on its own
+    statusClass = "status-warning";
+    statusText = "Timed out";
+    statusIcon = "clock";
+  } else if (record.title === "DKIM") {
     // For DKIM, check if any selectors were found successfully
     const foundSelectors = [];
     const notFoundSelectors = [];
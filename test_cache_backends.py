@@ -0,0 +1,398 @@
+#!/usr/bin/env python3
+"""
+Tests for SimpleCache and its storage backends
+"""
+import asyncio
+import glob
+import json
+import os
+import tempfile
+import threading
+import time
+
+import cache_codec
+import cache_snapshot
+from cache import SimpleCache, TtlPolicy, cached, registered_caches
+from cache_backends import MmapBackend, RedisBackend, SqliteBackend
+from redis_standin import RedisStandin
+
+
+def _sqlite_cache(default_ttl=60, namespace="test"):
+    path = os.path.join(tempfile.mkdtemp(), "cache.sqlite3")
+    return SimpleCache(default_ttl=default_ttl, backend=SqliteBackend(path, namespace)), path
+
+
+def test_sqlite_backend_roundtrip_and_ttl():
+    cache, _ = _sqlite_cache()
+    cache.set("virustotal:abc", {"data": {"reputation": 0}, "source": "VirusTotal"})
+    cache.set("abuseipdb:abc", {"error": "boom"}, ttl=0.05)
+
+    assert cache.get("virustotal:abc") == {"data": {"reputation": 0}, "source": "VirusTotal"}
+    time.sleep(0.1)
+    assert cache.get("abuseipdb:abc") is None
+
+    stats = cache.get_stats()
+    assert stats["total_items"] == 2
+    assert stats["expired_items"] == 1
+
+    cache.clear_expired()
+    assert cache.get_stats()["total_items"] == 1
+
+
+def test_sqlite_backend_shared_between_instances():
+    first, path = _sqlite_cache()
+    first.set("complete_ip:1", {"ip": "1.1.1.1"})
+
+    # A second cache on the same file (another worker, or after a restart) sees the entry
+    second = SimpleCache(default_ttl=60, backend=SqliteBackend(path, "test"))
+    assert second.get("complete_ip:1") == {"ip": "1.1.1.1"}
+
+    # Namespaces keep caches sharing one file apart
+    other = SimpleCache(default_ttl=60, backend=SqliteBackend(path, "other"))
+    assert other.get("complete_ip:1") is None
+
+    second.clear_all()
+    assert first.get("complete_ip:1") is None
+
+
+def test_sqlite_add_claims_a_key_once_across_instances():
+    first, path = _sqlite_cache()
+    second = SimpleCache(default_ttl=60, backend=SqliteBackend(path, "test"))
+    assert first.add("pending:abc", "job-1", ttl=0.1)
+    assert not second.add("pending:abc", "job-2")
+    assert second.get("pending:abc") == "job-1"
+    time.sleep(0.15)
+    assert second.add("pending:abc", "job-2")  # an expired claim can be taken over
+    assert first.get("pending:abc") == "job-2"
+    assert not first.set("odd", {1, 2})  # not JSON-serializable: refused
+
+
+def test_sqlite_errors_do_not_escape_stats_and_cleanup():
+    cache, _ = _sqlite_cache()
+    cache.set("complete_ip:1", {"ip": "1.1.1.1"})
+    # E.g. "database is locked" past busy_timeout, with several workers on one file
+    cache.backend._connection().close()
+
+    stats = cache.get_stats()
+    assert stats["backend"] == "sqlite" and "error" in stats and stats["sets"] == 1
+    assert cache.backend.clear_expired(time.time()) == 0
+    cache.clear_all()
+
+
+def test_mmap_backend_shared_between_instances():
+    path = os.path.join(tempfile.mkdtemp(), "ip_info.mmap")
+    first = SimpleCache(default_ttl=60, backend=MmapBackend(path, slots=16, slot_size=256))
+    first.set("complete_ip:1", {"ip": "1.1.1.1"})
+    first.set("complete_ip:2", {"ip": "2.2.2.2"}, ttl=0.05)
+    first.set("complete_ip:big", "x" * 1000)  # larger than a slot, not stored
+
+    second = SimpleCache(default_ttl=60, backend=MmapBackend(path, slots=16, slot_size=256))
+    assert second.get("complete_ip:1") == {"ip": "1.1.1.1"}
+    assert second.get("complete_ip:big") is None
+    time.sleep(0.1)
+    assert second.get("complete_ip:2") is None
+
+    # Full probe sequences overwrite the entry expiring soonest
+    for i in range(100):
+        second.set(f"filler:{i}", i, ttl=1000 + i)
+    assert second.get("filler:99") == 99
+    assert first.get_stats()["total_items"] <= 16
+
+    first.delete("filler:99")
+    assert second.get("filler:99") is None
+
+
+def test_memory_cache_evicts_least_recently_used():
+    cache = SimpleCache(default_ttl=60, max_entries=2, max_bytes=100)
+    cache.set("a", "x" * 10)
+    cache.set("b", "y" * 10)
+    assert cache.get("a") == "x" * 10  # "b" is now least recently used
+
+    cache.set("c", "z" * 10)
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+
+    # Byte bound: a large item pushes out older ones, an oversized one is not stored
+    cache.set("d", "w" * 90)
+    cache.set("e", "v" * 200)
+    stats = cache.get_stats()
+    assert cache.get("e") is None
+    assert stats["total_items"] == 1
+    assert stats["memory_usage_estimate"] == len('"' + "w" * 90 + '"')
+    assert stats["evictions"] == 3
+    assert stats["oversized_items"] == 1
+
+
+def test_memory_cache_expiry_sweep_and_counters():
+    cache = SimpleCache(default_ttl=60, resolution=0.05)
+    cache.set("short", {"ip": "1.1.1.1"}, ttl=0.05)
+    cache.set("long", {"ip": "8.8.8.8"})
+    assert cache.get("long") == {"ip": "8.8.8.8"}
+    assert cache.get("missing") is None
+
+    time.sleep(0.15)
+    cache.clear_expired()
+    stats = cache.get_stats()
+    assert stats["total_items"] == 1
+    assert stats["expirations"] == 1
+    assert stats["memory_usage_estimate"] == len('{"ip":"8.8.8.8"}')
+    assert (stats["hits"], stats["misses"]) == (1, 1)
+
+
+def test_cache_codec_roundtrip():
+    value = {"ip": "1.1.1.1", "score": -3, "big": 2 ** 70, "ratio": 0.25, "ok": True,
+             "none": None, "tags": ["a", "ü"], "nested": {"n": [1, {"x": False}]}}
+    entry = {"data": value, "expires": 1700000000.5, "created": 1699999000.25, "fresh_until": 1699999900.0}
+    encoded = cache_codec.encode_entry(entry)
+    assert cache_codec.decode_entry(encoded) == entry
+    assert len(encoded) < len(json.dumps(entry, separators=(",", ":")))
+    assert cache_codec.decode(cache_codec.encode(b"\x00\xff")) == b"\x00\xff"
+    try:
+        cache_codec.decode(cache_codec.encode(value)[:-1])
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("truncated value decoded")
+
+
+def test_compact_values_are_packed_and_compressed():
+    attributes = {"last_analysis_results": {f"engine{i}": {"category": "harmless", "result": "clean"} for i in range(80)}}
+    packed = cache_codec.pack(attributes, compress_threshold=1024)
+    assert cache_codec.unpack(packed) == attributes
+    assert len(packed) < len(cache_codec.pack(attributes, compress_threshold=None)) // 4
+    assert cache_codec.pack({"score": 1}, compress_threshold=1024)[0] == 0  # small values stay uncompressed
+
+    cache = SimpleCache(default_ttl=60, compact=True)
+    cache.set("virustotal:1", attributes)
+    cache.set("pair", (1, 2))
+    cache.set("odd", {1, 2})  # not encodable: kept as is
+    assert cache.get("virustotal:1") == attributes
+    assert cache.get("virustotal:1") is not cache.get("virustotal:1")
+    assert cache.get("pair") == [1, 2] and cache.get("odd") == {1, 2}
+    assert cache.cache["virustotal:1"]["size"] == len(packed)
+    assert cache.get_stats()["memory_usage_estimate"] < len(json.dumps(attributes)) // 4
+
+
+def test_redis_backend_shared_between_nodes():
+    server = RedisStandin(port=0).start()
+    try:
+        # Two app nodes; node_b has no near-cache so it always asks the server
+        node_a = SimpleCache(default_ttl=60, backend=RedisBackend(server.url, "ip_info", near_ttl=30))
+        node_b = SimpleCache(default_ttl=60, backend=RedisBackend(server.url, "ip_info", near_ttl=0))
+        other = SimpleCache(default_ttl=60, backend=RedisBackend(server.url, "reputation"))
+
+        node_a.set("complete_ip:1", {"ip": "1.1.1.1", "score": 0})
+        node_a.set("complete_ip:2", {"ip": "2.2.2.2"}, ttl=0.05)
+        assert node_b.get("complete_ip:1") == {"ip": "1.1.1.1", "score": 0}
+        assert other.get("complete_ip:1") is None
+        time.sleep(0.1)
+        assert node_b.get("complete_ip:2") is None
+
+        # Pipelined batch operations
+        node_b.set_many({f"k:{i}": i for i in range(50)})
+        commands = server.commands
+        assert node_a.get_many([f"k:{i}" for i in range(60)]) == {f"k:{i}": i for i in range(50)}
+        assert server.commands == commands + 1
+
+        # Served from node_a's near-cache without a round trip
+        commands = server.commands
+        assert node_a.get("k:7") == 7
+        assert server.commands == commands
+        assert node_a.get_stats()["total_items"] == 51
+
+        node_b.clear_all()
+        assert node_b.get("complete_ip:1") is None
+        assert other.get_stats()["total_items"] == 0
+    finally:
+        server.stop()
+
+    # An unreachable server is a miss, not an error
+    assert node_b.get("complete_ip:1") is None
+    node_b.set("complete_ip:1", {"ip": "1.1.1.1"})
+
+
+def test_get_or_compute_single_flight_and_ttl_policy():
+    cache = SimpleCache(default_ttl=60)
+    calls = []
+    policy = TtlPolicy(not_found=0.05, rate_limited=0,
+                       classify=lambda result: result.get("outcome", "success"))
+
+    @cached(cache, lambda ip: f"ip:{ip}" if ip else None, policy)
+    async def lookup(ip):
+        calls.append(ip)
+        await asyncio.sleep(0.05)
+        return {"ip": ip, "outcome": {"8.8.8.8": "not_found", "9.9.9.9": "rate_limited"}.get(ip, "success")}
+
+    async def scenario():
+        # Concurrent misses on one key compute it once
+        results = await asyncio.gather(*(lookup("1.1.1.1") for _ in range(5)))
+        assert all(result["ip"] == "1.1.1.1" for result in results)
+        assert calls == ["1.1.1.1"]
+        await lookup("1.1.1.1")
+        assert calls == ["1.1.1.1"]
+
+        await lookup("8.8.8.8")
+        await lookup("9.9.9.9")
+        await lookup("9.9.9.9")  # rate-limited results are not cached
+        assert calls.count("9.9.9.9") == 2
+        await asyncio.sleep(0.1)
+        await lookup("8.8.8.8")  # short TTL for not-found results
+        assert calls.count("8.8.8.8") == 2
+
+        await lookup(None)  # no key: not cached
+        await lookup(None)
+        assert calls.count(None) == 2
+
+    asyncio.run(scenario())
+    stats = cache.get_stats()
+    assert (stats["computations"], stats["coalesced"]) == (5, 4)
+
+
+def test_get_or_compute_serves_stale_while_refreshing():
+    cache = SimpleCache(default_ttl=0.3, stale_ttl=60)
+    calls = []
+
+    async def compute():
+        calls.append(len(calls))
+        await asyncio.sleep(0.05)
+        return {"version": len(calls)}
+
+    async def scenario():
+        assert await cache.get_or_compute("ip:1", compute) == {"version": 1}
+        await asyncio.sleep(0.35)
+        assert cache.get("ip:1") is None  # stale: plain get() misses
+
+        # Served stale at once, with one background refresh for concurrent callers
+        results = await asyncio.gather(*(cache.get_or_compute("ip:1", compute) for _ in range(3)))
+        assert results == [{"version": 1}] * 3
+        await asyncio.sleep(0.1)
+        assert len(calls) == 2
+        assert await cache.get_or_compute("ip:1", compute) == {"version": 2}
+
+    asyncio.run(scenario())
+    stats = cache.get_stats()
+    assert (stats["stale_served"], stats["refreshes"], stats["computations"]) == (3, 1, 2)
+
+
+def test_stats_per_key_prefix():
+    cache = SimpleCache(default_ttl=60, max_entries=2, name="test_prefixes")
+    assert registered_caches()["test_prefixes"] is cache
+    cache.set("abuseipdb:1", {"score": 0})
+    cache.set("abuseipdb:2", {"score": 100, "reports": ["x" * 20]})
+    cache.set("complete_ip:1", {"ip": "1"})  # evicts abuseipdb:1
+    cache.get("abuseipdb:1")
+    cache.get("abuseipdb:2")
+    cache.get("complete_ip:1")
+    cache.get("complete_ip:1")
+    cache.get("unprefixed")
+
+    prefixes = cache.prefix_stats()
+    abuse, complete = prefixes["abuseipdb"], prefixes["complete_ip"]
+    assert (abuse["hits"], abuse["misses"], abuse["sets"], abuse["evictions"]) == (1, 1, 2, 1)
+    assert (complete["hits"], complete["misses"], complete["hit_rate"]) == (2, 0, 1.0)
+    assert abuse["avg_value_bytes"] == round((len('{"score":0}') + len('{"score":100,"reports":["' + "x" * 20 + '"]}')) / 2)
+    assert prefixes["(none)"]["misses"] == 1
+    assert cache.get_stats()["sets"] == 3
+
+    # Expired on read, before the sweeper reached it
+    cache.set("complete_ip:2", {"ip": "2"}, ttl=0.01)
+    time.sleep(0.02)
+    cache.get("complete_ip:2")
+    assert cache.prefix_stats()["complete_ip"]["expirations"] == cache.get_stats()["expirations"] == 1
+
+
+def test_cache_wide_counters_match_prefix_counters_under_threads():
+    cache = SimpleCache(default_ttl=60)
+    cache.set("ip:hit", 1)
+
+    def lookups():
+        for _ in range(2000):
+            cache.get("ip:hit")
+            cache.get("ip:miss")
+
+    threads = [threading.Thread(target=lookups) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    stats, prefix = cache.get_stats(), cache.prefix_stats()["ip"]
+    assert stats["hits"] == prefix["hits"] == 8 * 2000
+    assert stats["misses"] == prefix["misses"] == 8 * 2000
+
+
+def test_snapshot_restores_unexpired_entries():
+    directory = tempfile.mkdtemp()
+    before = SimpleCache(default_ttl=60, stale_ttl=60, compact=True, name="test_snapshot")
+    before.set("virustotal:1", {"reputation": 5, "tags": ["a"]})
+    before.set("abuseipdb:1", {"score": 0}, ttl=0.1, stale_ttl=0)
+    before.set("odd", {1, 2})  # not encodable: left out
+    snapshotter = cache_snapshot.Snapshotter(directory)
+    assert snapshotter.save() >= 2
+    path = os.path.join(directory, f"test_snapshot-{os.getpid()}.snapshot")
+    assert os.path.exists(path) and not os.path.exists(path + ".tmp")
+    time.sleep(0.15)  # abuseipdb:1 expires while "down"
+
+    after = SimpleCache(default_ttl=60, name="test_snapshot")  # replaces `before` in the registry
+    assert snapshotter.restore() >= 1
+    assert after.get("virustotal:1") == {"reputation": 5, "tags": ["a"]}
+    assert after.get("abuseipdb:1") is None and after.get("odd") is None
+    _, item = after.items()[0]
+    assert item["expires"] == before.cache["virustotal:1"]["expires"]
+
+    # A file whose entries all expired is deleted instead of loaded
+    short = SimpleCache(default_ttl=0.05, name="test_snapshot_short")
+    short.set("k", 1)
+    snapshotter.save()
+    time.sleep(0.1)
+    snapshotter.restore()
+    assert not glob.glob(os.path.join(directory, "test_snapshot_short-*"))
+
+    # Another worker deleting a file mid-restore is not an error
+    real_remove = os.remove
+    cache_snapshot.os.remove = lambda path: (real_remove(path), real_remove(path))
+    try:
+        short.set("k", 1)
+        snapshotter.save()
+        time.sleep(0.1)
+        snapshotter.restore()
+    finally:
+        cache_snapshot.os.remove = real_remove
+
+
+def test_expiry_sweeper_runs_in_forked_children():
+    if not hasattr(os, "fork"):
+        return
+    cache = SimpleCache(default_ttl=0.05)
+    cache.set("ip:1", {"score": 1})  # filled before the fork, like a restored snapshot
+    pid = os.fork()
+    if pid == 0:
+        try:
+            # The child never writes to the cache; the sweeper must run anyway
+            swept = any(t.name == "cache-expiry-sweeper" for t in threading.enumerate())
+            time.sleep(2.5 * cache.resolution)
+            swept = swept and not cache.cache and cache.total_bytes == 0
+        finally:
+            os._exit(0 if swept else 1)
+    _, status = os.waitpid(pid, 0)
+    assert status == 0
+
+
+if __name__ == "__main__":
+    test_sqlite_backend_roundtrip_and_ttl()
+    test_sqlite_backend_shared_between_instances()
+    test_sqlite_add_claims_a_key_once_across_instances()
+    test_sqlite_errors_do_not_escape_stats_and_cleanup()
+    test_mmap_backend_shared_between_instances()
+    test_memory_cache_evicts_least_recently_used()
+    test_memory_cache_expiry_sweep_and_counters()
+    test_cache_codec_roundtrip()
+    test_compact_values_are_packed_and_compressed()
+    test_redis_backend_shared_between_nodes()
+    test_get_or_compute_single_flight_and_ttl_policy()
+    test_get_or_compute_serves_stale_while_refreshing()
+    test_stats_per_key_prefix()
+    test_cache_wide_counters_match_prefix_counters_under_threads()
+    test_snapshot_restores_unexpired_entries()
+    test_expiry_sweeper_runs_in_forked_children()
+    print("✅ Cache backend tests passed")
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Tests for HTTP validators and the max-age reported by request scopes
+"""
+import asyncio
+
+import http_caching
+import request_context
+from cache import SimpleCache
+from coalescing import coalesced
+
+
+def test_max_age_follows_smallest_ttl():
+    cache = SimpleCache(default_ttl=120)
+    cache.set("dns:example.com", {"txt": "v=spf1 -all"}, ttl=30)
+
+    @coalesced("/api/test", lambda domain: domain)
+    async def payload(domain):
+        request_context.limit_max_age(3600)  # e.g. a DNS answer TTL
+        cache.get(f"dns:{domain}")
+        await cache.get_or_compute("other", lambda: asyncio.sleep(0, {"ok": True}))
+        return {"domain": domain}, 200
+
+    async def scenario():
+        context = request_context.RequestContext(10, "test")
+        await request_context.run(payload("example.com"), context=context)
+        return context.max_age
+
+    max_age = asyncio.run(scenario())
+    assert 29 < max_age <= 30
+
+
+def test_conditional_requests():
+    key = ("/api/test", "example.com")
+    body = b'{"domain":"example.com"}\n'
+
+    status, headers = http_caching.finish(key, body, 200, 60, None, None)
+    assert status == 200
+    assert headers["Cache-Control"] == "public, max-age=60"
+    etag = headers["ETag"]
+    assert etag == http_caching.etag_for(body)
+
+    # Remembered validators answer before anything is computed
+    assert http_caching.not_modified(key, etag, None)["ETag"] == etag
+    assert http_caching.not_modified(key, f'W/"other", {etag}', None) is not None
+    assert http_caching.not_modified(key, '"other"', None) is None
+    assert http_caching.not_modified(key, None, headers["Last-Modified"]) is not None
+    assert http_caching.not_modified(("/api/test", "other.com"), etag, None) is None
+
+    # Recomputed with the same content: still a 304; changed content: 200 with a new ETag
+    assert http_caching.finish(key, body, 200, 60, etag, None)[0] == 304
+    status, changed = http_caching.finish(key, b"{}\n", 200, 60, etag, None)
+    assert status == 200 and changed["ETag"] != etag
+
+    # Errors are not cached; max-age is capped
+    assert http_caching.finish(key, body, 500, 60, etag, None) == (500, {"Cache-Control": "no-cache"})
+    _, capped = http_caching.finish(key, body, 200, 10 ** 6, None, None, private=True)
+    assert capped["Cache-Control"] == f"private, max-age={http_caching.HTTP_CACHE_MAX_AGE}"
+
+
+if __name__ == "__main__":
+    test_max_age_follows_smallest_ttl()
+    test_conditional_requests()
+    print("✅ HTTP caching tests passed")
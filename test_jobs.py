@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Tests for background jobs: cross-worker deduplication and unstorable results
+"""
+import asyncio
+import os
+import tempfile
+import time
+
+from cache import SimpleCache
+from cache_backends import SqliteBackend
+from jobs import JobQueue
+
+
+def _queues_sharing_a_store(count=2):
+    path = os.path.join(tempfile.mkdtemp(), "jobs.sqlite3")
+    # Separate caches on one file, like the job stores of two workers on a host
+    return [JobQueue(SimpleCache(default_ttl=60, backend=SqliteBackend(path, "jobs"))) for _ in range(count)]
+
+
+def _wait_finished(queue, job_id, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = queue.get(job_id)
+        if job is not None and job["status"] in ("completed", "failed"):
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f"job {job_id} did not finish")
+
+
+def test_identical_jobs_are_deduplicated_across_workers():
+    first, second = _queues_sharing_a_store()
+
+    async def slow_check(params):
+        await asyncio.sleep(0.2)
+        return {"domain": params["domain"]}
+
+    for queue in (first, second):
+        queue.register("reputation", slow_check)
+
+    job, created = first.submit("reputation", {"domain": "example.com"})
+    duplicate, duplicate_created = second.submit("reputation", {"domain": "example.com"})
+    assert created and not duplicate_created
+    assert duplicate["job_id"] == job["job_id"]
+    assert _wait_finished(second, job["job_id"])["result"] == {"domain": "example.com"}
+
+    # Once finished, the same parameters start a new job
+    _, created_again = second.submit("reputation", {"domain": "example.com"})
+    assert created_again
+
+
+def test_stale_claims_are_replaced_and_other_claims_are_kept():
+    first, second = _queues_sharing_a_store()
+
+    async def slow_check(params):
+        await asyncio.sleep(0.2)
+        return {"domain": params["domain"]}
+
+    for queue in (first, second):
+        queue.register("reputation", slow_check)
+    dedupe_key = first._dedupe_key("reputation", {"domain": "example.com"})
+
+    # A claim left behind by a worker that died mid-job
+    first.store.add(dedupe_key, "vanished-job-0001", ttl=60)
+    job, created = first.submit("reputation", {"domain": "example.com"})
+    assert created and first.store.get(dedupe_key) == job["job_id"]
+
+    # If the claim changed hands meanwhile, the finished job leaves it alone
+    second.store.set(dedupe_key, "other-job-00001", ttl=60)
+    _wait_finished(first, job["job_id"])
+    time.sleep(0.05)
+    assert second.store.get(dedupe_key) == "other-job-00001"
+    assert not second.store.delete_if(dedupe_key, job["job_id"])
+    assert second.store.delete_if(dedupe_key, "other-job-00001")
+    assert second.store.get(dedupe_key) is None
+
+
+def test_unstorable_result_fails_the_job():
+    queue, = _queues_sharing_a_store(1)
+
+    async def odd_check(params):
+        return {"tags": {"not", "json"}}
+
+    queue.register("odd", odd_check)
+    job, _ = queue.submit("odd", {})
+    finished = _wait_finished(queue, job["job_id"])
+    assert finished["status"] == "failed"
+    assert finished["error"]["error_code"] == "JOB_RESULT_NOT_STORABLE"
+    assert "result" not in finished
+
+
+if __name__ == "__main__":
+    test_identical_jobs_are_deduplicated_across_workers()
+    test_stale_claims_are_replaced_and_other_claims_are_kept()
+    test_unstorable_result_fails_the_job()
+    print("✅ Job tests passed")
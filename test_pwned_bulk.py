@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Tests for bulk breach checks: persistence, resume, streaming cursors and pacing
+"""
+import asyncio
+import tempfile
+import time
+
+import pwned_checker
+from pwned_checker import BulkCheckManager, RatePacer
+
+
+def _manager_with_job(emails, status="queued"):
+    manager = BulkCheckManager(tempfile.mkdtemp(), requests_per_minute=6000)
+    meta = {"job_id": "job-00001", "status": status, "emails": emails, "total": len(emails),
+            "created": time.time(), "finished": None}
+    manager._write_meta(meta)
+    checked = []
+
+    async def check_one(email):
+        checked.append(email)
+        return {"status": "clean", "breaches": []}
+
+    manager._check_one = check_one
+    return manager, meta, checked
+
+
+def test_resume_after_crash_mid_append():
+    emails = ["a@example.com", "b@example.com", "c@example.com"]
+    manager, meta, checked = _manager_with_job(emails, status="running")
+    # A worker finished a@ and died while appending b@
+    with open(manager._results_path(meta["job_id"]), "w", encoding="utf-8") as f:
+        f.write('{"index": 0, "status": "clean", "breaches": []}\n{"index": 1, "sta')
+
+    asyncio.run(manager._process_job(meta))
+
+    assert checked == ["b@example.com", "c@example.com"]
+    status = manager.job_status(meta["job_id"])
+    assert status["status"] == "completed"
+    assert [r["index"] for r in status["results"]] == [0, 1, 2]
+    # Addresses are only kept while the job runs
+    assert "emails" not in manager.load_meta(meta["job_id"])
+    with open(manager._results_path(meta["job_id"]), encoding="utf-8") as f:
+        assert "@" not in f.read()
+
+
+def test_stream_resumes_from_last_event_id():
+    manager, meta, _ = _manager_with_job(["a@example.com", "b@example.com"])
+    manager._append_result(meta["job_id"], {"index": 0, "status": "clean"})
+
+    # The job is still queued: the window ends after the result seen so far
+    first = list(manager.iter_events(meta["job_id"], window=0))
+    assert [(event, data["index"]) for event, data, _ in first] == [("result", 0)]
+    cursor = pwned_checker.parse_stream_cursor(first[-1][2])
+
+    manager._append_result(meta["job_id"], {"index": 1, "status": "clean"})
+    meta["status"] = "completed"
+    manager._write_meta(meta)
+
+    async def collect():
+        return [item async for item in manager.aiter_events(meta["job_id"], cursor, window=0)]
+
+    second = asyncio.run(collect())
+    assert [event for event, _, _ in second] == ["result", "done"]
+    assert second[0][1]["index"] == 1
+    assert pwned_checker.parse_stream_cursor("bogus") == 0
+
+
+def test_revoked_key_fails_the_job_without_checking_the_rest(monkeypatch):
+    emails = ["a@example.com", "b@example.com", "c@example.com"]
+    manager, meta, _ = _manager_with_job(emails)
+    del manager._check_one  # use the real per-address check
+    calls = []
+
+    async def unauthorized(email, pacer=None):
+        calls.append(email)
+        return {"error": "API key is invalid or unauthorized.", "error_code": "HIBP_UNAUTHORIZED"}, 401
+
+    monkeypatch.setattr(pwned_checker, "check_email", unauthorized)
+    asyncio.run(manager._process_job(meta))
+
+    assert calls == ["a@example.com"]
+    status = manager.job_status(meta["job_id"])
+    assert status["status"] == "failed" and status["finished"]
+    assert status["error"]["error_code"] == "HIBP_UNAUTHORIZED"
+    events = list(manager.iter_events(meta["job_id"], window=0))
+    assert events[-1][0] == "done" and events[-1][1]["status"] == "failed"
+
+
+def test_job_that_keeps_raising_is_marked_failed():
+    manager, meta, _ = _manager_with_job(["a@example.com"])
+    errors = {}
+    for _ in range(pwned_checker.BULK_MAX_JOB_ERRORS - 1):
+        manager._record_job_error(meta, errors)
+    assert manager.load_meta(meta["job_id"])["status"] == "queued"
+
+    manager._record_job_error(meta, errors)
+    failed = manager.load_meta(meta["job_id"])
+    assert failed["status"] == "failed" and failed["error"]["error_code"] == "BULK_JOB_ERROR"
+    assert errors == {}
+
+
+def test_default_cache_salt_is_stable_for_an_api_key(monkeypatch):
+    monkeypatch.setattr(pwned_checker, "HIBP_API_KEY", "key-1")
+    salt = pwned_checker._default_cache_salt()
+    assert pwned_checker._default_cache_salt() == salt  # same in every worker and after restarts
+    monkeypatch.setattr(pwned_checker, "HIBP_API_KEY", "key-2")
+    assert pwned_checker._default_cache_salt() != salt
+
+
+def test_bulk_worker_thread_refreshes_a_stale_catalog(monkeypatch):
+    manager = BulkCheckManager(tempfile.mkdtemp())
+    refreshes = []
+
+    async def refresh():
+        refreshes.append(time.monotonic())
+        return True
+
+    monkeypatch.setattr(pwned_checker, "refresh_catalog", refresh)
+    monkeypatch.setattr(pwned_checker.catalog, "by_name", {})  # nothing loaded yet
+    manager._refresh_catalog_if_due()
+    manager._refresh_catalog_if_due()  # checked at most once a minute
+    assert len(refreshes) == 1
+
+
+def test_pacer_spaces_requests_and_emails_are_deduplicated():
+    pacer = RatePacer(requests_per_minute=600)  # one every 0.1s
+
+    async def three_calls():
+        started = time.monotonic()
+        for _ in range(3):
+            await pacer.acquire()
+        return time.monotonic() - started
+
+    assert asyncio.run(three_calls()) >= 0.19
+    valid, invalid = pwned_checker.normalize_email_list([" A@Example.com", "a@example.com", "nope", "b@example.com"])
+    assert valid == ["a@example.com", "b@example.com"] and invalid == ["nope"]
+
+
+if __name__ == "__main__":
+    test_resume_after_crash_mid_append()
+    test_stream_resumes_from_last_event_id()
+    test_job_that_keeps_raising_is_marked_failed()
+    test_pacer_spaces_requests_and_emails_are_deduplicated()
+    print("✅ Bulk breach check tests passed")
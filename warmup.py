@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Pre-fork warm-up and worker memory reporting
+
+With gunicorn's `preload_app` the application is imported once in the master process
+and the workers are forked from it, so module-level read-only state (the blacklist
+registries in reputation.py, provider tables, compiled patterns, the HIBP breach
+catalog) is built once and shared copy-on-write instead of being rebuilt by every
+worker. `warm_up()` runs in the master after the app is loaded (gunicorn's
+`when_ready` hook) to fill what is otherwise built lazily, then freezes the garbage
+collector so the collector's bookkeeping writes do not un-share those pages.
+
+`memory_usage()` reads the RSS/PSS split of a process from /proc (Linux only); the
+gunicorn hooks log it for every worker right after the fork and once it finished
+initializing.
+"""
+import asyncio
+import gc
+import logging
+from typing import Dict, Optional
+
+import aiohttp
+
+
+def _warm_breach_catalog() -> None:
+    """Download the HIBP breach catalog once for all workers (if the checker is enabled)."""
+    import pwned_checker
+
+    if not pwned_checker.HIBP_API_KEY:
+        return
+
+    async def refresh():
+        async with aiohttp.ClientSession() as session:
+            await pwned_checker.catalog.refresh(session)
+
+    # A throwaway loop: the workers start their own background loops after the fork
+    asyncio.run(refresh())
+
+
+def warm_up() -> None:
+    """
+    Build the shared read-only state in the current (master) process.
+
+    Importing the modules builds their registries and compiled patterns; the HIBP
+    catalog is downloaded here so workers start with it instead of each fetching it
+    on their first breach check. Failures are logged and never prevent startup.
+    """
+    import app  # noqa: F401 - already imported with preload_app; builds module-level state
+    import reputation
+
+    logging.info(
+        f"Warm-up: {len(reputation.DOMAIN_BLACKLISTS)} domain and {len(reputation.IP_BLACKLISTS)} "
+        f"IP blacklists registered"
+    )
+    try:
+        _warm_breach_catalog()
+    except Exception as e:
+        logging.warning(f"Warm-up: could not load the HIBP breach catalog: {e!r}")
+
+    # Move everything allocated so far into the permanent generation: collections in the
+    # workers no longer touch (and thereby copy) these objects' pages
+    gc.collect()
+    gc.freeze()
+    logging.info(f"Warm-up: froze {gc.get_freeze_count()} objects before forking workers")
+
+
+def memory_usage(pid: Optional[int] = None) -> Dict[str, int]:
+    """
+    Memory of a process in kB.
+
+    Args:
+        pid (int, optional): Process ID. Defaults to the current process.
+
+    Returns:
+        dict: rss, pss, shared and private kB (pss/shared/private need
+        /proc/<pid>/smaps_rollup), or an empty dict where /proc is unavailable.
+    """
+    proc = f"/proc/{pid or 'self'}"
+    usage: Dict[str, int] = {}
+    fields = {
+        "Rss": "rss",
+        "Pss": "pss",
+        "Shared_Clean": "shared",
+        "Shared_Dirty": "shared",
+        "Private_Clean": "private",
+        "Private_Dirty": "private",
+    }
+    try:
+        with open(f"{proc}/smaps_rollup", encoding="ascii") as f:
+            for line in f:
+                name, _, value = line.partition(":")
+                if name in fields:
+                    key = fields[name]
+                    usage[key] = usage.get(key, 0) + int(value.split()[0])
+        return usage
+    except (OSError, ValueError):
+        pass
+    try:
+        with open(f"{proc}/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    usage["rss"] = int(line.split()[1])
+    except (OSError, ValueError):
+        pass
+    return usage
+
+
+def format_memory(usage: Dict[str, int]) -> str:
+    """One-line summary of memory_usage() in MB."""
+    if not usage:
+        return "memory usage unavailable"
+    return ", ".join(f"{name.upper()} {kb / 1024:.1f} MB" for name, kb in usage.items())
+